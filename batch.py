@@ -0,0 +1,276 @@
+import math
+import numpy as np
+import castle_test as ct
+import sand_castle_shapes as shapes
+
+#Vectorized version of the erosion loop in castle_test.py
+#Holds a whole population of castles of one shape type as arrays and advances every
+# castle that is still standing by one wave hit per step.
+#The per-castle math is written in the same order as the scalar methods so the
+# wave_hits and failure causes come out the same as castle_test.simulate_castle
+
+'''
+CONSTANTS for use in the file
+'''
+#failure causes, same names as the stat dictionaries in castle_test.py
+EROSION = 0
+KNOCKOUT = 1
+RAIN = 2
+DID_NOT_FALL = 3
+STANDING = -1 #still being hit by waves
+CAUSE_NAMES = ct.outcomes.CAUSES
+
+PAD = 0.00001 #padding added to the eroding surface area so we don't divide by 0
+TAN_PAD = 0.000001 #padding added to tan(angle) in get_length_at_h/get_radius_at_h
+
+
+#Population of castles of a single shape type
+class CastleBatch:
+    shape_name: str
+    n: int
+    side_length: np.ndarray #cube/pyramid; 0 for round shapes
+    radius: np.ndarray #cylinder/cone; 0 for square shapes
+    height: np.ndarray
+    base_radius: np.ndarray
+    base_side_length: np.ndarray #cube/pyramid; 0 for round shapes
+    base_height: np.ndarray
+    saturation: np.ndarray
+    wave_height: np.ndarray
+    break_depth: np.ndarray
+    wave_speed: np.ndarray
+    wave_distance: np.ndarray
+    wave_hits: np.ndarray
+    cause: np.ndarray
+    constants: ct.Constants #the constants every castle of the batch is simulated with
+    #NOTE: the fields below never change during erosion, so they are worked out once
+    normal_force: np.ndarray #weight of the top of the castle on the eroding base
+    rain_per_hit: np.ndarray #saturation added by rain_on_shape every hit
+    adj: np.ndarray #pyramid: horizontal inset of the frustum; cone: same for the radius
+
+    #Constructor; dims and the wave arrays are one entry per castle
+    #dims is the side length for cubes, (side, height) for pyramids and (radius, height) for round shapes
+    #constants is a castle_test.Constants, the module constants by default
+    def __init__(self, shape_name: str, dims, wave_heights, break_depths, distances, constants = None):
+        if shape_name not in ct.shape_list:
+            raise ValueError("Unknown shape: " + str(shape_name))
+        self.shape_name = shape_name
+        #Build one scalar shape per castle so the fixed fields are computed by the
+        # exact same code as the scalar path
+        castles = list()
+        for dim in dims:
+            if shape_name == "cube":
+                castles.append(shapes.Cube(dim))
+            elif shape_name == "cylinder":
+                castles.append(shapes.Cylinder(dim[0], dim[1]))
+            elif shape_name == "pyramid":
+                castles.append(shapes.Pyramid(dim[0], dim[1]))
+            else:
+                castles.append(shapes.Cone(dim[0], dim[1]))
+        if constants is None:
+            constants = ct.current_constants()
+        waves = [constants.wave(h, d, dist) for (h, d, dist) in zip(wave_heights, break_depths, distances)]
+        self._load(castles, waves, constants)
+
+    #Builds a batch out of existing shape and Wave objects (all of the same type)
+    @classmethod
+    def from_castles(cls, castles, waves, constants = None):
+        batch = cls.__new__(cls)
+        if len(castles) > 0 and castles[0].string_name() not in ct.shape_list:
+            raise ValueError("Unknown shape: " + str(castles[0].string_name()))
+        batch.shape_name = castles[0].string_name() if len(castles) > 0 else "cube"
+        batch._load(castles, waves, ct.current_constants() if constants is None else constants)
+        return batch
+
+    #fills the arrays from shape and Wave objects
+    def _load(self, castles, waves, constants):
+        if len(castles) != len(waves):
+            raise ValueError("Need one wave per castle")
+        for castle in castles:
+            if castle.string_name() != self.shape_name:
+                raise ValueError("A batch only holds one shape type")
+        self.n = len(castles)
+        self.constants = constants
+        is_square = self.shape_name in ("cube", "pyramid")
+        self.height = np.array([c.height for c in castles], dtype=float)
+        self.side_length = np.array([c.side_length if is_square else 0.0 for c in castles], dtype=float)
+        self.radius = np.array([0.0 if is_square else c.radius for c in castles], dtype=float)
+        self.base_radius = np.array([c.base_radius for c in castles], dtype=float)
+        self.base_side_length = np.array([c.base_side_length if is_square else 0.0 for c in castles], dtype=float)
+        self.base_height = np.array([w.wave_height for w in waves], dtype=float)
+        self.wave_height = np.array([w.wave_height for w in waves], dtype=float)
+        self.break_depth = np.array([w.break_depth for w in waves], dtype=float)
+        self.wave_speed = np.array([w.wave_speed for w in waves], dtype=float)
+        self.wave_distance = np.array([w.wave_distance_past_castle for w in waves], dtype=float)
+        self.saturation = np.full(self.n, constants.initial_saturation)
+        self.wave_hits = np.zeros(self.n, dtype=np.int64)
+        self.cause = np.full(self.n, STANDING, dtype=np.int8)
+        (self.normal_force, self.rain_per_hit, self.adj) = fixed_fields(self.shape_name, castles,
+                                                                        [w.wave_height for w in waves], constants)
+
+    #returns the indices of castles that are still being hit by waves
+    def alive(self) -> np.ndarray:
+        return np.flatnonzero(self.cause == STANDING)
+
+    #returns the stat-dictionary style counts of how each castle ended up
+    def cause_counts(self) -> dict:
+        counts = dict()
+        for (code, name) in enumerate(CAUSE_NAMES):
+            counts[name] = int(np.count_nonzero(self.cause == code))
+        return counts
+
+    #returns the failure causes as names instead of codes
+    def cause_names(self) -> list:
+        return [CAUSE_NAMES[code] for code in self.cause.tolist()]
+
+    #adds how each castle ended up to an outcomes.OutcomeCounts
+    def add_to(self, counts):
+        for (name, n) in self.cause_counts().items():
+            counts.add(self.shape_name, name, n)
+
+
+#returns the (normal_force, rain_per_hit, adj) arrays of castles of one shape type hit at the
+# given wave heights, one height per castle
+#Fixed fields use the scalar methods, once per castle; they only depend on the wave height and
+# the uneroded shape, so the castles don't have to be fresh
+def fixed_fields(shape_name: str, castles, wave_heights, constants = None) -> tuple:
+    if constants is None:
+        constants = ct.current_constants()
+    normal = list()
+    rain = list()
+    adj = list()
+    for (c, h) in zip(castles, wave_heights):
+        c.set_base_height(h)
+        #same as get_normal_sand, with the constants' sand density and gravity
+        normal.append(c.get_top_vol() * constants.sand_density * constants.gravity)
+        rain.append(ct.rain_on_shape(c, constants))
+        if shape_name == "pyramid":
+            hyp = c.base_height / math.sin(c.angle)
+            adj.append(math.cos(c.angle) * hyp)
+        elif shape_name == "cone":
+            adj.append(c.base_height / (math.tan(c.angle) + TAN_PAD))
+        else:
+            adj.append(0.0)
+    return (np.array(normal, dtype=float), np.array(rain, dtype=float), np.array(adj, dtype=float))
+
+
+'''
+Geometry on arrays; idx picks which castles to work on
+'''
+#returns the eroding surface area (see get_eroding_surface_area in sand_castle_shapes.py)
+def eroding_surface_area(batch: CastleBatch, idx: np.ndarray) -> np.ndarray:
+    bh = batch.base_height[idx]
+    if batch.shape_name == "cube":
+        return bh * batch.base_side_length[idx] * 4 + PAD
+    elif batch.shape_name == "cylinder":
+        circumference = batch.base_radius[idx] * 2 * math.pi
+        return circumference * bh + PAD
+    elif batch.shape_name == "pyramid":
+        a = batch.base_side_length[idx]
+        b = a - 2*batch.adj[idx]
+        return 2 * (a + b) * np.sqrt(((a - b) / 2)**2 + bh**2) + PAD
+    r1 = batch.base_radius[idx]
+    r2 = r1 - batch.adj[idx]
+    return math.pi * (r1 + r2) * np.sqrt((r1 - r2)**2 + bh**2) + PAD
+
+#returns the cross-sectional area (see get_cross_sectional_area in sand_castle_shapes.py)
+def cross_sectional_area(batch: CastleBatch, idx: np.ndarray) -> np.ndarray:
+    if batch.shape_name == "cube":
+        a = batch.base_side_length[idx]
+        return a * a
+    elif batch.shape_name == "cylinder":
+        r = batch.base_radius[idx]
+        return math.pi * r * r
+    elif batch.shape_name == "pyramid":
+        b = batch.base_side_length[idx] - 2*batch.adj[idx]
+        return b * b
+    #NOTE: Cone.get_cross_sectional_area returns the radius at base_height, kept as-is
+    return batch.base_radius[idx] - batch.adj[idx]
+
+
+'''
+One wave hit for the whole population
+'''
+#returns the wave shear on each castle (wave_force_on_shape / cross-sectional area)
+def wave_shear(batch: CastleBatch, idx: np.ndarray, surface_area: np.ndarray, area: np.ndarray) -> np.ndarray:
+    v = batch.wave_speed[idx]
+    force = batch.constants.water_density * surface_area * v * v
+    return force / area
+
+#returns true where the castle survives the knockout check (standing_after_wave_hit)
+def standing_after_wave_hit(batch: CastleBatch, idx: np.ndarray, shear: np.ndarray, area: np.ndarray) -> np.ndarray:
+    max_shear_strength = ((batch.normal_force[idx] / area) * batch.constants.mu) + batch.constants.cohesion
+    return shear < max_shear_strength
+
+#returns true where the base can still hold up the castle (standing_after_erosion)
+def standing_after_erosion(batch: CastleBatch, idx: np.ndarray) -> np.ndarray:
+    c = batch.constants
+    r = batch.base_radius[idx]
+    G = c.alpha * r**(-1/3) * c.e**(2/3) * c.gamma**(1/3)
+    crit_height = (( (9 * c.j * c.j) / 16) \
+                  * ( (G * r * r) / (c.sand_density * c.gravity)))**(1/3)
+    if batch.shape_name == "cone" or batch.shape_name == "pyramid":
+        #Multiply by 3 since the volume of a cone/pyramid is 1/3 the volume of a cylinder/cube
+        crit_height = 3 * crit_height
+    return batch.height[idx] <= crit_height
+
+#Advances every castle that is still standing by one wave hit
+#idx picks the castles the wave reaches (default: all of them); the ones that already fell are skipped
+#returns how many castles took the hit (0 once every castle has fallen or survived)
+def step(batch: CastleBatch, max_wave_hits: int = None, idx: np.ndarray = None) -> int:
+    if max_wave_hits is None:
+        max_wave_hits = ct.MAX_WAVE_HITS
+    if idx is None:
+        idx = batch.alive()
+    else:
+        idx = idx[batch.cause[idx] == STANDING]
+    if len(idx) == 0:
+        return 0
+    #Same checks and order as the while loop in simulate_castle
+    gone = batch.base_radius[idx] <= 0
+    batch.cause[idx[gone]] = EROSION
+    idx = idx[~gone]
+    done = batch.wave_hits[idx] >= max_wave_hits
+    batch.cause[idx[done]] = DID_NOT_FALL
+    idx = idx[~done]
+    surface_area = eroding_surface_area(batch, idx)
+    area = cross_sectional_area(batch, idx)
+    shear = wave_shear(batch, idx, surface_area, area)
+    knocked = ~standing_after_wave_hit(batch, idx, shear, area)
+    batch.cause[idx[knocked]] = KNOCKOUT
+    idx, surface_area, shear = idx[~knocked], surface_area[~knocked], shear[~knocked]
+    collapsed = ~standing_after_erosion(batch, idx)
+    batch.cause[idx[collapsed]] = EROSION
+    idx, surface_area, shear = idx[~collapsed], surface_area[~collapsed], shear[~collapsed]
+    soaked = batch.saturation[idx] > batch.constants.oversaturated
+    batch.cause[idx[soaked]] = RAIN
+    idx, surface_area, shear = idx[~soaked], surface_area[~soaked], shear[~soaked]
+    #Rain, count the hit, then erode (rain_on_shape, wave_hits += 1, erode_shape)
+    batch.saturation[idx] = batch.saturation[idx] + batch.rain_per_hit[idx]
+    batch.wave_hits[idx] += 1
+    cohesion_multiplier = shear / batch.constants.cohesion
+    sand_removed = batch.wave_height[idx] * batch.wave_distance[idx] * cohesion_multiplier
+    layers = np.trunc(sand_removed / surface_area)
+    depth_eroded = layers * batch.constants.sand_diameter
+    batch.base_radius[idx] = batch.base_radius[idx] - depth_eroded
+    if batch.shape_name == "cube" or batch.shape_name == "pyramid":
+        batch.base_side_length[idx] = batch.base_side_length[idx] - 2 * depth_eroded
+    return len(idx)
+
+#Runs the batch until every castle has fallen or survived max_wave_hits
+#returns the wave_hits array (the batch keeps the failure causes)
+def run_batch(batch: CastleBatch, max_wave_hits: int = None) -> np.ndarray:
+    while step(batch, max_wave_hits) > 0:
+        pass
+    return batch.wave_hits
+
+#Runs the castle_test.py sweep for one shape as a single batch
+#returns the finished CastleBatch, in the same order as castle_test.sweep_points
+def sweep_batch(shape_name: str, max_wave_hits: int = None) -> CastleBatch:
+    castles = list()
+    waves = list()
+    for (i, h, d, dist) in ct.sweep_points(shape_name):
+        castles.append(ct.build_shape(shape_name, i))
+        waves.append(ct.build_wave(h, d, dist))
+    batch = CastleBatch.from_castles(castles, waves)
+    run_batch(batch, max_wave_hits)
+    return batch
@@ -0,0 +1,202 @@
+import gc
+import json
+import time
+import timeit
+import platform
+import tracemalloc
+import castle_test as ct
+import calculations as calc
+import outcomes
+
+#Benchmarks for the geometry, the erosion step and whole sweeps
+#Micro benchmarks time one call of a function over and over and report ns per call.
+#Macro benchmarks run the sweep for each shape at a few R/INC sizes and report castles/sec,
+# ns per wave hit and the peak memory traced while the sweep ran.
+#Results are plain dicts that save as JSON, and compare() flags anything that got slower (or
+# bigger) than a saved baseline by more than a threshold.
+
+'''
+CONSTANTS for use in the file
+'''
+GEOMETRY_METHODS = ["get_eroding_surface_area", "get_cross_sectional_area", "get_top_vol", "get_eroded_vol",
+                    "get_normal_sand", "get_base_grains"]
+MACRO_SIZES = [(11, 6), (21, 6), (11, 9)] #(R, INC) for the sweeps
+QUICK_MACRO_SIZES = [(6, 4)]
+REPEATS = 5 #timings per benchmark, the fastest one counts
+MIN_TIME = 0.05 #seconds | each timing runs the function at least this long
+DEFAULT_THRESHOLD = 0.25 #25% slower than the baseline counts as a regression; timings on a busy machine easily move 10%
+#metric -> true if bigger is better
+METRICS = {"ns_per_call": False, "castles_per_sec": True, "ns_per_hit": False, "peak_bytes": False}
+
+
+#returns the best ns per call of a function over REPEATS timings
+def time_call(function) -> float:
+    timer = timeit.Timer(function)
+    #find how many calls take about MIN_TIME
+    number = 1
+    elapsed = timer.timeit(number)
+    while elapsed < MIN_TIME / 10:
+        number = number * 10
+        elapsed = timer.timeit(number)
+    number = max(1, int(number * MIN_TIME / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=REPEATS, number=number))
+    return best / number * 1e9
+
+#returns a shape with a wave set on it, mid-way through the sweep grid
+def bench_castle(shape_name: str) -> tuple:
+    step = ct.shape_steps(shape_name)
+    shape = ct.build_shape(shape_name, step[len(step) // 2])
+    w = ct.build_wave(ct.INC // 2, ct.INC // 2, ct.INC // 2)
+    shape.set_base_height(w.wave_height)
+    return (shape, w)
+
+
+'''
+Micro benchmarks
+'''
+#returns {name: {"ns_per_call": ns}} for the geometry methods, the erosion step, the standing
+# checks and the cohesion of every shape
+def micro_benchmarks(shape_names = None) -> dict:
+    if shape_names is None:
+        shape_names = ct.shape_list
+    results = dict()
+    results["calc.cohesion"] = {"ns_per_call": time_call(lambda: calc.cohesion(ct.Z))}
+    #the constants simulate_castle looks up once per castle and hands to every check
+    constants = ct.current_constants()
+    for shape_name in shape_names:
+        (shape, w) = bench_castle(shape_name)
+        for method_name in GEOMETRY_METHODS:
+            method = getattr(shape, method_name)
+            results[shape_name + "." + method_name] = {"ns_per_call": time_call(method)}
+            #the same call right after the shape changed, so nothing comes out of the cache
+            def cold(method = method):
+                shape.clear_cache()
+                return method()
+            results[shape_name + "." + method_name + ".cold"] = {"ns_per_call": time_call(cold)}
+        #erode once, then put the base back so every call erodes the same shape
+        radius = shape.base_radius
+        square = shape_name == "cube" or shape_name == "pyramid"
+        side = shape.base_side_length if square else None
+        def restore():
+            shape.update_base_radius(radius)
+            if square:
+                shape.base_side_length = side
+        def erode():
+            ct.erode_shape(shape, w, constants)
+            restore()
+        results[shape_name + ".erode_shape"] = {"ns_per_call": time_call(erode)}
+        #the survive checks, which unlike castle_still_standing don't touch the stat dictionaries
+        results[shape_name + ".survives_wave_hit"] = {"ns_per_call": time_call(lambda: ct.survives_wave_hit(shape, w, constants))}
+        results[shape_name + ".survives_erosion"] = {"ns_per_call": time_call(lambda: ct.survives_erosion(shape, constants))}
+        #one hit of the castle, with the base put back after it so it never falls
+        counts = outcomes.OutcomeCounts()
+        def hit():
+            result = ct.simulate_castle(shape, w, counts, 1)
+            restore()
+            return result
+        results[shape_name + ".simulate_castle_hit"] = {"ns_per_call": time_call(hit)}
+    return results
+
+
+'''
+Macro benchmarks
+'''
+#runs one sweep and returns (seconds, castles, wave hits)
+def run_macro(shape_name: str, R: int, INC: int, engine: str) -> tuple:
+    import sweep
+    start = time.perf_counter()
+    result = sweep.run_sweep(shape_name, R=R, INC=INC, engine=engine)
+    seconds = time.perf_counter() - start
+    hits = result.wave_hits[shape_name]
+    return (seconds, len(hits), sum(hits))
+
+#returns {name: {"castles_per_sec", "ns_per_hit", "peak_bytes", ...}} for full sweeps of every
+# shape at every (R, INC) size
+def macro_benchmarks(shape_names = None, sizes = None, engine: str = "scalar") -> dict:
+    if shape_names is None:
+        shape_names = ct.shape_list
+    if sizes is None:
+        sizes = MACRO_SIZES
+    results = dict()
+    for shape_name in shape_names:
+        for (R, INC) in sizes:
+            best = None
+            for run in range(REPEATS):
+                gc.collect()
+                (seconds, castles, hits) = run_macro(shape_name, R, INC, engine)
+                if best is None or seconds < best:
+                    best = seconds
+            #peak memory gets its own run, tracing slows everything down
+            gc.collect()
+            tracemalloc.start()
+            try:
+                run_macro(shape_name, R, INC, engine)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            name = "sweep." + engine + "." + shape_name + ".R" + str(R) + ".INC" + str(INC)
+            results[name] = {"seconds": best, "castles": castles, "wave_hits": hits,
+                             "castles_per_sec": castles / best,
+                             "ns_per_hit": best / max(hits, 1) * 1e9,
+                             "peak_bytes": peak}
+    return results
+
+
+'''
+Running, saving and comparing
+'''
+#Runs the micro and macro benchmarks
+#quick uses one small sweep size instead of MACRO_SIZES
+#returns the results as a JSON-ready dict
+def run_benchmarks(shape_names = None, quick: bool = False, engine: str = "scalar", micro: bool = True,
+                   macro: bool = True) -> dict:
+    results = {"meta": {"python": platform.python_version(), "machine": platform.machine(),
+                        "platform": platform.platform(), "time": time.time(), "engine": engine},
+               "micro": dict(), "macro": dict()}
+    if micro:
+        results["micro"] = micro_benchmarks(shape_names)
+    if macro:
+        results["macro"] = macro_benchmarks(shape_names, QUICK_MACRO_SIZES if quick else MACRO_SIZES, engine)
+    return results
+
+#writes benchmark results as JSON
+def save(results: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+#reads benchmark results saved with save
+def load(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+#Compares results against a baseline
+#returns a list of (benchmark, metric, baseline value, current value, ratio) for every metric that
+# is worse than the baseline by more than threshold (0.25 = 25%); the ratio is how many times worse
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    regressions = list()
+    for section in ("micro", "macro"):
+        for (name, metrics) in results.get(section, dict()).items():
+            old = baseline.get(section, dict()).get(name)
+            if old is None:
+                continue
+            for (metric, bigger_is_better) in METRICS.items():
+                if metric not in metrics or metric not in old or old[metric] <= 0 or metrics[metric] <= 0:
+                    continue
+                if bigger_is_better:
+                    ratio = old[metric] / metrics[metric]
+                else:
+                    ratio = metrics[metric] / old[metric]
+                if ratio > 1 + threshold:
+                    regressions.append((name, metric, old[metric], metrics[metric], ratio))
+    return regressions
+
+#returns the results as printable lines
+def report(results: dict) -> list:
+    lines = list()
+    for (name, metrics) in sorted(results.get("micro", dict()).items()):
+        lines.append(name + ": " + str(round(metrics["ns_per_call"], 1)) + " ns/call")
+    for (name, metrics) in sorted(results.get("macro", dict()).items()):
+        lines.append(name + ": " + str(round(metrics["castles_per_sec"], 1)) + " castles/sec | " +
+                     str(round(metrics["ns_per_hit"], 1)) + " ns/hit | peak " +
+                     str(round(metrics["peak_bytes"] / 1024, 1)) + " KiB")
+    return lines
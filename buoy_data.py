@@ -0,0 +1,276 @@
+import os
+import json
+import shutil
+import hashlib
+import itertools
+import numpy as np
+
+#Loader for the NDBC standard meteorological files in ocean_data/
+#The text files are read in chunks of lines and turned into typed column arrays, with the
+# NDBC missing-value sentinels (99, 999, 9999) and MISSING markers replaced by NaN. Rows without
+# the standard number of fields, or with a field that isn't a number, are skipped and counted.
+#The first load of a file also writes a sidecar directory next to it (one .npy per column plus
+# a meta.json), and later loads memory-map those arrays instead of parsing the text again.
+#The sidecar is rebuilt when the text file's mtime/size change and its hash no longer matches.
+
+'''
+CONSTANTS for use in the file
+'''
+OCEAN_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocean_data")
+#Column positions in a standard meteorological row:
+#YY MM DD hh mm WDIR WSPD GST WVHT DPD APD MWD PRES ATMP WTMP DEWP VIS TIDE
+NUM_FIELDS = 18
+FIELDS = {"WVHT": 8, "DPD": 9, "APD": 10, "MWD": 11, "TIDE": 17}
+#values NDBC writes when there is no reading
+SENTINELS = {"WVHT": 99.0, "DPD": 99.0, "APD": 99.0, "MWD": 999.0, "TIDE": 99.0}
+MISSING = "MM" #what newer files write instead of a sentinel
+TIME_FIELDS = 5 #YY MM DD hh mm
+COLUMNS = ["time"] + list(FIELDS.keys()) #time is seconds since 1970-01-01 UTC
+CHUNK_ROWS = 4096 #lines parsed at a time
+SIDECAR_SUFFIX = ".cache"
+SIDECAR_VERSION = 1 #bump when the sidecar layout changes
+
+
+#Typed columns of one buoy file
+class BuoyData:
+    path: str
+    columns: dict #column name -> numpy array (memory-mapped when it came from the sidecar)
+    skipped_rows: int #rows that didn't have the standard number of fields or couldn't be read
+
+    #Constructor
+    def __init__(self, path: str, columns: dict, skipped_rows: int = 0):
+        self.path = path
+        self.columns = columns
+        self.skipped_rows = skipped_rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(self.columns["time"])
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "BuoyData: " + os.path.basename(self.path) + " | rows: " + str(len(self))
+
+    #returns the station name, e.g. scripps_east_florida
+    def station(self) -> str:
+        return station_name(self.path)
+
+    #returns the average of a column, ignoring missing readings
+    def average(self, name: str) -> float:
+        return float(np.nanmean(self.columns[name]))
+
+
+#returns the station name for a buoy file path
+def station_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+#returns the paths of all the NDBC files in ocean_data/
+def station_files(directory: str = OCEAN_DATA) -> list:
+    names = sorted(name for name in os.listdir(directory) if name.startswith("scripps") and name.endswith(".txt"))
+    return [os.path.join(directory, name) for name in names]
+
+
+'''
+Parsing
+'''
+#turns a chunk of text rows into a dict of column arrays
+#returns (columns, number of rows skipped for not having NUM_FIELDS fields or not being numbers)
+def parse_rows(lines) -> tuple:
+    rows = list()
+    skipped = 0
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        fields = line.split()
+        if len(fields) == 0:
+            continue
+        if len(fields) != NUM_FIELDS:
+            skipped += 1
+            continue
+        rows.append(fields)
+    if len(rows) == 0:
+        return (empty_columns(), skipped)
+    try:
+        values = np.array(rows, dtype=float)
+    except ValueError:
+        #some row has a token that isn't a number; go through the rows one at a time
+        (values, bad) = parse_values(rows)
+        skipped += bad
+        if len(values) == 0:
+            return (empty_columns(), skipped)
+    columns = dict()
+    columns["time"] = to_epoch_seconds(values[:, 0], values[:, 1], values[:, 2], values[:, 3], values[:, 4])
+    for (name, position) in FIELDS.items():
+        column = values[:, position]
+        column[column == SENTINELS[name]] = np.nan
+        columns[name] = column
+    return (columns, skipped)
+
+#returns (array of the rows that are all numbers, number of rows that weren't)
+#MISSING fields are NaN, but a row also has to have a whole timestamp
+def parse_values(rows: list) -> tuple:
+    values = list()
+    bad = 0
+    for fields in rows:
+        try:
+            row = [np.nan if field == MISSING else float(field) for field in fields]
+        except ValueError:
+            bad += 1
+            continue
+        if not np.all(np.isfinite(row[:TIME_FIELDS])):
+            bad += 1
+            continue
+        values.append(row)
+    return (np.array(values, dtype=float).reshape(len(values), NUM_FIELDS), bad)
+
+#returns a dict of zero-length column arrays
+def empty_columns() -> dict:
+    columns = {"time": np.zeros(0, dtype=np.int64)}
+    for name in FIELDS:
+        columns[name] = np.zeros(0, dtype=float)
+    return columns
+
+#returns seconds since 1970-01-01 UTC for arrays of year, month, day, hour, minute
+def to_epoch_seconds(year, month, day, hour, minute) -> np.ndarray:
+    year = year.astype(np.int64)
+    year = np.where(year < 100, year + 1900, year) #old files use two-digit years
+    months = (year - 1970) * 12 + (month.astype(np.int64) - 1)
+    days = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + day.astype(np.int64) - 1
+    return days * 86400 + hour.astype(np.int64) * 3600 + minute.astype(np.int64) * 60
+
+#Streams a buoy text file as chunks of column arrays, chunk_rows lines at a time
+#yields (columns, skipped) the same as parse_rows
+def iter_chunks(path: str, chunk_rows: int = CHUNK_ROWS):
+    with open(path, "r") as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if len(lines) == 0:
+                return
+            yield parse_rows(lines)
+
+#parses a whole buoy text file, one chunk at a time
+def parse_file(path: str, chunk_rows: int = CHUNK_ROWS) -> BuoyData:
+    pieces = {name: list() for name in COLUMNS}
+    skipped = 0
+    for (columns, chunk_skipped) in iter_chunks(path, chunk_rows):
+        skipped += chunk_skipped
+        for name in COLUMNS:
+            pieces[name].append(columns[name])
+    columns = dict()
+    for name in COLUMNS:
+        columns[name] = np.concatenate(pieces[name]) if len(pieces[name]) > 0 else empty_columns()[name]
+    return BuoyData(path, columns, skipped)
+
+
+'''
+Sidecars
+'''
+#returns the sidecar directory for a buoy file
+def sidecar_path(path: str) -> str:
+    return path + SIDECAR_SUFFIX
+
+#returns the sha256 of a file, read in blocks
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+#returns the source stamp stored in a sidecar's meta.json
+def source_stamp(path: str, with_hash: bool = True) -> dict:
+    info = os.stat(path)
+    stamp = {"mtime_ns": info.st_mtime_ns, "size": info.st_size, "version": SIDECAR_VERSION}
+    if with_hash:
+        stamp["sha256"] = file_hash(path)
+    return stamp
+
+#returns the sidecar's meta.json contents, or None if it isn't there or can't be read
+def read_meta(path: str):
+    try:
+        with open(os.path.join(sidecar_path(path), "meta.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+#writes the sidecar's meta.json
+def write_meta(directory: str, meta: dict):
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+#returns true if the sidecar still matches the text file
+#a changed mtime or size only forces a rebuild when the file's hash changed too
+def sidecar_is_valid(path: str) -> bool:
+    meta = read_meta(path)
+    if meta is None or meta.get("version") != SIDECAR_VERSION:
+        return False
+    stamp = source_stamp(path, with_hash=False)
+    if stamp["mtime_ns"] == meta.get("mtime_ns") and stamp["size"] == meta.get("size"):
+        return True
+    if stamp["size"] != meta.get("size") or file_hash(path) != meta.get("sha256"):
+        return False
+    #same contents, just touched; remember the new mtime so the next check is quick
+    meta["mtime_ns"] = stamp["mtime_ns"]
+    try:
+        write_meta(sidecar_path(path), meta)
+    except OSError:
+        pass
+    return True
+
+#parses the text file and writes its sidecar
+#stamp is the source_stamp taken before data was parsed (taken now if not given), so a file that
+# was appended to while it was being parsed doesn't match its sidecar and gets parsed again
+#the sidecar is written to a temporary directory first and moved into place, so a crash
+# part way through never leaves a half-written sidecar behind
+def write_sidecar(path: str, data: BuoyData = None, stamp: dict = None) -> BuoyData:
+    if stamp is None:
+        stamp = source_stamp(path)
+    if data is None:
+        data = parse_file(path)
+    directory = sidecar_path(path)
+    temporary = directory + ".tmp" + str(os.getpid())
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    for name in COLUMNS:
+        np.save(os.path.join(temporary, name + ".npy"), data.columns[name])
+    stamp["rows"] = len(data)
+    stamp["skipped_rows"] = data.skipped_rows
+    write_meta(temporary, stamp)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temporary, directory)
+    return data
+
+#memory-maps the columns of a sidecar
+def read_sidecar(path: str) -> BuoyData:
+    directory = sidecar_path(path)
+    meta = read_meta(path)
+    columns = dict()
+    for name in COLUMNS:
+        columns[name] = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+    return BuoyData(path, columns, meta.get("skipped_rows", 0))
+
+#Loads a buoy file, from its sidecar when it is still valid
+#use_sidecar=False always parses the text and leaves the sidecar alone
+def load(path: str, use_sidecar: bool = True) -> BuoyData:
+    if not use_sidecar:
+        return parse_file(path)
+    if sidecar_is_valid(path):
+        return read_sidecar(path)
+    stamp = source_stamp(path)
+    data = parse_file(path)
+    try:
+        write_sidecar(path, data, stamp)
+    except OSError:
+        #read-only data directory; the parsed arrays are still good
+        return data
+    return read_sidecar(path)
+
+#Loads every station file in ocean_data/
+#returns a dict of station name -> BuoyData
+def load_all(directory: str = OCEAN_DATA, use_sidecar: bool = True) -> dict:
+    stations = dict()
+    for path in station_files(directory):
+        stations[station_name(path)] = load(path, use_sidecar)
+    return stations
@@ -0,0 +1,371 @@
+import os
+import json
+import shutil
+import numpy as np
+import buoy_data
+
+#Indexed store of per-period buoy aggregates
+#The index is built once over all the station files and keeps, for every station and every
+# year, month and day (UTC) bucket, the count, sum, sum of squares, min and max of each field
+# plus a fixed-bin histogram of it as the quantile sketch. Days are aggregated from the rows,
+# months from the days and years from the months.
+#A range query is split into the fewest whole buckets that cover it (whole years, then whole
+# months, then whole days at the ends), and only the part of a day at either end of the range
+# is read from the buoy rows (the memory-mapped sidecar columns, found with a binary search),
+# so any range costs a few dozen bucket additions instead of a pass over the rows.
+#Every piece is mergeable and order independent, so a range (or a set of stations) gives the
+# same numbers however it is split up. Quantiles are good to a bin width (BINS).
+#Each station is rebuilt on its own when its file's mtime or size change.
+
+'''
+CONSTANTS for use in the file
+'''
+INDEX_DIR = os.path.join(buoy_data.OCEAN_DATA, "buoy.index")
+INDEX_VERSION = 1 #bump when the index layout changes
+FIELDS = ["WVHT", "DPD", "APD"]
+BINS = {"WVHT": (0.0, 10.0, 400), #low, high, bins | 2.5 cm bins
+        "DPD": (0.0, 30.0, 300), #0.1 s bins
+        "APD": (0.0, 30.0, 300)}
+LEVELS = ["year", "month", "day"] #stored levels, coarsest first
+UNITS = {"year": "Y", "month": "M", "day": "D", "hour": "h"} #numpy datetime64 unit of each level; hours are read from the rows
+AGGREGATES = ["count", "sum", "squares", "minimum", "maximum"]
+
+
+#returns the bucket number of timestamps at a level: years, months or days since 1970
+def bucket_numbers(times, level: str) -> np.ndarray:
+    return np.asarray(times, dtype=np.int64).astype("datetime64[s]").astype("datetime64[" + UNITS[level] + "]").astype(np.int64)
+
+#returns the timestamp a bucket starts at
+def bucket_start(level: str, number: int) -> int:
+    return int(np.array(number, dtype=np.int64).astype("datetime64[" + UNITS[level] + "]").astype("datetime64[s]").astype(np.int64))
+
+#returns the timestamp of a YYYY-MM-DD day (UTC), or None for None
+def day_timestamp(text: str):
+    if text is None:
+        return None
+    return bucket_start("day", int(np.datetime64(text, "D").astype(np.int64)))
+
+#returns the histogram bin of every value of a field
+def bins_of(field: str, values: np.ndarray) -> np.ndarray:
+    (low, high, bins) = BINS[field]
+    return np.clip(((values - low) / (high - low) * bins).astype(np.int64), 0, bins - 1)
+
+
+#Count, sum, sum of squares, min, max and histogram of one field over any set of buckets and rows
+class Summary:
+    field: str
+    count: int
+    total: float
+    squares: float
+    minimum: float
+    maximum: float
+    histogram: np.ndarray
+
+    #Constructor
+    def __init__(self, field: str):
+        if field not in BINS:
+            raise ValueError("Unknown buoy field: " + str(field) + " (pick from " + ", ".join(FIELDS) + ")")
+        self.field = field
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.histogram = np.zeros(BINS[field][2], dtype=np.int64)
+
+    #to_string method for pretty printing
+    def __str__(self):
+        if self.count == 0:
+            return self.field + " | readings: 0"
+        return self.field + " | readings: " + str(self.count) + " | mean: " + str(round(self.mean(), 3)) + \
+               " | stdev: " + str(round(self.stdev(), 3)) + " | min: " + str(self.minimum) + \
+               " | max: " + str(self.maximum) + " | p50: " + str(round(self.quantile(0.5), 2)) + \
+               " | p90: " + str(round(self.quantile(0.9), 2))
+
+    #adds the aggregates of buckets first to last - 1 of a station level
+    def add_buckets(self, level: dict, first: int, last: int):
+        if last <= first:
+            return
+        f = FIELDS.index(self.field)
+        self.count += int(level["count"][first:last, f].sum())
+        self.total += float(level["sum"][first:last, f].sum())
+        self.squares += float(level["squares"][first:last, f].sum())
+        self.minimum = min(self.minimum, float(level["minimum"][first:last, f].min()))
+        self.maximum = max(self.maximum, float(level["maximum"][first:last, f].max()))
+        self.histogram += level["hist-" + self.field][first:last].sum(axis=0, dtype=np.int64)
+
+    #adds readings, skipping missing ones
+    def add_values(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.squares += float((values * values).sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.histogram += np.bincount(bins_of(self.field, values), minlength=len(self.histogram))
+
+    #adds another Summary of the same field into this one and returns this one
+    def merge(self, other):
+        if other.field != self.field:
+            raise ValueError("Can only merge summaries of the same field")
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        return self
+
+    #returns the mean, or None with no readings
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    #returns the sample standard deviation (0 with fewer than two readings)
+    def stdev(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return float(np.sqrt(max(self.squares - self.total * self.total / self.count, 0.0) / (self.count - 1)))
+
+    #returns the approximate q quantile (0 <= q <= 1) from the histogram, or None with no readings
+    def quantile(self, q: float):
+        if not 0 <= q <= 1:
+            raise ValueError("q has to be between 0 and 1")
+        if self.count == 0:
+            return None
+        (low, high, bins) = BINS[self.field]
+        width = (high - low) / bins
+        target = q * self.count
+        cumulative = np.cumsum(self.histogram)
+        k = min(int(np.searchsorted(cumulative, target)), bins - 1)
+        before = cumulative[k] - self.histogram[k]
+        fraction = (target - before) / self.histogram[k] if self.histogram[k] > 0 else 0.0
+        x = low + (k + fraction) * width
+        return float(min(max(x, self.minimum), self.maximum))
+
+
+'''
+Building
+'''
+#returns {aggregate: array} of every day from the first to the last reading, and the first day
+def day_aggregates(data) -> tuple:
+    times = np.asarray(data["time"], dtype=np.int64)
+    days = bucket_numbers(times, "day")
+    first = int(days.min())
+    n = int(days.max()) - first + 1
+    k = days - first
+    level = {"count": np.zeros((n, len(FIELDS)), dtype=np.int64)}
+    for name in ["sum", "squares"]:
+        level[name] = np.zeros((n, len(FIELDS)))
+    level["minimum"] = np.full((n, len(FIELDS)), np.inf)
+    level["maximum"] = np.full((n, len(FIELDS)), -np.inf)
+    for (f, field) in enumerate(FIELDS):
+        values = np.asarray(data[field], dtype=float)
+        good = ~np.isnan(values)
+        (where, values) = (k[good], values[good])
+        level["count"][:, f] = np.bincount(where, minlength=n)
+        level["sum"][:, f] = np.bincount(where, weights=values, minlength=n)
+        level["squares"][:, f] = np.bincount(where, weights=values * values, minlength=n)
+        np.minimum.at(level["minimum"][:, f], where, values)
+        np.maximum.at(level["maximum"][:, f], where, values)
+        bins = BINS[field][2]
+        level["hist-" + field] = np.bincount(where * bins + bins_of(field, values),
+                                             minlength=n * bins).reshape(n, bins).astype(np.uint32)
+    return (level, first)
+
+#returns the aggregates of a coarser level, adding up the buckets of a finer one that start at
+# the given timestamps, and the first bucket of the coarser level
+def roll_up(finer: dict, starts: np.ndarray, level: str) -> tuple:
+    numbers = bucket_numbers(starts, level)
+    first = int(numbers[0])
+    n = int(numbers[-1]) - first + 1
+    k = numbers - first
+    coarser = dict()
+    for (name, array) in finer.items():
+        if name == "minimum":
+            coarser[name] = np.full((n,) + array.shape[1:], np.inf)
+            np.minimum.at(coarser[name], k, array)
+        elif name == "maximum":
+            coarser[name] = np.full((n,) + array.shape[1:], -np.inf)
+            np.maximum.at(coarser[name], k, array)
+        else:
+            coarser[name] = np.zeros((n,) + array.shape[1:], dtype=array.dtype)
+            np.add.at(coarser[name], k, array)
+    return (coarser, first)
+
+#returns {level: (aggregates, first bucket)} for a station's BuoyData
+def build_levels(data) -> dict:
+    (day, first_day) = day_aggregates(data)
+    starts = np.array([bucket_start("day", first_day + k) for k in range(len(day["count"]))], dtype=np.int64)
+    (month, first_month) = roll_up(day, starts, "month")
+    starts = np.array([bucket_start("month", first_month + k) for k in range(len(month["count"]))], dtype=np.int64)
+    (year, first_year) = roll_up(month, starts, "year")
+    return {"year": (year, first_year), "month": (month, first_month), "day": (day, first_day)}
+
+#returns the stamp a station's index is checked against
+def station_stamp(path: str) -> dict:
+    stamp = buoy_data.source_stamp(path, with_hash=False)
+    stamp["index_version"] = INDEX_VERSION
+    stamp["bins"] = BINS
+    return stamp
+
+#builds the index of one station file into directory/station
+#written to a temporary directory first and moved into place, like the buoy sidecars
+def build_station(path: str, directory: str = INDEX_DIR):
+    meta = station_stamp(path)
+    data = buoy_data.load(path)
+    if len(data) == 0:
+        raise ValueError(path + " has no readings to index")
+    target = os.path.join(directory, buoy_data.station_name(path))
+    temporary = target + ".tmp" + str(os.getpid())
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    meta["first"] = dict()
+    for (level, (aggregates, first)) in build_levels(data).items():
+        meta["first"][level] = first
+        for (name, array) in aggregates.items():
+            np.save(os.path.join(temporary, level + "-" + name + ".npy"), array)
+    meta["first_time"] = int(data["time"][0])
+    meta["last_time"] = int(data["time"][-1])
+    buoy_data.write_meta(temporary, meta)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(temporary, target)
+
+#returns true if a station's index is there and still matches its file
+def station_is_valid(path: str, directory: str = INDEX_DIR) -> bool:
+    try:
+        with open(os.path.join(directory, buoy_data.station_name(path), "meta.json"), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    stamp = json.loads(json.dumps(station_stamp(path)))
+    return all(meta.get(name) == value for (name, value) in stamp.items())
+
+
+#Per-period aggregates of every station file
+class BuoyIndex:
+    directory: str
+    paths: dict #station name -> buoy file path
+    stations: dict #station name -> (meta, {level: {aggregate: memory-mapped array}})
+    rebuilt: list #stations (re)built when the index was opened
+
+    #Constructor; builds the index of any station that is missing or out of date
+    def __init__(self, data_directory: str = buoy_data.OCEAN_DATA, directory: str = None):
+        if directory is None:
+            directory = INDEX_DIR if data_directory == buoy_data.OCEAN_DATA else os.path.join(data_directory, "buoy.index")
+        self.directory = directory
+        self.paths = {buoy_data.station_name(path): path for path in buoy_data.station_files(data_directory)}
+        self.stations = dict()
+        self.rebuilt = list()
+        os.makedirs(directory, exist_ok=True)
+        for (station, path) in self.paths.items():
+            if not station_is_valid(path, directory):
+                build_station(path, directory)
+                self.rebuilt.append(station)
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "BuoyIndex: " + self.directory + " | stations: " + str(len(self.paths)) + \
+               " | rebuilt: " + (", ".join(self.rebuilt) if self.rebuilt else "none")
+
+    #returns (meta, levels) of a station, memory-mapping its arrays the first time
+    def station(self, station: str) -> tuple:
+        if station not in self.paths:
+            raise ValueError("Unknown station: " + str(station) + " (pick from " + ", ".join(self.paths) + ")")
+        if station not in self.stations:
+            target = os.path.join(self.directory, station)
+            with open(os.path.join(target, "meta.json"), "r") as f:
+                meta = json.load(f)
+            levels = dict()
+            for level in LEVELS:
+                names = AGGREGATES + ["hist-" + field for field in FIELDS]
+                levels[level] = {name: np.load(os.path.join(target, level + "-" + name + ".npy"), mmap_mode="r")
+                                 for name in names}
+            self.stations[station] = (meta, levels)
+        return self.stations[station]
+
+    #returns the station names that match a name or a prefix/substring like "east_florida"
+    def match(self, stations) -> list:
+        if isinstance(stations, str):
+            stations = [stations]
+        names = list()
+        for text in stations:
+            found = [name for name in self.paths if name == text] or [name for name in self.paths if text in name]
+            if not found:
+                raise ValueError("No station matches " + str(text) + " (pick from " + ", ".join(self.paths) + ")")
+            names.extend(name for name in found if name not in names)
+        return names
+
+    #Summary of a field over [start, end) (epoch seconds; None for open ends) at one or more stations
+    #stations are matched with match, so "east_florida" covers both east Florida buoys
+    def summary(self, stations, field: str = "WVHT", start: float = None, end: float = None) -> Summary:
+        result = Summary(field)
+        for station in self.match(stations):
+            result.merge(self.station_summary(station, field, start, end))
+        return result
+
+    #Summary of a field over [start, end) at one station
+    def station_summary(self, station: str, field: str, start: float = None, end: float = None) -> Summary:
+        (meta, levels) = self.station(station)
+        result = Summary(field)
+        if start is None:
+            start = bucket_start("year", meta["first"]["year"])
+        if end is None:
+            end = bucket_start("year", meta["first"]["year"] + len(levels["year"]["count"]))
+        start = max(int(start), bucket_start("day", meta["first"]["day"]))
+        end = min(int(np.ceil(end)), bucket_start("day", meta["first"]["day"] + len(levels["day"]["count"])))
+        t = start
+        while t < end:
+            for level in LEVELS:
+                number = int(bucket_numbers([t], level)[0])
+                if bucket_start(level, number) != t or bucket_start(level, number + 1) > end:
+                    continue
+                first = meta["first"][level]
+                result.add_buckets(levels[level], number - first, number - first + 1)
+                t = bucket_start(level, number + 1)
+                break
+            else:
+                #part of a day: straight from the rows
+                stop = min(bucket_start("day", int(bucket_numbers([t], "day")[0]) + 1), end)
+                result.add_values(self.rows(station, field, t, stop))
+                t = stop
+        return result
+
+    #returns [(bucket start, Summary)] for every year, month, day or hour bucket in [start, end)
+    def breakdown(self, stations, field: str, by: str, start: float, end: float) -> list:
+        if by not in UNITS:
+            raise ValueError("Can only break down by " + ", ".join(UNITS))
+        results = list()
+        number = int(bucket_numbers([start], by)[0])
+        while bucket_start(by, number) < end:
+            (first, last) = (max(bucket_start(by, number), start), min(bucket_start(by, number + 1), end))
+            results.append((first, self.summary(stations, field, first, last)))
+            number = number + 1
+        return results
+
+    #returns the readings of a field at a station in [start, end) from the buoy rows
+    def rows(self, station: str, field: str, start: float, end: float) -> np.ndarray:
+        data = buoy_data.load(self.paths[station])
+        times = data["time"]
+        first = int(np.searchsorted(times, start, side="left"))
+        last = int(np.searchsorted(times, end, side="left"))
+        return np.asarray(data[field][first:last])
+
+
+#returns the BASE_WAVE_HEIGHT for a scenario with the waves of a buoy range: the model's base
+# height scaled by the range's mean WVHT (or its q quantile) over the stations' all-time mean,
+# the same buoy-to-beach scaling as wave_train.beach_scale
+def base_wave_height(index: BuoyIndex, stations, start: float = None, end: float = None,
+                     quantile: float = None, base: float = None) -> float:
+    if base is None:
+        import castle_test as ct
+        base = ct.BASE_WAVE_HEIGHT
+    period = index.summary(stations, "WVHT", start, end)
+    if period.count == 0:
+        raise ValueError("No WVHT readings for " + str(stations) + " in that range")
+    value = period.mean() if quantile is None else period.quantile(quantile)
+    return base * value / index.summary(stations, "WVHT").mean()
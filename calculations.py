@@ -1,35 +1,53 @@
 import math
+import functools
 import sand_castle_shapes
 import wave
 
+'''
+CONSTANTS for use in the file
+'''
+MU = 0.66 #friction coefficient of the sand
+#phi, kappa and s from the cohesion formula
+PHI = 0.6
+KAPPA = 0.4
+S = 0.5
+SAND_SIZE = 0.000375 #grain diameter in meters, same as SAND_DIAMETER in castle_test.py
+
 
 #returns max shear strength given a shape, wave height, and bond number
-def maximum_shear_strength(shape, wave, z) -> float:
+#with a castle_test.Constants the sand's weight, MU and the cohesion come from it instead of the
+# module constants (z is then already in its cohesion)
+def maximum_shear_strength(shape, wave, z, constants = None) -> float:
 
     #set the height based on this particular wave
     shape.set_base_height(wave.wave_height)
 
     #Set the needed variables for the function
     #Normal stress
-    normal_force = shape.get_normal_sand()
     area = shape.get_cross_sectional_area()
-    mu = 0.66
-    
+    if constants is None:
+        normal_force = shape.get_normal_sand()
+        #Calculate the shear strength
+        return ((normal_force / area) *  MU) + cohesion(z)
+    #same as get_normal_sand, with the constants' sand density and gravity
+    normal_force = shape.get_top_vol() * constants.sand_density * constants.gravity
 
     #Calculate the shear strength
-    shear_strength = ((normal_force / area) *  mu) + cohesion(z)
+    shear_strength = ((normal_force / area) *  constants.mu) + constants.cohesion
 
     return shear_strength
 
 #Determin the cohesion for a given bond number z 
+#only depends on z and the constants above, which never change during a run, so it is only worked
+# out once per z (scenario.Scenario.apply clears the cache when it changes the constants)
+@functools.lru_cache(maxsize=None)
 def cohesion(z) -> float:
+    return cohesion_with(z, MU, PHI, KAPPA, S, SAND_SIZE)
+
+#the cohesion formula with every constant passed in, for scenarios that aren't applied
+def cohesion_with(z, mu: float, phi: float, kappa: float, s: float, sand_size: float) -> float:
     
     volume_correction = (3 / (4 * math.pi))
-    phi = 0.6 
-    kappa = 0.4
-    s = 0.5
-    sand_size = 0.000375
-    mu = 0.66
 
     cohesion = ((volume_correction) * s * mu * ((phi * kappa * z) / sand_size))
     return cohesion
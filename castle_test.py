@@ -1,9 +1,10 @@
 import math
 import sand_castle_shapes as shapes
 import wave as waves
-import numpy as np
 import calculations as calc
-import matplotlib as plt
+import outcomes
+import records
+import stats
 
 
 '''
@@ -30,9 +31,11 @@ J = 1.8663 #Bessel function number
 E = 30 * 1000000 # Pa | Young's Modulus for sand from https://www.nature.com/articles/srep00549
 ALPHA = 0.054
 GAMMA = 70
-AVG_WAVE_HEIGHT = 0.05 * WAVE_MULTIPLIER # meters | 1.039 m from two bouys off CA and 3 off FL, but that's when the big ones are breaking |DEFAULT: 0.05
+BASE_WAVE_HEIGHT = 0.05 # meters | wave height before the WAVE_MULTIPLIER | DEFAULT: 0.05
+AVG_WAVE_HEIGHT = BASE_WAVE_HEIGHT * WAVE_MULTIPLIER # meters | 1.039 m from two bouys off CA and 3 off FL, but that's when the big ones are breaking |DEFAULT: 0.05
 AVG_BREAK_DEPTH = AVG_WAVE_HEIGHT * 1.3 * WAVE_MULTIPLIER # meters 
-AVG_RAINFALL = 0.00508 * RAIN_MULTIPLIER #rainfall in m / hour
+BASE_RAINFALL = 0.00508 #rainfall in m / hour before the RAIN_MULTIPLIER
+AVG_RAINFALL = BASE_RAINFALL * RAIN_MULTIPLIER #rainfall in m / hour
 TIME_PER_WAVE = 5.0 # seconds 
 AVG_RAINFALL_PER_WAVE = AVG_RAINFALL * (1/60) * (1/60) * TIME_PER_WAVE #rainfall from m/hr to m/wave_time
 INITIAL_SATURATION = 0.06 #initial saturation at 6%
@@ -44,17 +47,68 @@ MIN_CASTLE_HEIGHT = 0.08
 MAX_CASTLE_HEIGHT = 1
 
 #dictionaries for keeping track of stuff
-erosion_dict = dict()
-knockout_dict = dict()
-did_not_fall_dict = dict()
-fell_from_rain_dict = dict()
-#Put stuff in the dictionaries 
-shape_list = ["cube", "cylinder", "pyramid", "cone"]
-for s in shape_list:
-    erosion_dict[s] = 0
-    knockout_dict[s] = 0
-    did_not_fall_dict[s] = 0
-    fell_from_rain_dict[s] = 0
+#NOTE: these are the default counters for scripts; sweeps that run in parallel pass their own
+#      outcomes.OutcomeCounts to simulate_castle instead
+shape_list = outcomes.SHAPES
+outcome_counts = outcomes.OutcomeCounts()
+erosion_dict = outcome_counts.counts["erosion"]
+knockout_dict = outcome_counts.counts["knockout"]
+did_not_fall_dict = outcome_counts.counts["did_not_fall"]
+fell_from_rain_dict = outcome_counts.counts["rain"]
+
+#the attributes of a Constants
+CONSTANT_NAMES = ("sand_density", "sand_diameter", "water_density", "gravity", "j", "e", "alpha", "gamma",
+                  "mu", "cohesion", "rain_per_wave", "time_per_wave", "initial_saturation", "oversaturated")
+
+
+#The constants the physics reads, in one object
+#Every physics function below takes one as constants and reads the module constants above when it
+# isn't given one (see current_constants). A scenario hands its own to simulate_castle,
+# fast_forward.advance and batch.CastleBatch with scenario.Scenario.constants() instead of applying
+# itself, so two scenarios can run one after the other, or side by side, in the same process.
+class Constants:
+    __slots__ = CONSTANT_NAMES
+    sand_density: float # kg / m^3
+    sand_diameter: float # meters
+    water_density: float # kg / m^3
+    gravity: float # m / s^2
+    j: float #Bessel function number
+    e: float # Pa | Young's Modulus
+    alpha: float
+    gamma: float
+    mu: float #friction coefficient of the sand
+    cohesion: float #calculations.cohesion at the max bond number Z
+    rain_per_wave: float #AVG_RAINFALL_PER_WAVE
+    time_per_wave: float # seconds
+    initial_saturation: float
+    oversaturated: float
+
+    #Constructor; takes every name in CONSTANT_NAMES
+    def __init__(self, **values):
+        if set(values) != set(CONSTANT_NAMES):
+            raise ValueError("Constants needs exactly " + ", ".join(CONSTANT_NAMES) + ", got: " + ", ".join(values))
+        for name in CONSTANT_NAMES:
+            setattr(self, name, values[name])
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "Constants: " + ", ".join(name + "=" + str(getattr(self, name)) for name in CONSTANT_NAMES)
+
+    def __eq__(self, other):
+        return isinstance(other, Constants) and \
+            all(getattr(self, name) == getattr(other, name) for name in CONSTANT_NAMES)
+
+    #builds a wave whose speed comes from these constants' gravity
+    def wave(self, height: float, depth: float, dist: float):
+        return waves.Wave(height, depth, dist, self.gravity)
+
+
+#returns the Constants the modules are set up for right now
+def current_constants() -> Constants:
+    return Constants(sand_density=SAND_DENSITY, sand_diameter=SAND_DIAMETER, water_density=WATER_DENSITY,
+                     gravity=GRAVITY, j=J, e=E, alpha=ALPHA, gamma=GAMMA, mu=calc.MU, cohesion=calc.cohesion(Z),
+                     rain_per_wave=AVG_RAINFALL_PER_WAVE, time_per_wave=TIME_PER_WAVE,
+                     initial_saturation=INITIAL_SATURATION, oversaturated=OVERSATURATED)
 
 
 #Friendly reminder that N = (kg * m) / s^2
@@ -71,11 +125,13 @@ for s in shape_list:
 
 
 #Erodes the shape object with a wave
-def erode_shape(shape, wave):
+def erode_shape(shape, wave, constants: Constants = None):
+    if constants is None:
+        constants = current_constants()
     pre_erosion_radius = shape.base_radius
-    sand_washed_away = num_grains_eroded(shape, wave)
+    sand_washed_away = num_grains_eroded(shape, wave, constants)
     layers_eroded = num_layers_eroded(shape, sand_washed_away)
-    depth_eroded = grains_to_meters(layers_eroded)
+    depth_eroded = grains_to_meters(layers_eroded, constants)
     #Now update the base radius of the shape
     post_erosion_radius = pre_erosion_radius - depth_eroded
     #print("post_erosion: " + str(post_erosion_radius))
@@ -89,11 +145,12 @@ def erode_shape(shape, wave):
 
 
 #calculates the number of grains washed away
-def num_grains_eroded(shape, wave) -> int:
+def num_grains_eroded(shape, wave, constants: Constants = None) -> int:
+    if constants is None:
+        constants = current_constants()
     #cohesion_multiplier is how many times more powerful the wave is than the forces holding the sand particles together
-    wave_force = wave_force_on_shape(shape, wave) / shape.get_cross_sectional_area()
-    global Z
-    cohesion = calc.cohesion(Z)
+    wave_force = wave_force_on_shape(shape, wave, constants) / shape.get_cross_sectional_area()
+    cohesion = constants.cohesion
     cohesion_multiplier = wave_force / cohesion
     #Round to an int so that if it's below the required force to break sand-bonds then the product is 0 and no sand is removed
     sand_removed = wave.wave_height * wave.wave_distance_past_castle * cohesion_multiplier
@@ -108,9 +165,10 @@ def num_layers_eroded(shape, num_grains: int) -> int:
 
 #converts sand grains to meters; sand grains lined up in a row
 #n is the number of sand grains
-def grains_to_meters(n: float) -> float:
-    global SAND_DIAMETER
-    return n * SAND_DIAMETER
+def grains_to_meters(n: float, constants: Constants = None) -> float:
+    if constants is None:
+        return n * SAND_DIAMETER
+    return n * constants.sand_diameter
 
 
 #checks to see if the wave obliterates the castle completely
@@ -121,26 +179,31 @@ def castle_still_standing(shape, wave) -> bool:
 
 
 #returns the force of a wave as applied to a shape
-def wave_force_on_shape(shape, wave) -> float:
-    global WATER_DENSITY
+def wave_force_on_shape(shape, wave, constants: Constants = None) -> float:
+    water_density = WATER_DENSITY if constants is None else constants.water_density
     surface_area = shape.get_eroding_surface_area()
     wave_velocity = wave.wave_speed
-    force = WATER_DENSITY * surface_area * wave_velocity * wave_velocity
+    force = water_density * surface_area * wave_velocity * wave_velocity
     return force
 
-#returns a boolean on if the castle is still standing after a wave hit (not erosion)
-def standing_after_wave_hit(shape, wave) -> bool:
-    global Z
-    max_shear_strength = calc.maximum_shear_strength(shape, wave, Z)
+#returns true if the wave's shear on the shape is below the shape's max shear strength
+#same check as standing_after_wave_hit, but without touching the stat dictionaries
+def survives_wave_hit(shape, wave, constants: Constants = None) -> bool:
+    if constants is None:
+        constants = current_constants()
+    max_shear_strength = calc.maximum_shear_strength(shape, wave, Z, constants)
     #print("Shear strength: " + str(max_shear_strength))
-    wave_force = wave_force_on_shape(shape, wave)
+    wave_force = wave_force_on_shape(shape, wave, constants)
     #print("Wave force: " + str(wave_force))
     #calculate wave shear
     wave_shear = wave_force / shape.get_cross_sectional_area()
-    #return wave_shear < max_shear_strength
     #print("Wave_shear: " + str(wave_shear))
     #print("Max shearing strength: " + str(max_shear_strength))
-    if wave_shear < max_shear_strength:
+    return wave_shear < max_shear_strength
+
+#returns a boolean on if the castle is still standing after a wave hit (not erosion)
+def standing_after_wave_hit(shape, wave) -> bool:
+    if survives_wave_hit(shape, wave):
         return True
     else:
         #print("Knocked over by a wave")
@@ -149,41 +212,58 @@ def standing_after_wave_hit(shape, wave) -> bool:
         knockout_dict[s] = val + 1
         return False
 
-#returns a boolean on if the castle is still standing after being eroded
-def standing_after_erosion(shape, wave) -> bool:
-    global SAND_DENSITY
-    global E
-    global GRAVITY
-    global J
-    global E
-    global GAMMA
-    global ALPHA
-    G = ALPHA * shape.base_radius**(-1/3) * E**(2/3) * GAMMA**(1/3)
+#returns the tallest castle the eroded base can hold up
+#only changes when the base erodes, so the shape remembers it between hits, along with the
+# constants it was worked out with
+def critical_height(shape, constants: Constants = None) -> float:
+    if constants is None:
+        constants = current_constants()
+    cached = shape.cached_value("base", "critical_height")
+    if cached is None or (cached[0] is not constants and cached[0] != constants):
+        cached = (constants, _critical_height(shape, constants))
+        shape.cache_value("base", "critical_height", cached)
+    return cached[1]
+
+def _critical_height(shape, constants: Constants) -> float:
+    c = constants
+    G = c.alpha * shape.base_radius**(-1/3) * c.e**(2/3) * c.gamma**(1/3)
     r = shape.base_radius
     #From the Nature article
-    crit_height = (( (9 * J * J) / 16) \
-                  * ( (G * r * r) / (SAND_DENSITY * GRAVITY)))**(1/3)
-    #Now check each shape:
-    if type(shape) is shapes.Cylinder or type(shape) is shapes.Cube:
-        if shape.height <= crit_height:
-            return True
-        else:
-            s = shape.string_name()
-            val = erosion_dict[s]
-            erosion_dict[s] = val + 1
-            return False
-    elif type(shape) is shapes.Cone or type(shape) is shapes.Pyramid:
-        #Multiply by 3 since the volume of a cone/pyramid is 1/3 the volume of a cylinder/cube
-        if shape.height <= 3 *crit_height:
-            return True
-        else:
-            s = shape.string_name()
-            val = erosion_dict[s]
-            erosion_dict[s] = val + 1
-            return False
+    crit_height = (( (9 * c.j * c.j) / 16) \
+                  * ( (G * r * r) / (c.sand_density * c.gravity)))**(1/3)
+    #Multiply by 3 since the volume of a cone/pyramid is 1/3 the volume of a cylinder/cube
+    if type(shape) is shapes.Cone or type(shape) is shapes.Pyramid:
+        return 3 *crit_height
+    return crit_height
+
+#returns true if the eroded base can still hold up the shape
+#same check as standing_after_erosion, but without touching the stat dictionaries
+def survives_erosion(shape, constants: Constants = None) -> bool:
+    return shape.height <= critical_height(shape, constants)
+
+#returns a boolean on if the castle is still standing after being eroded
+def standing_after_erosion(shape, wave) -> bool:
+    if survives_erosion(shape):
+        return True
+    else:
+        s = shape.string_name()
+        val = erosion_dict[s]
+        erosion_dict[s] = val + 1
+        return False
 
 #saturates the shape with rain
-def rain_on_shape(shape) -> float:
+#only depends on the part of the shape above the wave, so the shape remembers it between hits,
+# along with the constants it was worked out with
+def rain_on_shape(shape, constants: Constants = None) -> float:
+    if constants is None:
+        constants = current_constants()
+    cached = shape.cached_value("top", "rain_on_shape")
+    if cached is None or (cached[0] is not constants and cached[0] != constants):
+        cached = (constants, _rain_on_shape(shape, constants))
+        shape.cache_value("top", "rain_on_shape", cached)
+    return cached[1]
+
+def _rain_on_shape(shape, constants: Constants) -> float:
     area = 0
     vol = 0
     if type(shape) is shapes.Cube:
@@ -200,7 +280,7 @@ def rain_on_shape(shape) -> float:
         r = shape.get_radius_at_h(shape.radius, shape.base_height)
         area = r * r * math.pi
         vol = shape.get_top_vol()
-    return (area * AVG_RAINFALL_PER_WAVE) / vol
+    return (area * constants.rain_per_wave) / vol
 
 #returns true if shape is not oversaturated
 #updates dict accordingly
@@ -244,220 +324,215 @@ END_SHAPE_HEIGHT = 1.1 * SHAPE_HEIGHT
 INCREMENT = (END_SHAPE_HEIGHT - START_SHAPE_HEIGHT) / (R-1)
 
 
-
-
-#Cube loop
-#make an empty array to hold results
-cube_array = list()
+#returns the sweep knobs that configure can change
+def sweep_settings() -> dict:
+    return {"VOL": VOL, "R": R, "INC": INC, "MAX_WAVE_HITS": MAX_WAVE_HITS}
+
+#Changes the sweep knobs at the top of the file (any of VOL, R, INC, MAX_WAVE_HITS)
+# and works the loop values out again
+#returns the old knobs so they can be put back with configure(**old)
+def configure(**settings) -> dict:
+    global VOL, R, INC, MAX_WAVE_HITS
+    global HEIGHT_INCREMENT, DEPTH_INCREMENT, DIST_INCREMENT
+    global cube_length, SHAPE_HEIGHT, START_SHAPE_HEIGHT, END_SHAPE_HEIGHT, INCREMENT
+    old = sweep_settings()
+    for name in settings:
+        if name not in old:
+            raise ValueError("Unknown sweep setting: " + str(name))
+    if settings.get("R", R) < 2 or settings.get("INC", INC) < 2:
+        raise ValueError("R and INC have to be at least 2")
+    VOL = settings.get("VOL", VOL)
+    R = settings.get("R", R)
+    INC = settings.get("INC", INC)
+    MAX_WAVE_HITS = settings.get("MAX_WAVE_HITS", MAX_WAVE_HITS)
+    #Same loop values as above
+    HEIGHT_INCREMENT = (END_HEIGHT - START_HEIGHT) / INC
+    DEPTH_INCREMENT = (END_DEPTH - START_DEPTH) / INC
+    DIST_INCREMENT = (END_DISTANCE - START_DISTANCE) / INC
+    cube_length = VOL**(1/3)
+    SHAPE_HEIGHT = cube_length
+    START_SHAPE_HEIGHT = .9 * SHAPE_HEIGHT
+    END_SHAPE_HEIGHT = 1.1 * SHAPE_HEIGHT 
+    INCREMENT = (END_SHAPE_HEIGHT - START_SHAPE_HEIGHT) / (R-1)
+    return old
+
+
+#returns the range of shape-height steps swept for a shape
 #only one way to have a volume of VOL m^3 with a cube
-for s in range(1, 2):
-    #Make waves one cm at a time
-    for h in range(1, INC):
-        #now vary depth for wave break
-        for d in range(1, INC):
-            #now vary distance past the sandcastle
-            #print(d)
-            for dist in range(1, INC):
-                #Make a shape and a wave
-                side_length = VOL**(1/3)
-                cube = shapes.Cube(side_length)
-                #print(cube.side_length)
-                #Increment the wave values
-                wave_HEIGHT= (h * HEIGHT_INCREMENT) + START_HEIGHT
-                wave_DEPTH = (d * DEPTH_INCREMENT) + START_DEPTH
-                wave_DIST = (dist * DIST_INCREMENT) + START_DISTANCE
-
-                #make the wave
-                w = waves.Wave(wave_HEIGHT, wave_DEPTH, wave_DIST)
-                #Set the cube base_height
-                cube.set_base_height(w.wave_height)
-                saturation = INITIAL_SATURATION
-                #now commence the testing!
-                wave_hits = 0
-                while cube.base_radius > 0 and wave_hits < MAX_WAVE_HITS and castle_still_standing(cube, w) and not_oversaturated(cube, saturation):
-                    saturation = saturation + rain_on_shape(cube) #update the saturation by raining on the shape
-                    wave_hits +=1
-                    erode_shape(cube, w)
-                    #print("base_radius: " + str(cube.base_radius))
-                t = (wave_hits, cube, w)
-                cube_array.append(t)
-                #update dictionary
-                if cube.base_radius <= 0: 
-                    erosion_dict[cube.string_name()] = erosion_dict[cube.string_name()] + 1
-                    continue
-                elif wave_hits >= MAX_WAVE_HITS:  did_not_fall_dict[cube.string_name()] = did_not_fall_dict[cube.string_name()] + 1
-                
-                #print("Took " + str(wave_hits) + " to knock this cube over!")
-                #now add the results to the results_array
-
-print("Size of cube_array: " + str(len(cube_array)))
-
-
-#Cylinder loop
-#make an empty array to hold stuff
-cylinder_array = list()
-#time to permute our stuff
-for i in range(1, R):
-    #Make waves one cm at a time
-    for h in range(1, INC):
-        #now vary depth for wave break
-            for d in range(1, INC):
-                #now vary distance past the sandcastle
-                for dist in range(1, INC):
-                    #Make a shape and a wave
-                    height = (i * INCREMENT) + START_SHAPE_HEIGHT
-                    rad = math.sqrt((VOL) / (math.pi * height))
-                    cylinder = shapes.Cylinder(rad, height)
-                    #Increment the wave values
-                    wave_HEIGHT= (h * HEIGHT_INCREMENT) + START_HEIGHT
-                    wave_DEPTH = (d * DEPTH_INCREMENT) + START_DEPTH
-                    wave_DIST = (dist * DIST_INCREMENT) + START_DISTANCE
-
-                    #make the wave
-                    w = waves.Wave(wave_HEIGHT, wave_DEPTH, wave_DIST)
-                    cylinder.set_base_height(w.wave_height)
-                    saturation = INITIAL_SATURATION
-                    #now commence the testing!
-                    wave_hits = 0
-                    while cylinder.base_radius > 0 and wave_hits < MAX_WAVE_HITS and castle_still_standing(cylinder, w) and not_oversaturated(cylinder, saturation):
-                        saturation = saturation + rain_on_shape(cylinder) #update the saturation by raining on the shape
-                        wave_hits +=1
-                        #print("base_radius: " + str(cylinder.base_radius))
-                        erode_shape(cylinder, w)
-                    t = (wave_hits, cylinder, w)
-                    cylinder_array.append(t)
-                    #update dictionary
-                    if cylinder.base_radius <= 0:
-                        erosion_dict[cylinder.string_name()] = erosion_dict[cylinder.string_name()] + 1
-                        continue
-                    elif wave_hits >= MAX_WAVE_HITS: did_not_fall_dict[cylinder.string_name()] = did_not_fall_dict[cylinder.string_name()] + 1
-                    #now add the results to the results_array
-                    #print("Took " + str(wave_hits) + " to knock this cylinder over!")
-
-
-print("Size of cylinder_array: " + str(len(cylinder_array)))
-
-
-
-
-#Pyramid loop
-#make an empty array to hold stuff
-pyramid_array = list()
-#time to permute our stuff
-for h in range(1, R):
-    #Make waves one cm at a time
-    for h in range(1, INC):
-        #now vary depth for wave break
-            for d in range(1, INC):
-                #now vary distance past the sandcastle
-                for dist in range(1, INC):
-                    #Make a shape and a wave
-                    height = (h * INCREMENT) + START_SHAPE_HEIGHT
-                    length = ((3 * VOL) / height)**.5
-                    pyramid = shapes.Pyramid(length, height)
-                    #Increment the wave values
-                    wave_HEIGHT= (h * HEIGHT_INCREMENT) + START_HEIGHT
-                    wave_DEPTH = (d * DEPTH_INCREMENT) + START_DEPTH
-                    wave_DIST = (dist * DIST_INCREMENT) + START_DISTANCE
-
-                    #make the wave
-                    w = waves.Wave(wave_HEIGHT, wave_DEPTH, wave_DIST)
-                    saturation = INITIAL_SATURATION
-                    #now commence the testing!
-                    wave_hits = 0
-                    while pyramid.base_radius > 0 and wave_hits < MAX_WAVE_HITS and castle_still_standing(pyramid, w) and not_oversaturated(pyramid, saturation):
-                        saturation = saturation + rain_on_shape(pyramid) #update the saturation by raining on the shape
-                        wave_hits +=1
-                        #print("base_radius: " + str(pyramid.base_radius))
-                        erode_shape(pyramid, w)
-                    t = (wave_hits, pyramid, w)
-                    pyramid_array.append(t)
-                    #update dict
-                    if pyramid.base_radius <= 0: 
-                        erosion_dict[pyramid.string_name()] = erosion_dict[pyramid.string_name()] + 1
-                        continue
-                    elif wave_hits >= MAX_WAVE_HITS: did_not_fall_dict[pyramid.string_name()] = did_not_fall_dict[pyramid.string_name()] + 1
-                        
-
-                    #now add the results to the results_array
-                    #print("Took " + str(wave_hits) + " to knock this pyramid over!")
-
-print("Size of pyramid_array: " + str(len(pyramid_array)))
-
-
-
-
-#Cone loop
-#make an empty array to hold stuff
-cone_array = list()
-#time to permute our stuff
-for i in range(1, R):
-    #Make waves one cm at a time
-    for h in range(1, INC):
-        #now vary depth for wave break
+def shape_steps(shape_name: str) -> range:
+    if shape_name == "cube":
+        return range(1, 2)
+    return range(1, R)
+
+#builds the shape for step i of the shape-height sweep
+def build_shape(shape_name: str, i: int):
+    #Increment height and get the other dimension from that
+    height = (i * INCREMENT) + START_SHAPE_HEIGHT
+    return shape_with_height(shape_name, height)
+
+#builds a shape of the given height out of VOL m^3 of sand (a cube ignores the height)
+def shape_with_height(shape_name: str, height: float):
+    if shape_name == "cube":
+        side_length = VOL**(1/3)
+        return shapes.Cube(side_length)
+    if shape_name == "cylinder":
+        rad = math.sqrt((VOL) / (math.pi * height))
+        return shapes.Cylinder(rad, height)
+    elif shape_name == "pyramid":
+        length = ((3 * VOL) / height)**.5
+        return shapes.Pyramid(length, height)
+    elif shape_name == "cone":
+        rad = math.sqrt((3 * VOL) / (math.pi * height))
+        return shapes.Cone(rad, height)
+    raise ValueError("Unknown shape: " + str(shape_name))
+
+#builds the wave for wave-grid point (h, d, dist)
+def build_wave(h: int, d: int, dist: int):
+    #Increment the wave values
+    wave_HEIGHT= (h * HEIGHT_INCREMENT) + START_HEIGHT
+    wave_DEPTH = (d * DEPTH_INCREMENT) + START_DEPTH
+    wave_DIST = (dist * DIST_INCREMENT) + START_DISTANCE
+    return waves.Wave(wave_HEIGHT, wave_DEPTH, wave_DIST)
+
+#yields (i, h, d, dist) grid points in the order the sweep loops visit them
+def sweep_points(shape_name: str):
+    for i in shape_steps(shape_name):
+        #Make waves one cm at a time
+        for h in range(1, INC):
+            #now vary depth for wave break
             for d in range(1, INC):
                 #now vary distance past the sandcastle
                 for dist in range(1, INC):
-                    #Make a shape and a wave
-                    #Increment height and get the radius from that
-                    height = (i * INCREMENT) + START_SHAPE_HEIGHT
-                    rad = math.sqrt((3 * VOL) / (math.pi * height))
-                    #build the shape
-                    cone = shapes.Cone(rad, height)
-                    #Increment the wave values
-                    wave_HEIGHT= (h * HEIGHT_INCREMENT) + START_HEIGHT
-                    wave_DEPTH = (d * DEPTH_INCREMENT) + START_DEPTH
-                    wave_DIST = (dist * DIST_INCREMENT) + START_DISTANCE
-
-                    #make the wave
-                    w = waves.Wave(wave_HEIGHT, wave_DEPTH, wave_DIST)
-                    #Set the cone's base_height field
-                    cone.set_base_height(w.wave_height)
-                    saturation = INITIAL_SATURATION 
-                    #now commence the testing!
-                    wave_hits = 0
-                    while cone.base_radius > 0 and wave_hits < MAX_WAVE_HITS and castle_still_standing(cone, w) and not_oversaturated(cone, saturation):
-                        saturation = saturation + rain_on_shape(cone) #update the saturation by raining on the shape
-                        wave_hits +=1
-                        erode_shape(cone, w)
-                    t = (wave_hits, cone, w)
-                    cone_array.append(t)
-                    #Update dict
-                    if cone.base_radius <= 0: 
-                        erosion_dict[cone.string_name()] = erosion_dict[cone.string_name()] + 1
-                        continue
-                    elif wave_hits >= MAX_WAVE_HITS: did_not_fall_dict[cone.string_name()] = did_not_fall_dict[cone.string_name()] + 1
-                    #now add the results to the results_array
-                    #print(str(cone))
-                    #print("Took " + str(wave_hits) + " to knock this cone over!")
-                    #print(str(w))
-
-print("Size of cone_array: " + str(len(cone_array)))
-
-
-def get_statistics(shape_array):
-    average = average_wave_hits()
+                    yield (i, h, d, dist)
+
+#hits the shape with the same wave until it falls or survives MAX_WAVE_HITS
+#returns (wave_hits, cause) and adds the cause to counts (the module dictionaries by default)
+#constants (a Constants, the module constants by default) are looked up once for the whole castle
+def simulate_castle(shape, w, counts = None, max_wave_hits: int = None, constants: Constants = None) -> tuple:
+    if counts is None:
+        counts = outcome_counts
+    if max_wave_hits is None:
+        max_wave_hits = MAX_WAVE_HITS
+    if constants is None:
+        constants = current_constants()
+    #Set the shape's base_height field
+    shape.set_base_height(w.wave_height)
+    saturation = constants.initial_saturation
+    #now commence the testing!
+    wave_hits = 0
+    #Same checks as castle_still_standing and not_oversaturated, in the same order
+    while True:
+        if shape.base_radius <= 0:
+            cause = "erosion"
+        elif wave_hits >= max_wave_hits:
+            cause = "did_not_fall"
+        elif not survives_wave_hit(shape, w, constants):
+            cause = "knockout"
+        elif not survives_erosion(shape, constants):
+            cause = "erosion"
+        elif saturation > constants.oversaturated:
+            cause = "rain"
+        else:
+            saturation = saturation + rain_on_shape(shape, constants) #update the saturation by raining on the shape
+            wave_hits +=1
+            erode_shape(shape, w, constants)
+            continue
+        break
+    #update dictionary
+    counts.add(shape.string_name(), cause)
+    return (wave_hits, cause)
+
+#hits the shape with each wave of a wave train until it falls or the train runs out
+#train yields (timestamp, Wave) pairs, one per wave, and is only read as far as needed
+#returns (wave_hits, cause, timestamp) with the time the castle fell, or None if it never did
+def simulate_wave_train(shape, train, counts = None, constants: Constants = None) -> tuple:
+    if counts is None:
+        counts = outcome_counts
+    if constants is None:
+        constants = current_constants()
+    saturation = constants.initial_saturation
+    wave_hits = 0
+    cause = None
+    timestamp = None
+    for (timestamp, w) in train:
+        #the part of the castle being hit changes with every wave height
+        shape.set_base_height(w.wave_height)
+        #Same checks as simulate_castle, in the same order
+        if shape.base_radius <= 0:
+            cause = "erosion"
+        elif not survives_wave_hit(shape, w, constants):
+            cause = "knockout"
+        elif not survives_erosion(shape, constants):
+            cause = "erosion"
+        elif saturation > constants.oversaturated:
+            cause = "rain"
+        if cause is not None:
+            break
+        saturation = saturation + rain_on_shape(shape, constants) #update the saturation by raining on the shape
+        wave_hits +=1
+        erode_shape(shape, w, constants)
+    if cause is None:
+        if wave_hits > 0 and shape.base_radius <= 0:
+            #eroded away by the very last wave
+            cause = "erosion"
+            timestamp = timestamp + constants.time_per_wave
+        else:
+            cause = "did_not_fall"
+            timestamp = None
+    counts.add(shape.string_name(), cause)
+    return (wave_hits, cause, timestamp)
+
+#runs the whole sweep for one shape
+#every castle is also added to sweep_stats (a stats.SweepStats) as it finishes, if one is given
+#returns a records.RunRecords with a (wave_hits, shape, wave) row per castle
+def shape_loop(shape_name: str, counts = None, sweep_stats = None) -> records.RunRecords:
+    #make an empty array to hold results
+    results = records.RunRecords(shape_name)
+    for (i, h, d, dist) in sweep_points(shape_name):
+        #Make a shape and a wave
+        shape = build_shape(shape_name, i)
+        w = build_wave(h, d, dist)
+        (wave_hits, cause) = simulate_castle(shape, w, counts)
+        #now add the results to the results_array
+        results.append(wave_hits, cause, shape, w)
+        if sweep_stats is not None:
+            sweep_stats.add(shape_name, wave_hits, cause)
+    return results
+
+
+#returns a stats.SweepStats (mean, variance, min/max, histogram and quantiles of the wave hits,
+# overall and per failure cause) of a records.RunRecords from shape_loop
+def get_statistics(shape_array) -> stats.SweepStats:
+    return stats.from_castles(shape_array.shape_name, shape_array.wave_hits,
+                              [outcomes.CAUSES[cause] for cause in shape_array.causes], MAX_WAVE_HITS)
 
 
 #returns the average number of wave hits for a particular array of shapes
 def average_wave_hits(shape_array) -> float:
+    if isinstance(shape_array, records.RunRecords):
+        return shape_array.average_wave_hits()
     sum = 0
     for datum in shape_array:
         sum = sum + datum[0]
     return (sum / len(shape_array))
 
 
-print("\n")
-print("Cube average: "  + str(average_wave_hits(cube_array)))
-print("Cylinder average: " + str(average_wave_hits(cylinder_array)))
-print("Pyramid average: " + str(average_wave_hits(pyramid_array)))
-print("Cone average: " + str(average_wave_hits(cone_array)))
-print("\n")
-
-print("Erosion stats: " + str(erosion_dict))
-print("Knockout stats: " + str(knockout_dict))
-print("Rain stats: " + str(fell_from_rain_dict))
-print("Still-standing stats: " + str(did_not_fall_dict))
-print("\n")
-
-
+if __name__ == "__main__":
+    cube_array = shape_loop("cube")
+    print("Size of cube_array: " + str(len(cube_array)))
+    cylinder_array = shape_loop("cylinder")
+    print("Size of cylinder_array: " + str(len(cylinder_array)))
+    pyramid_array = shape_loop("pyramid")
+    print("Size of pyramid_array: " + str(len(pyramid_array)))
+    cone_array = shape_loop("cone")
+    print("Size of cone_array: " + str(len(cone_array)))
+
+    print("\n")
+    print("Cube average: "  + str(average_wave_hits(cube_array)))
+    print("Cylinder average: " + str(average_wave_hits(cylinder_array)))
+    print("Pyramid average: " + str(average_wave_hits(pyramid_array)))
+    print("Cone average: " + str(average_wave_hits(cone_array)))
+    print("\n")
+
+    print(str(outcome_counts))
+    print("\n")
@@ -0,0 +1,119 @@
+import os
+import json
+import outcomes
+
+#Checkpoints for long sweeps
+#A checkpoint is a directory with a manifest.json (the sweep settings, engine, shapes and chunk
+# size) and one chunk-NNNNNN.json per finished chunk holding its wave hits, causes and outcome
+# counts. Chunks are saved as soon as they finish, each one written to a temporary file and
+# moved into place, so a crash or Ctrl-C only ever loses the chunks that were still running.
+#Resuming reads the manifest back, refuses to mix in chunks from a different sweep, and hands
+# back the finished chunks so the sweep only runs the rest; chunks are numbered the same way
+# every time, so the resumed result is the same as an uninterrupted one.
+
+'''
+CONSTANTS for use in the file
+'''
+CHECKPOINT_VERSION = 1 #bump when the file layout changes
+MANIFEST = "manifest.json"
+CHUNK_PREFIX = "chunk-"
+CHUNK_SIZE = 500 #castles per chunk when checkpointing; a chunk is the most a crash can lose per worker
+
+
+#returns the file name of a numbered chunk
+def chunk_file(number: int) -> str:
+    return CHUNK_PREFIX + str(number).zfill(6) + ".json"
+
+#writes data as JSON to path without ever leaving a half-written file there
+def write_json(path: str, data: dict):
+    temporary = path + ".tmp" + str(os.getpid())
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+#returns "name: saved -> new" for every setting that differs between two manifests, with the
+# scenario's knobs listed one by one
+def manifest_differences(saved: dict, manifest: dict) -> list:
+    differences = list()
+    for key in sorted(set(saved) | set(manifest)):
+        (old, new) = (saved.get(key), manifest.get(key))
+        if isinstance(old, dict) and isinstance(new, dict):
+            differences.extend(manifest_differences(old, new))
+        elif old != new:
+            differences.append(key + ": " + str(old) + " -> " + str(new))
+    return differences
+
+#Directory of finished chunks for one sweep
+class Checkpoint:
+    path: str
+    manifest: dict #settings, engine, shapes and chunk_size of the sweep, None until started
+
+    #Constructor; makes the directory if it isn't there yet
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = None
+        os.makedirs(path, exist_ok=True)
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "Checkpoint: " + self.path + " | finished chunks: " + str(len(self.finished_numbers()))
+
+    #returns the manifest saved in the directory, or None if there isn't one
+    def saved_manifest(self):
+        path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    #returns the numbers of the chunks saved in the directory
+    def finished_numbers(self) -> list:
+        numbers = list()
+        for name in os.listdir(self.path):
+            if name.startswith(CHUNK_PREFIX) and name.endswith(".json"):
+                try:
+                    numbers.append(int(name[len(CHUNK_PREFIX):-len(".json")]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    #Starts (or, with resume, picks up) the sweep described by manifest
+    #a resumed sweep has to match the saved manifest; an existing checkpoint is never overwritten
+    # without resume, so a finished run can't be thrown away by accident
+    def start(self, manifest: dict, resume: bool = False):
+        manifest = json.loads(json.dumps(dict(manifest, version=CHECKPOINT_VERSION)))
+        saved = self.saved_manifest()
+        if saved is None:
+            if self.finished_numbers():
+                raise ValueError("Checkpoint " + self.path + " has chunks but no " + MANIFEST)
+            write_json(os.path.join(self.path, MANIFEST), manifest)
+        elif not resume:
+            raise ValueError("Checkpoint " + self.path + " already exists; resume it or use another directory")
+        elif saved != manifest:
+            raise ValueError("Checkpoint " + self.path + " is for a different sweep (" +
+                             ", ".join(manifest_differences(saved, manifest)) + ")")
+        self.manifest = manifest
+
+    #returns the sweep.ChunkResult saved under a chunk number
+    def load_chunk(self, number: int):
+        import sweep
+        with open(os.path.join(self.path, chunk_file(number)), "r") as f:
+            data = json.load(f)
+        chunk = sweep.ChunkResult(data["shape"], data["start"])
+        chunk.wave_hits.extend(data["wave_hits"])
+        chunk.causes = bytes(data["causes"])
+        for cause in outcomes.CAUSES:
+            for (shape_name, n) in data["counts"][cause].items():
+                chunk.counts.add(shape_name, cause, n)
+        return chunk
+
+    #returns {chunk number: sweep.ChunkResult} for every saved chunk
+    def load_finished(self) -> dict:
+        return {number: self.load_chunk(number) for number in self.finished_numbers()}
+
+    #saves a finished chunk under its number
+    def save(self, number: int, chunk):
+        data = {"shape": chunk.shape_name, "start": chunk.start, "wave_hits": chunk.wave_hits.tolist(),
+                "causes": list(chunk.causes), "counts": chunk.counts.counts}
+        write_json(os.path.join(self.path, chunk_file(number)), data)
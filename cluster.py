@@ -0,0 +1,462 @@
+import os
+import sys
+import json
+import time
+import hmac
+import queue
+import socket
+import struct
+import threading
+import socketserver
+import subprocess
+from array import array
+from collections import deque
+import outcomes
+
+#Coordinator/worker mode for the sweep, over plain TCP sockets
+#The coordinator (sweep.run_parallel_sweep with a Coordinator) cuts the grid into chunks the
+# same way as always and leases them out to whichever workers ask. Workers can be on any host
+# that can reach it (`python sandcastle.py worker --connect host:port`). Each runs sweep.run_chunk
+# and sends back only the wave hits (4 bytes a castle), the causes (1 byte a castle) and the
+# outcome counts; the coordinator works out the stats and puts the chunks back in grid order, so
+# the castles, counts, means and spreads are the same as a local sweep. The quantiles aren't
+# always: they come from per-chunk t-digests merged together, and chunks here are capped at
+# CHUNK_SIZE, so they can come out a fraction of a wave hit off the local ones.
+#A lease is taken back and handed to someone else when its worker's connection drops, or when
+# it hasn't been heard from in lease_seconds (workers send a heartbeat while they run a chunk).
+# If the old worker turns up with the chunk after all, whichever copy comes first is kept.
+#Every chunk lease carries the scenario (scenario.Scenario as a dict) and engine of the sweep,
+# so workers always run with the coordinator's knobs and constants, whatever their files say.
+#Messages are framed as two big-endian lengths, a JSON header and a binary payload.
+#NOTE: there is no encryption; bind to a private network and set a token (SANDCASTLE_TOKEN)
+#      when the workers aren't on the same box
+
+'''
+CONSTANTS for use in the file
+'''
+DEFAULT_PORT = 5577
+TOKEN_VAR = "SANDCASTLE_TOKEN" #environment variable the token is read from when none is given
+CHUNK_SIZE = 500 #castles per chunk at most; a lost worker costs at most a chunk
+LEASE_SECONDS = 60.0 #a lease with no heartbeat for this long goes to another worker
+HEARTBEAT_SECONDS = 10.0 #how often a worker says it's still on its chunk
+WAIT_SECONDS = 0.5 #how long a worker waits before asking again when there's nothing to lease
+CHECK_SECONDS = 1.0 #how often the coordinator looks for expired leases
+PREFETCH = 64 #chunks queued up for workers ahead of time
+CONNECT_SECONDS = 30.0 #how long a worker keeps trying to reach the coordinator
+IDLE_SECONDS = 120.0 #a sweep gives up after this long with no worker connected
+MAX_HEADER = 16 * 1024 * 1024 #bytes | bigger frames are refused
+MAX_PAYLOAD = 256 * 1024 * 1024
+FRAME = struct.Struct("!II") #header length, payload length
+
+
+#returns (host, port) from "host:port", "host" or ":port"
+def parse_address(text: str) -> tuple:
+    (host, colon, port) = text.rpartition(":")
+    if not colon:
+        return (text, DEFAULT_PORT)
+    return (host or "127.0.0.1", int(port))
+
+#returns the token to use: the one given, or SANDCASTLE_TOKEN, or "" for none
+def resolve_token(token: str = None) -> str:
+    if token is None:
+        token = os.environ.get(TOKEN_VAR, "")
+    return token
+
+
+'''
+Framing
+'''
+#sends a message: a JSON header and an optional binary payload
+def send_message(sock, header: dict, payload: bytes = b""):
+    data = json.dumps(header).encode()
+    sock.sendall(FRAME.pack(len(data), len(payload)) + data + payload)
+
+#returns exactly n bytes from the socket, or None if it closed first
+def recv_exactly(sock, n: int):
+    chunks = list()
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n = n - len(chunk)
+    return b"".join(chunks)
+
+#returns the next message as (header, payload), or None if the socket closed
+def recv_message(sock):
+    frame = recv_exactly(sock, FRAME.size)
+    if frame is None:
+        return None
+    (header_length, payload_length) = FRAME.unpack(frame)
+    if header_length > MAX_HEADER or payload_length > MAX_PAYLOAD:
+        raise ValueError("Message too big: " + str(header_length) + " + " + str(payload_length) + " bytes")
+    header = recv_exactly(sock, header_length)
+    payload = recv_exactly(sock, payload_length) if payload_length > 0 else b""
+    if header is None or payload is None:
+        return None
+    return (json.loads(header.decode()), payload)
+
+
+'''
+Chunk results on the wire
+'''
+#returns (header, payload) for a finished sweep.ChunkResult
+def encode_result(chunk_result) -> tuple:
+    hits = array("i", chunk_result.wave_hits)
+    if sys.byteorder == "big":
+        hits.byteswap()
+    header = {"shape": chunk_result.shape_name, "start": chunk_result.start, "castles": len(hits),
+              "counts": chunk_result.counts.counts}
+    return (header, hits.tobytes() + bytes(chunk_result.causes))
+
+#returns the sweep.ChunkResult from encode_result's (header, payload); its stats are worked out
+# when it's added to the sweep
+def decode_result(header: dict, payload: bytes):
+    import sweep
+    castles = header["castles"]
+    if len(payload) != 5 * castles:
+        raise ValueError("Chunk payload is " + str(len(payload)) + " bytes, expected " + str(5 * castles))
+    hits = array("i")
+    hits.frombytes(payload[:4 * castles])
+    if sys.byteorder == "big":
+        hits.byteswap()
+    chunk_result = sweep.ChunkResult(header["shape"], header["start"])
+    chunk_result.wave_hits.extend(hits.tolist())
+    chunk_result.causes = bytes(payload[4 * castles:])
+    for cause in outcomes.CAUSES:
+        for (shape_name, n) in header["counts"][cause].items():
+            chunk_result.counts.add(shape_name, cause, n)
+    return chunk_result
+
+
+#Handles one worker's connection to the coordinator
+class WorkerHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        hello = recv_message(self.request)
+        if hello is None or hello[0].get("type") != "hello":
+            return
+        token = str(hello[0].get("token", ""))
+        if not hmac.compare_digest(token.encode(), coordinator.token.encode()):
+            send_message(self.request, {"type": "refused", "reason": "bad token"})
+            return
+        name = str(hello[0].get("name", "worker")) + "@" + self.client_address[0] + ":" + str(self.client_address[1])
+        send_message(self.request, {"type": "welcome", "name": name})
+        coordinator.connected(name)
+        try:
+            while True:
+                message = recv_message(self.request)
+                if message is None:
+                    break
+                (header, payload) = message
+                kind = header.get("type")
+                if kind == "lease":
+                    send_message(self.request, coordinator.lease(name))
+                elif kind == "heartbeat":
+                    coordinator.heartbeat(name)
+                elif kind == "result":
+                    coordinator.finish(name, header, payload)
+        except (OSError, ValueError):
+            pass
+        finally:
+            coordinator.release(name)
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+#Hands out chunks of sweeps to workers and collects what they send back
+class Coordinator:
+    address: tuple #(host, port) it listens on
+    token: str
+    lease_seconds: float
+    server: CoordinatorServer
+    lock: threading.Condition #guards everything below
+    sweep_id: int #number of the sweep being run, 0 before the first
+    chunks: list #(shape_name, start, stop) of the sweep being run, None between sweeps
+    engine: str
+    scenario: dict #scenario.Scenario of the sweep as a dict
+    pending: deque #chunk numbers waiting for a worker
+    known: dict #chunk number -> run_chunk's known list, for the chunks queued or leased
+    leases: dict #chunk number -> (worker name, deadline)
+    done: set #chunk numbers sent back this sweep
+    results: queue.Queue #(chunk number, ChunkResult) for run to hand on
+    workers: dict #worker name -> chunks it sent back, for every worker that ever connected
+    connections: int #workers connected right now
+    idle_since: float #monotonic time the last worker went away, None while one is connected
+    released: int #leases taken back from lost or silent workers
+    closing: bool
+
+    #Constructor; port 0 picks a free port (see address)
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, token: str = None,
+                 lease_seconds: float = LEASE_SECONDS):
+        self.token = resolve_token(token)
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Condition()
+        self.sweep_id = 0
+        self.chunks = None
+        self.engine = None
+        self.scenario = None
+        self.pending = deque()
+        self.known = dict()
+        self.leases = dict()
+        self.done = set()
+        self.results = queue.Queue()
+        self.workers = dict()
+        self.connections = 0
+        self.idle_since = time.monotonic()
+        self.released = 0
+        self.closing = False
+        self.server = CoordinatorServer((host, port), WorkerHandler)
+        self.server.coordinator = self
+        self.address = self.server.server_address[:2]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        with self.lock:
+            finished = sum(self.workers.values())
+            return "Coordinator: " + self.address[0] + ":" + str(self.address[1]) + " | workers: " + \
+                   str(len(self.workers)) + " | chunks finished: " + str(finished) + " | re-leased: " + str(self.released)
+
+    #returns the address as "host:port"
+    def address_text(self) -> str:
+        return self.address[0] + ":" + str(self.address[1])
+
+    #Stops listening; workers asking for more are told there's nothing left (their connections drop)
+    def close(self):
+        with self.lock:
+            self.closing = True
+        self.server.shutdown()
+        self.server.server_close()
+
+    '''
+    Called from the connection threads
+    '''
+    def connected(self, name: str):
+        with self.lock:
+            self.workers.setdefault(name, 0)
+            self.connections += 1
+            self.idle_since = None
+
+    #returns the message answering a worker's lease request
+    def lease(self, name: str) -> dict:
+        with self.lock:
+            if self.closing:
+                return {"type": "done"}
+            if self.chunks is None or not self.pending:
+                return {"type": "wait", "seconds": WAIT_SECONDS}
+            number = self.pending.popleft()
+            self.leases[number] = (name, time.monotonic() + self.lease_seconds)
+            return {"type": "chunk", "sweep": self.sweep_id, "number": number, "chunk": list(self.chunks[number]),
+                    "engine": self.engine, "scenario": self.scenario, "known": self.known[number]}
+
+    #pushes back the deadline of every lease a worker holds
+    def heartbeat(self, name: str):
+        with self.lock:
+            deadline = time.monotonic() + self.lease_seconds
+            for (number, (holder, old)) in self.leases.items():
+                if holder == name:
+                    self.leases[number] = (holder, deadline)
+
+    #takes a finished chunk from a worker; late copies and chunks of an old sweep are dropped
+    def finish(self, name: str, header: dict, payload: bytes):
+        chunk_result = decode_result(header, payload)
+        with self.lock:
+            number = header.get("number")
+            if header.get("sweep") != self.sweep_id or self.chunks is None or number in self.done:
+                return
+            (shape_name, start, stop) = self.chunks[number]
+            if (chunk_result.shape_name, chunk_result.start, len(chunk_result.wave_hits)) != (shape_name, start, stop - start):
+                raise ValueError("Worker " + name + " sent back the wrong castles for chunk " + str(number))
+            self.done.add(number)
+            self.leases.pop(number, None)
+            self.known.pop(number, None)
+            if number in self.pending:
+                self.pending.remove(number)
+            self.workers[name] = self.workers.get(name, 0) + 1
+        self.results.put((number, chunk_result))
+
+    #puts every chunk a worker was holding back at the front of the queue (its connection is gone)
+    def release(self, name: str):
+        with self.lock:
+            self.connections -= 1
+            if self.connections == 0:
+                self.idle_since = time.monotonic()
+            for (number, (holder, deadline)) in list(self.leases.items()):
+                if holder == name:
+                    del self.leases[number]
+                    self.pending.appendleft(number)
+                    self.released += 1
+
+    #puts the chunks whose workers have gone quiet back at the front of the queue
+    def expire(self):
+        with self.lock:
+            now = time.monotonic()
+            for (number, (holder, deadline)) in list(self.leases.items()):
+                if deadline < now:
+                    del self.leases[number]
+                    self.pending.appendleft(number)
+                    self.released += 1
+
+    '''
+    Called by sweep.run_parallel_sweep
+    '''
+    #Runs the chunk numbers in todo on the workers
+    #known_for(number) returns run_chunk's known list for a chunk; it's only called from this
+    # thread, PREFETCH chunks ahead of the workers, so it can use a result cache
+    #yields (chunk number, ChunkResult) as they come back, in whatever order that is
+    def run(self, chunks: list, todo: list, engine: str, known_for):
+        import scenario
+        while not self.results.empty():
+            self.results.get()
+        with self.lock:
+            self.sweep_id += 1
+            self.chunks = chunks
+            self.engine = engine
+            self.scenario = scenario.current().to_dict()
+            self.pending = deque()
+            self.known = dict()
+            self.leases = dict()
+            self.done = set()
+        waiting = deque(todo)
+        remaining = len(todo)
+        try:
+            while remaining > 0:
+                while waiting and len(self.pending) < PREFETCH:
+                    number = waiting.popleft()
+                    known = known_for(number)
+                    with self.lock:
+                        self.known[number] = known
+                        self.pending.append(number)
+                try:
+                    yield self.results.get(timeout=CHECK_SECONDS)
+                    remaining -= 1
+                except queue.Empty:
+                    self.expire()
+                    with self.lock:
+                        idle = self.idle_since is not None and time.monotonic() - self.idle_since > IDLE_SECONDS
+                    if idle:
+                        raise RuntimeError("No worker has been connected to " + self.address_text() + " for " +
+                                           str(round(IDLE_SECONDS)) + " s")
+        finally:
+            with self.lock:
+                self.chunks = None
+                self.pending = deque()
+                self.known = dict()
+                self.leases = dict()
+
+
+'''
+Workers
+'''
+#Sends heartbeats for a worker while it runs a chunk
+class Heartbeat:
+    sock: socket.socket
+    send_lock: threading.Lock
+    stopped: threading.Event
+    thread: threading.Thread
+
+    #Constructor; starts sending
+    def __init__(self, sock, send_lock: threading.Lock, seconds: float = HEARTBEAT_SECONDS):
+        self.sock = sock
+        self.send_lock = send_lock
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, args=(seconds,), daemon=True)
+        self.thread.start()
+
+    def beat(self, seconds: float):
+        while not self.stopped.wait(seconds):
+            try:
+                with self.send_lock:
+                    send_message(self.sock, {"type": "heartbeat"})
+            except OSError:
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+#returns a socket connected to the coordinator, trying again for up to seconds
+def connect(host: str, port: int, seconds: float = CONNECT_SECONDS):
+    deadline = time.monotonic() + seconds
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+#Runs chunks for the coordinator at host:port until it has nothing left or goes away
+#returns how many chunks this worker ran
+def run_worker(host: str, port: int, token: str = None, name: str = None) -> int:
+    import sweep
+    import scenario
+    if name is None:
+        name = socket.gethostname() + "-" + str(os.getpid())
+    sock = connect(host, port)
+    send_lock = threading.Lock()
+    ran = 0
+    try:
+        send_message(sock, {"type": "hello", "name": name, "token": resolve_token(token)})
+        reply = recv_message(sock)
+        if reply is None or reply[0].get("type") != "welcome":
+            raise ValueError("The coordinator refused this worker: " + str(reply[0] if reply else "connection closed"))
+        sweep_id = None
+        while True:
+            with send_lock:
+                send_message(sock, {"type": "lease"})
+            reply = recv_message(sock)
+            if reply is None or reply[0]["type"] == "done":
+                break
+            header = reply[0]
+            if header["type"] == "wait":
+                time.sleep(header["seconds"])
+                continue
+            if header["sweep"] != sweep_id:
+                scenario.from_dict(header["scenario"]).apply()
+                sweep_id = header["sweep"]
+            heartbeat = Heartbeat(sock, send_lock)
+            try:
+                chunk_result = sweep.run_chunk(tuple(header["chunk"]), header["engine"], None, header["known"])
+            finally:
+                heartbeat.stop()
+            (result_header, payload) = encode_result(chunk_result)
+            result_header.update({"type": "result", "sweep": sweep_id, "number": header["number"]})
+            with send_lock:
+                send_message(sock, result_header, payload)
+            ran += 1
+    except OSError:
+        #the coordinator went away; whatever this worker was holding gets leased again
+        pass
+    finally:
+        sock.close()
+    return ran
+
+#Starts count worker processes on this machine connected to the coordinator, standing in for
+# other hosts (each is `python sandcastle.py worker`)
+#returns the subprocess.Popen of every worker
+def spawn_local_workers(address: tuple, count: int, token: str = None) -> list:
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandcastle.py")
+    env = dict(os.environ)
+    env[TOKEN_VAR] = resolve_token(token)
+    workers = list()
+    for k in range(count):
+        command = [sys.executable, script, "worker", "--connect", address[0] + ":" + str(address[1]),
+                   "--name", "local-" + str(k + 1)]
+        workers.append(subprocess.Popen(command, env=env))
+    return workers
+
+#waits for local workers to finish, killing the ones that don't within seconds
+def stop_local_workers(workers: list, seconds: float = 10.0):
+    deadline = time.monotonic() + seconds
+    for worker in workers:
+        try:
+            worker.wait(max(deadline - time.monotonic(), 0.1))
+        except subprocess.TimeoutExpired:
+            worker.kill()
+            worker.wait()
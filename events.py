@@ -0,0 +1,271 @@
+import math
+import heapq
+import random
+import castle_test as ct
+import wave as waves
+import fast_forward
+
+#Discrete-event simulation of a castle hit by waves, rain and tides
+#Instead of stepping one wave every TIME_PER_WAVE seconds, everything that happens on the beach
+# is an event in a priority queue ordered by time:
+#  - "waves": a run of identical waves, the first at the event time and then one every time_per_wave
+#  - "rain": a rain burst starting or stopping; the rain of every wave is multiplied by 1 plus the
+#    extra rain of every burst going on
+#  - "tide": the tide level changing; the water runs (level - reference) / BEACH_SLOPE meters
+#    further up the beach, so the waves reach further past the castle, or not at all
+#Each run of waves is only split where a rain or tide event actually changes something, and
+# the piece in between is fast-forwarded with fast_forward.advance. Waves that don't reach the
+# castle (the tide is out) are skipped all at once, only their rain lands on it.
+#Event sources (wave runs, tides, rain bursts) are generators that are only read one event
+# ahead, so a year of buoy data never sits in the queue.
+#With no rain bursts and no tides this is exactly wave_train.simulate_runs.
+
+'''
+CONSTANTS for use in the file
+'''
+EVENT_KINDS = ["tide", "rain", "waves"] #at the same time, earlier kinds go first
+BEACH_SLOPE = 0.05 #rise over run of the beach | 1 m of tide moves the water 20 m up the beach
+FEET = 0.3048 #meters in a foot; the buoy files give TIDE in feet
+TIDE_PERIOD = 12.42 * 60 * 60 #seconds | principal lunar semidiurnal tide (M2)
+TIDE_AMPLITUDE = 0.5 #meters | for synthetic tides
+TIDE_STEP = 10 * 60 #seconds between synthetic tide events
+STORM_HOURS = 2.0 #average length of a random rain burst
+
+
+#Priority queue of timed events fed by event sources
+class Scheduler:
+    queue: list #heap of (time, kind priority, sequence number, kind, data, source)
+    sequence: int #ties broken by the order events were pushed
+    processed: dict #kind -> events popped
+
+    #Constructor
+    def __init__(self):
+        self.queue = list()
+        self.sequence = 0
+        self.processed = {kind: 0 for kind in EVENT_KINDS}
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    #adds an event; source is the iterator to take that kind's next event from once it's popped
+    def push(self, time: float, kind: str, data, source = None):
+        heapq.heappush(self.queue, (time, EVENT_KINDS.index(kind), self.sequence, kind, data, source))
+        self.sequence += 1
+
+    #adds a source of (time, data) events of one kind, in time order
+    def add_source(self, kind: str, events):
+        if kind not in EVENT_KINDS:
+            raise ValueError("Unknown event kind: " + str(kind))
+        self.push_next(kind, iter(events))
+
+    #pushes the next event of a source, if it has one
+    def push_next(self, kind: str, source):
+        for (time, data) in source:
+            self.push(time, kind, data, source)
+            return
+
+    #removes and returns the next event as (time, kind, data)
+    def pop(self) -> tuple:
+        (time, priority, sequence, kind, data, source) = heapq.heappop(self.queue)
+        self.processed[kind] += 1
+        if source is not None:
+            self.push_next(kind, source)
+        return (time, kind, data)
+
+    #returns true if there is an event of a kind in the queue
+    def has(self, kind: str) -> bool:
+        return any(event[3] == kind for event in self.queue)
+
+    #returns the time of the next event, or inf if there isn't one
+    def next_time(self) -> float:
+        if not self.queue:
+            return math.inf
+        return self.queue[0][0]
+
+
+#One castle on a beach of events
+class EventSimulation:
+    shape: object
+    scheduler: Scheduler
+    time_per_wave: float
+    slope: float
+    tide_reference: float #tide level the waves' distances are measured at
+    saturation: float
+    wave_hits: int
+    waves_skipped: int #waves that didn't reach the castle
+    bursts: list #extra rain of every burst going on
+    tide_shift: float #meters the water reaches past where it would at tide_reference
+
+    #Constructor
+    #runs yields (timestamp, Wave, count) like wave_train.buoy_runs, tides (timestamp, level in m)
+    # and rain (timestamp, extra rain) for a burst starting and (timestamp, -extra rain) for it stopping
+    #time_per_wave defaults to castle_test.TIME_PER_WAVE
+    def __init__(self, shape, runs, tides = None, rain = None, time_per_wave: float = None,
+                 slope: float = BEACH_SLOPE, tide_reference: float = 0.0):
+        if slope <= 0:
+            raise ValueError("The beach slope has to be above 0")
+        self.shape = shape
+        self.scheduler = Scheduler()
+        self.scheduler.add_source("waves", ((t, (w, count)) for (t, w, count) in runs))
+        if tides is not None:
+            self.scheduler.add_source("tide", tides)
+        if rain is not None:
+            self.scheduler.add_source("rain", rain)
+        self.time_per_wave = time_per_wave if time_per_wave is not None else ct.TIME_PER_WAVE
+        self.slope = slope
+        self.tide_reference = tide_reference
+        self.saturation = ct.INITIAL_SATURATION
+        self.wave_hits = 0
+        self.waves_skipped = 0
+        self.bursts = list()
+        self.tide_shift = 0.0
+
+    #to_string method for pretty printing
+    def __str__(self):
+        processed = self.scheduler.processed
+        return "Events: " + ", ".join(kind + " " + str(processed[kind]) for kind in EVENT_KINDS) + \
+               " | wave hits: " + str(self.wave_hits) + " | waves skipped: " + str(self.waves_skipped)
+
+    #returns how much the rain of every wave is multiplied by right now
+    def rain_multiplier(self) -> float:
+        return 1.0 + sum(self.bursts)
+
+    #applies a rain or tide event
+    def change(self, kind: str, data):
+        if kind == "tide":
+            self.tide_shift = (data - self.tide_reference) / self.slope
+        elif data > 0:
+            self.bursts.append(data)
+        elif -data in self.bursts:
+            self.bursts.remove(-data)
+
+    #Lets count waves go by without reaching the castle; their rain still lands on it
+    #returns the number of the wave the castle fell to the rain at, or None if it didn't
+    def skip(self, w, count: int):
+        if self.saturation > ct.OVERSATURATED:
+            return 0
+        self.waves_skipped += count
+        self.shape.set_base_height(w.wave_height)
+        rain = ct.rain_on_shape(self.shape) * self.rain_multiplier()
+        if rain <= 0:
+            return None
+        crossing = fast_forward.first_crossing(self.saturation, rain, ct.OVERSATURATED, count - 1)
+        if crossing is not None:
+            self.waves_skipped -= count - crossing
+            self.saturation = fast_forward.repeat_add(self.saturation, rain, crossing)
+            return crossing
+        self.saturation = fast_forward.repeat_add(self.saturation, rain, count)
+        return None
+
+    #Runs the events until the castle falls or they run out
+    #returns (wave_hits, cause, timestamp) with the time the castle fell, or None if it never did,
+    # and adds the cause to counts (the castle_test dictionaries by default)
+    def run(self, counts = None) -> tuple:
+        if counts is None:
+            counts = ct.outcome_counts
+        (wave_hits, cause, timestamp) = self.events()
+        counts.add(self.shape.string_name(), cause)
+        return (wave_hits, cause, timestamp)
+
+    #the event loop for run
+    def events(self) -> tuple:
+        scheduler = self.scheduler
+        end_time = None
+        eroded_away = False #the base was worn to nothing by the last wave that reached the castle
+        while len(scheduler) > 0:
+            (t, kind, data) = scheduler.pop()
+            if kind != "waves":
+                self.change(kind, data)
+                if not scheduler.has("waves"):
+                    break
+                continue
+            (w, count) = data
+            #only the waves before the next rain or tide change go in one piece
+            n = count
+            upcoming = scheduler.next_time()
+            if upcoming < t + count * self.time_per_wave:
+                n = max(int(math.ceil((upcoming - t) / self.time_per_wave)), 1)
+                if n < count:
+                    scheduler.push(t + n * self.time_per_wave, "waves", (w, count - n))
+                else:
+                    n = count
+            distance = w.wave_distance_past_castle + self.tide_shift
+            if distance <= 0:
+                fell = self.skip(w, n)
+                if fell is not None:
+                    return (self.wave_hits, "rain", t + fell * self.time_per_wave)
+                end_time = t + n * self.time_per_wave
+                continue
+            if eroded_away:
+                #it falls when the next wave gets to it
+                return (self.wave_hits, "erosion", t)
+            if distance != w.wave_distance_past_castle:
+                w = waves.Wave(w.wave_height, w.break_depth, distance)
+            self.shape.set_base_height(w.wave_height)
+            (taken, cause, self.saturation) = fast_forward.advance(self.shape, w, n, self.saturation,
+                                                                   self.rain_multiplier())
+            self.wave_hits = self.wave_hits + taken
+            end_time = t + n * self.time_per_wave
+            if cause is None:
+                continue
+            if cause == "erosion" and taken == n and n > 0:
+                eroded_away = True
+                continue
+            return (self.wave_hits, cause, t + taken * self.time_per_wave)
+        if eroded_away:
+            return (self.wave_hits, "erosion", end_time)
+        return (self.wave_hits, "did_not_fall", None)
+
+
+'''
+Event sources
+'''
+#yields (timestamp, level in m) every time the TIDE column of a buoy file changes
+def buoy_tides(data):
+    last = None
+    for (t, feet) in zip(data["time"].tolist(), data["TIDE"].tolist()):
+        if math.isnan(feet) or feet == last:
+            continue
+        last = feet
+        yield (t, feet * FEET)
+
+#returns the average tide level of a buoy file in m, or 0.0 if it has no tide readings
+def buoy_tide_reference(data) -> float:
+    import numpy as np
+    tide = data["TIDE"]
+    if np.isnan(tide).all():
+        return 0.0
+    return float(np.nanmean(tide)) * FEET
+
+#yields (timestamp, level in m) of a sine tide around 0, every step seconds from start to end
+def synthetic_tides(start: float, end: float, amplitude: float = TIDE_AMPLITUDE,
+                    period: float = TIDE_PERIOD, step: float = TIDE_STEP):
+    t = start
+    while t < end:
+        yield (t, amplitude * math.sin(2 * math.pi * (t - start) / period))
+        t = t + step
+
+#yields the (timestamp, extra rain) events of rain bursts given as (start, seconds, extra rain),
+# a positive extra rain when each starts and the negative when it stops, in time order
+def rain_bursts(bursts):
+    events = list()
+    for (start, seconds, extra) in bursts:
+        if extra <= 0:
+            raise ValueError("A rain burst needs extra rain above 0")
+        events.append((start, extra))
+        events.append((start + seconds, -extra))
+    events.sort()
+    return iter(events)
+
+#returns per_day random rain bursts a day on average between start and end, each STORM_HOURS
+# long on average and with extra rain, as (start, seconds, extra rain) for rain_bursts
+def random_bursts(start: float, end: float, per_day: float, extra: float, seed: int = None) -> list:
+    rng = random.Random(seed)
+    bursts = list()
+    if per_day <= 0:
+        return bursts
+    t = start + rng.expovariate(per_day / (24 * 60 * 60))
+    while t < end:
+        bursts.append((t, rng.expovariate(1 / (STORM_HOURS * 60 * 60)), extra))
+        t = t + rng.expovariate(per_day / (24 * 60 * 60))
+    return bursts
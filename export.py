@@ -0,0 +1,188 @@
+import os
+import csv
+import numpy as np
+import castle_test as ct
+import outcomes
+import records
+
+#CSV and XLSX export of sweep results, written while the sweep runs
+#run_parallel_sweep hands every chunk to the exporter as soon as it is added to the result (in
+# grid order), and the exporter turns it into one row per castle and writes it out straight
+# away, so only one chunk's rows are ever held, however big the sweep is; with --stats-only the
+# whole sweep runs in constant memory. The per-shape summaries are written once it finishes.
+#A chunk's columns are worked out with numpy from the grid indices (the castle is only built once
+# per shape step), and for CSV each distinct value is formatted once and the lines are joined
+# straight into text (none of the values need quoting), so exporting costs little next to
+# simulating the castles.
+#  - CSV: the castles go to PATH and the summaries to PATH with SUMMARY_SUFFIX, through a
+#    WRITE_BUFFER sized file buffer
+#  - XLSX: one workbook with a "summary" sheet and "castles" sheets, in openpyxl's write-only
+#    mode, which streams the rows to disk instead of building the sheets in memory; a sheet
+#    holds XLSX_MAX_ROWS rows, so big sweeps go on "castles 2", "castles 3", ...
+#NOTE: openpyxl is only imported for .xlsx files
+
+'''
+CONSTANTS for use in the file
+'''
+CASTLE_COLUMNS = ["shape", "dim_a", "dim_b", "height", "wave_height", "break_depth", "wave_distance",
+                  "wave_hits", "cause"] #same names as the results_store columns
+SUMMARY_COLUMNS = ["shape", "castles", "average_wave_hits", "stdev", "min", "max", "p50", "p90", "p99"] + outcomes.CAUSES
+SUMMARY_SUFFIX = "_summary"
+WRITE_BUFFER = 1 << 20 #bytes buffered before a CSV file is written to
+XLSX_MAX_ROWS = 1048576 #rows in an Excel sheet, the header row included
+FORMATS = [".csv", ".xlsx"]
+LINE_END = "\r\n" #csv.writer's default line terminator
+
+
+#returns the columns (CASTLE_COLUMNS -> list) of a sweep.ChunkResult's castles
+#the sweep settings have to be the ones the chunk ran with; the values are the same ones
+# sweep.grid_point, ct.build_shape and ct.build_wave give
+def castle_columns(chunk) -> dict:
+    n = ct.INC - 1
+    (rest, dist) = np.divmod(np.arange(chunk.start, chunk.start + len(chunk.wave_hits)), n)
+    (rest, d) = np.divmod(rest, n)
+    (step, h) = np.divmod(rest, n)
+    steps = ct.shape_steps(chunk.shape_name)
+    (a, b) = records.SHAPE_DIMS[chunk.shape_name]
+    shapes = [ct.build_shape(chunk.shape_name, steps[k]) for k in range(int(step[0]), int(step[-1]) + 1)]
+    step = step - step[0]
+    columns = {"shape": [chunk.shape_name] * len(step)}
+    for (name, attribute) in [("dim_a", a), ("dim_b", b), ("height", "height")]:
+        columns[name] = np.array([getattr(shape, attribute) for shape in shapes])[step].tolist()
+    columns["wave_height"] = ((h + 1) * ct.HEIGHT_INCREMENT + ct.START_HEIGHT).tolist()
+    columns["break_depth"] = ((d + 1) * ct.DEPTH_INCREMENT + ct.START_DEPTH).tolist()
+    columns["wave_distance"] = ((dist + 1) * ct.DIST_INCREMENT + ct.START_DISTANCE).tolist()
+    columns["wave_hits"] = chunk.wave_hits.tolist()
+    names = np.array(outcomes.CAUSES, dtype=object)
+    columns["cause"] = names[np.frombuffer(chunk.causes, dtype=np.uint8)].tolist()
+    return columns
+
+#returns the rows (CASTLE_COLUMNS) of a sweep.ChunkResult's castles
+def castle_rows(chunk):
+    if len(chunk.wave_hits) == 0:
+        return iter(())
+    columns = castle_columns(chunk)
+    return zip(*[columns[name] for name in CASTLE_COLUMNS])
+
+#returns the CSV lines of a sweep.ChunkResult's castles as one string
+#the numbers come out as csv.writer would write them, each distinct value formatted only once
+def castle_text(chunk) -> str:
+    if len(chunk.wave_hits) == 0:
+        return ""
+    columns = castle_columns(chunk)
+    for name in CASTLE_COLUMNS:
+        if name == "shape" or name == "cause":
+            continue
+        (values, inverse) = np.unique(np.array(columns[name]), return_inverse=True)
+        text = np.array([repr(value) for value in values.tolist()], dtype=object)
+        columns[name] = text[inverse].tolist()
+    return "".join(",".join(row) + LINE_END for row in zip(*[columns[name] for name in CASTLE_COLUMNS]))
+
+#returns the summary rows (SUMMARY_COLUMNS) of a sweep.SweepResult, one per shape
+def summary_rows(result) -> list:
+    rows = list()
+    for shape_name in result.shape_names():
+        accumulator = result.stats.shapes[shape_name]
+        running = accumulator.running
+        quantiles = [accumulator.digest.quantile(q) for q in [0.5, 0.9, 0.99]]
+        causes = [result.counts.counts[cause][shape_name] for cause in outcomes.CAUSES]
+        rows.append([shape_name, running.count, result.average_wave_hits(shape_name), running.stdev(),
+                     running.minimum, running.maximum] + quantiles + causes)
+    return rows
+
+
+#Writes the castles and summaries of a sweep to two CSV files
+class CsvExporter:
+    path: str
+    summary_path: str
+    rows: int #castle rows written so far
+    file: object
+
+    #Constructor; opens the castle file and writes its header
+    def __init__(self, path: str):
+        (root, extension) = os.path.splitext(path)
+        self.path = path
+        self.summary_path = root + SUMMARY_SUFFIX + extension
+        self.rows = 0
+        self.file = open(path, "w", newline="", buffering=WRITE_BUFFER)
+        csv.writer(self.file).writerow(CASTLE_COLUMNS)
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "Exported " + str(self.rows) + " castles to " + self.path + " and the summary to " + self.summary_path
+
+    #writes the castles of a finished sweep.ChunkResult
+    def add_chunk(self, chunk):
+        self.file.write(castle_text(chunk))
+        self.rows += len(chunk.wave_hits)
+
+    #writes the per-shape summaries of the finished sweep.SweepResult
+    def add_summary(self, result):
+        with open(self.summary_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(SUMMARY_COLUMNS)
+            writer.writerows(summary_rows(result))
+
+    def close(self):
+        self.file.close()
+
+
+#Writes the castles and summaries of a sweep to one workbook, in write-only mode
+class XlsxExporter:
+    path: str
+    rows: int #castle rows written so far
+    workbook: object #openpyxl.Workbook
+    summary: object #summary sheet
+    sheet: object #castle sheet being filled
+    sheet_rows: int #rows in it, the header included
+    sheets: int #castle sheets so far
+
+    #Constructor; starts the workbook with a summary sheet to fill in at the end
+    def __init__(self, path: str):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportError("Exporting to .xlsx needs openpyxl (pip install openpyxl), or export to .csv instead")
+        self.path = path
+        self.rows = 0
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.summary = self.workbook.create_sheet("summary")
+        self.summary.append(SUMMARY_COLUMNS)
+        self.sheet = None
+        self.sheet_rows = XLSX_MAX_ROWS
+        self.sheets = 0
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "Exported " + str(self.rows) + " castles to " + self.path + " (" + str(self.sheets) + " castle sheets)"
+
+    #writes the castles of a finished sweep.ChunkResult, starting a new sheet when one fills up
+    def add_chunk(self, chunk):
+        for row in castle_rows(chunk):
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self.sheets += 1
+                self.sheet = self.workbook.create_sheet("castles" if self.sheets == 1 else "castles " + str(self.sheets))
+                self.sheet.append(CASTLE_COLUMNS)
+                self.sheet_rows = 1
+            self.sheet.append(row)
+            self.sheet_rows += 1
+        self.rows += len(chunk.wave_hits)
+
+    #writes the per-shape summaries of the finished sweep.SweepResult
+    def add_summary(self, result):
+        for row in summary_rows(result):
+            self.summary.append(row)
+
+    #saves the workbook; a write-only workbook can only be saved once
+    def close(self):
+        self.workbook.save(self.path)
+
+
+#returns a CsvExporter or XlsxExporter for a path, by its extension
+def open_exporter(path: str):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return CsvExporter(path)
+    if extension == ".xlsx":
+        return XlsxExporter(path)
+    raise ValueError("Can only export to " + " or ".join(FORMATS) + " files: " + str(path))
@@ -0,0 +1,250 @@
+import math
+import copy
+import castle_test as ct
+import sand_castle_shapes as shapes
+
+#Fast-forward solver for a castle hit by the same wave over and over
+#Within one run the Wave never changes, so the only things that change between hits are
+# base_radius/base_side_length (shrinking by the same depth every hit while int(layers)
+# stays the same) and the saturation (growing by the same rain_on_shape every hit).
+#Instead of stepping every hit this jumps straight to the hit where something happens:
+#  - int(layers) == 0: the castle never changes again, so only the rain or MAX_WAVE_HITS can end it
+#  - the saturation crossing of OVERSATURATED is found without adding the rain hit by hit
+#  - while int(layers) stays the same, a galloping/bisection search finds the first hit where
+#    the layers change or the wave/erosion checks fail
+#Repeated float additions are reproduced exactly (see repeat_add), so the answer is the same
+# wave_hits and failure cause as castle_test.simulate_castle
+#NOTE: the bisection assumes each check flips at most once while int(layers) stays the same,
+#      which holds on the castle_test.py sweep grids (see verify)
+
+'''
+Exact repeated addition
+'''
+#returns x after adding step to it n times with float rounding after every addition,
+# i.e. the same value as a loop of x = x + step, in O(number of binades crossed)
+#Inside one binade [2^e, 2^(e+1)) every value is a multiple of the same ulp u, so adding step
+# is the same as adding step rounded to a multiple of u, which can be done n times at once
+def repeat_add(x: float, step: float, n: int) -> float:
+    while n > 0:
+        if step == 0:
+            return x
+        if x == 0 or math.isinf(x) or math.isnan(x):
+            x = x + step
+            n = n - 1
+            continue
+        exponent = math.frexp(x)[1] #abs(x) is in [2^(exponent-1), 2^exponent)
+        u = math.ldexp(1.0, exponent - 53) #ulp of every value in this binade
+        units = step / u #exact, u is a power of two
+        whole = math.floor(units)
+        if units - whole == 0.5:
+            #the rounding tie depends on the last bit of x; just take the step
+            x = x + step
+            n = n - 1
+            continue
+        s = round(units)
+        if s == 0:
+            #step is less than half an ulp, x never changes
+            return x
+        X = int(x / u) #exact integer number of ulps
+        #smallest and largest magnitudes in the binade, in ulps, kept one ulp away from the
+        # edges so the unrounded sums never spill into the next binade either
+        lo = 2**52 + 1
+        hi = 2**53 - 2
+        #how many steps keep the result inside this binade
+        if X > 0:
+            m = (hi - X) // s if s > 0 else (X - lo) // (-s)
+        else:
+            m = (-X - lo) // s if s > 0 else (hi + X) // (-s)
+        if m <= 0:
+            x = x + step
+            n = n - 1
+            continue
+        m = min(m, n)
+        x = (X + m * s) * u
+        n = n - m
+    return x
+
+#returns the first j in [1, limit] where adding step j times takes x above threshold, or None
+#step must be positive so the sequence only ever goes up
+def first_crossing(x: float, step: float, threshold: float, limit: int):
+    if limit < 1 or repeat_add(x, step, limit) <= threshold:
+        return None
+    lo = 0 #last j known to be at or below the threshold
+    hi = limit #first j known to be above it
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if repeat_add(x, step, mid) > threshold:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+'''
+Solver
+'''
+#sets probe to the shape eroded by j hits of depth_eroded each
+def _erode_probe(probe, shape, depth_eroded: float, j: int):
+    probe.update_base_radius(repeat_add(shape.base_radius, -depth_eroded, j))
+    if type(shape) is shapes.Cube or type(shape) is shapes.Pyramid:
+        probe.base_side_length = repeat_add(shape.base_side_length, -(2 * depth_eroded), j)
+
+#returns the int(layers) the wave takes off the shape in its current state
+def _layers(shape, wave, constants) -> int:
+    return ct.num_layers_eroded(shape, ct.num_grains_eroded(shape, wave, constants))
+
+#returns the failure cause if the shape fails the checks at the top of the erosion loop,
+# None if it survives to take another hit
+def _check(shape, wave, wave_hits: int, saturation: float, max_wave_hits: int, constants):
+    #Same order as the while loop in castle_test.simulate_castle
+    if shape.base_radius <= 0:
+        return "erosion"
+    if wave_hits >= max_wave_hits:
+        return "did_not_fall"
+    if not ct.survives_wave_hit(shape, wave, constants):
+        return "knockout"
+    if not ct.survives_erosion(shape, constants):
+        return "erosion"
+    if saturation > constants.oversaturated:
+        return "rain"
+    return None
+
+#returns a guess at how many more hits of depth_eroded it takes until int(layers) goes up
+# or the base gets too thin to hold the castle up, worked out from the geometry directly
+def _plateau_guess(shape, wave, layers: int, depth_eroded: float, constants) -> int:
+    k = constants
+    #num_grains_eroded / surface area works out to K / cross-sectional area
+    K = wave.wave_height * wave.wave_distance_past_castle * k.water_density * wave.wave_speed * wave.wave_speed / k.cohesion
+    next_area = K / (layers + 1)
+    #how far base_radius can go before the erosion check fails (critical_height solved for r)
+    f = 3 if (type(shape) is shapes.Cone or type(shape) is shapes.Pyramid) else 1
+    c = ((9 * k.j * k.j) / 16) * k.alpha * k.e**(2/3) * k.gamma**(1/3) / (k.sand_density * k.gravity)
+    crit_radius = ((shape.height / f)**3 / c)**(3/5)
+    guesses = [(shape.base_radius - crit_radius) / depth_eroded]
+    if type(shape) is shapes.Cube:
+        guesses.append((shape.base_side_length - math.sqrt(next_area)) / (2 * depth_eroded))
+    elif type(shape) is shapes.Cylinder:
+        guesses.append((shape.base_radius - math.sqrt(next_area / math.pi)) / depth_eroded)
+    elif type(shape) is shapes.Pyramid:
+        #the eroding frustum's top side shrinks one-for-one with base_side_length
+        guesses.append((math.sqrt(shape.get_cross_sectional_area()) - math.sqrt(next_area)) / (2 * depth_eroded))
+    elif type(shape) is shapes.Cone:
+        #NOTE: the Cone's "area" is the radius at base_height, which shrinks one-for-one with base_radius
+        guesses.append((shape.get_cross_sectional_area() - next_area) / depth_eroded)
+    guess = min(guesses)
+    if math.isnan(guess):
+        return 1
+    return int(math.ceil(guess))
+
+#Fast-forwards a shape through up to hits more hits of the same wave, starting from the
+# given saturation (the shape's base_height has to be set for this wave already)
+#returns (hits_taken, cause, saturation); cause is None if the castle is still standing after
+# all of the hits, otherwise it fell at the top of hit number hits_taken + 1
+#NOTE: like the loop in simulate_castle, a base eroded away to nothing counts as "erosion" even
+#      right after the last of the hits
+#used on its own by fast_forward and a segment at a time by wave_train and events
+#rain_multiplier scales the rain of every hit (events uses it for rain bursts)
+#constants is a castle_test.Constants, the module constants by default
+def advance(shape, wave, hits: int, saturation: float, rain_multiplier: float = 1.0, constants = None) -> tuple:
+    if constants is None:
+        constants = ct.current_constants()
+    wave_hits = 0
+    probe = copy.copy(shape) #scratch copy for looking ahead
+    while True:
+        if shape.base_radius > 0 and wave_hits >= hits:
+            return (wave_hits, None, saturation)
+        cause = _check(shape, wave, wave_hits, saturation, hits, constants)
+        if cause is not None:
+            return (wave_hits, cause, saturation)
+        #the rain is the same every hit, it only depends on the part that never erodes
+        rain = ct.rain_on_shape(shape, constants) * rain_multiplier
+        remaining = hits - wave_hits
+        layers = _layers(shape, wave, constants)
+        if layers == 0:
+            #Stagnation: the castle never changes again, so only the rain can knock it down
+            #(a crossing on the last hit belongs to the next check, made by whoever calls next)
+            crossing = first_crossing(saturation, rain, constants.oversaturated, remaining - 1) if rain > 0 else None
+            if crossing is None:
+                return (hits, None, repeat_add(saturation, rain, remaining))
+            return (wave_hits + crossing, "rain", repeat_add(saturation, rain, crossing))
+        depth_eroded = ct.grains_to_meters(layers, constants)
+
+        #returns true while j more hits keep the same layers and pass the checks
+        def same_plateau(j: int) -> bool:
+            _erode_probe(probe, shape, depth_eroded, j)
+            return probe.base_radius > 0 and ct.survives_wave_hit(probe, wave, constants) and \
+                ct.survives_erosion(probe, constants) and _layers(probe, wave, constants) == layers
+
+        #Start from the geometric guess and gallop away from it until the first failing j is
+        # bracketed (j = 0 is the current state, which passes), then bisect down to it
+        guess = min(max(_plateau_guess(shape, wave, layers, depth_eroded, constants), 1), remaining)
+        if same_plateau(guess):
+            lo = guess
+            hi = None
+            step = 1
+            while lo < remaining:
+                j = min(lo + step, remaining)
+                if same_plateau(j):
+                    lo = j
+                    step = 2 * step
+                else:
+                    hi = j
+                    break
+            if hi is None:
+                hi = remaining
+        else:
+            hi = guess
+            lo = 0
+            step = 1
+            while hi > 1:
+                j = max(hi - step, 1)
+                if same_plateau(j):
+                    lo = j
+                    break
+                hi = j
+                step = 2 * step
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if same_plateau(mid):
+                lo = mid
+            else:
+                hi = mid
+        #jump to the first hit where something changes, or the rain gets there first
+        jump = hi
+        if rain > 0:
+            crossing = first_crossing(saturation, rain, constants.oversaturated, jump)
+            if crossing is not None:
+                jump = crossing
+        _erode_probe(probe, shape, depth_eroded, jump)
+        shape.update_base_radius(probe.base_radius)
+        if type(shape) is shapes.Cube or type(shape) is shapes.Pyramid:
+            shape.base_side_length = probe.base_side_length
+        saturation = repeat_add(saturation, rain, jump)
+        wave_hits = wave_hits + jump
+
+#Fast-forwards a shape through repeated hits of the same wave
+#returns (wave_hits, cause) with cause one of "erosion", "knockout", "rain" or "did_not_fall"
+#the shape is left eroded the same way simulate_castle leaves it; the stat dictionaries are not touched
+def fast_forward(shape, wave, max_wave_hits: int = None, constants = None) -> tuple:
+    if max_wave_hits is None:
+        max_wave_hits = ct.MAX_WAVE_HITS
+    if constants is None:
+        constants = ct.current_constants()
+    shape.set_base_height(wave.wave_height)
+    (wave_hits, cause, saturation) = advance(shape, wave, max_wave_hits, constants.initial_saturation,
+                                             constants=constants)
+    if cause is None:
+        return (max_wave_hits, "did_not_fall")
+    return (wave_hits, cause)
+
+#Checks fast_forward against castle_test.simulate_castle on the sweep grid of one shape
+#returns the list of grid points (i, h, d, dist) where they disagree
+def verify(shape_name: str, max_wave_hits: int = None) -> list:
+    mismatches = list()
+    for (i, h, d, dist) in ct.sweep_points(shape_name):
+        w = ct.build_wave(h, d, dist)
+        scalar = ct.simulate_castle(ct.build_shape(shape_name, i), w, ct.outcomes.OutcomeCounts(), max_wave_hits)
+        fast = fast_forward(ct.build_shape(shape_name, i), w, max_wave_hits)
+        if scalar != fast:
+            mismatches.append((i, h, d, dist))
+    return mismatches
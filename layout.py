@@ -0,0 +1,277 @@
+import json
+import math
+import random
+import numpy as np
+import castle_test as ct
+import wave as waves
+import batch as batches
+
+#Whole beach layouts instead of one castle at a time
+#A Layout places castles of any shape at (x, y) on the beach: x runs along the shore and y up
+# the beach from where the waves break. The wave_distance_past_castle of a Wave is read as its
+# run-up, how far up the beach the water gets, so a castle at y is reached by a wave with a
+# run-up past y and the water runs on past it for run-up - y meters.
+#Each wave front moves up the beach: a BeachIndex (castles sorted by y, plus a grid along the
+# shore) hands back the castles the run-up reaches without looking at the rest, a standing
+# castle shelters the castles in its lee (see SHELTER_DISTANCE), and the castles that are hit
+# take the hit together, one batch.CastleBatch per shape type.
+#A castle only sees the waves that reach it, so it ends up exactly like castle_test.simulate_wave_train
+# with those waves (and the run-up minus its y as the distance).
+
+'''
+CONSTANTS for use in the file
+'''
+CELL_SIZE = 1.0 #meters | width along the shore of a BeachIndex grid cell
+SHELTER_DISTANCE = 2.0 #meters | a castle shelters the ones up to this far behind it, across its width
+BEACH_WIDTH = 100.0 #meters | along the shore, for random layouts
+MAX_HEIGHT_FIELDS = 64 #wave heights whose fixed fields a Layout remembers
+
+
+#returns the half width along the shore of a shape
+def half_width(shape) -> float:
+    if shape.string_name() in ("cube", "pyramid"):
+        return shape.side_length / 2
+    return shape.radius
+
+
+#Castle positions, sorted up the beach and bucketed along the shore
+class BeachIndex:
+    cell_size: float
+    by_y: np.ndarray #castle ids sorted by y
+    sorted_y: np.ndarray #y of by_y
+    x_low: float #x of the start of cell 0
+    cells: list #per grid cell: (castle ids sorted by y, their y)
+
+    #Constructor
+    def __init__(self, x, y, cell_size: float = CELL_SIZE):
+        if cell_size <= 0:
+            raise ValueError("cell_size has to be above 0")
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.cell_size = cell_size
+        self.by_y = np.argsort(y, kind="stable")
+        self.sorted_y = y[self.by_y]
+        self.x_low = float(x.min()) if len(x) > 0 else 0.0
+        cell = self.cell(x)
+        self.cells = list()
+        for k in range(int(cell.max()) + 1 if len(x) > 0 else 0):
+            ids = self.by_y[cell[self.by_y] == k]
+            self.cells.append((ids, y[ids]))
+
+    #returns the grid cell of x (a number or an array)
+    def cell(self, x):
+        return np.floor((np.asarray(x, dtype=float) - self.x_low) / self.cell_size).astype(np.int64)
+
+    #returns the ids of the castles below y = run_up, closest to the water first
+    def reached(self, run_up: float) -> np.ndarray:
+        return self.by_y[:np.searchsorted(self.sorted_y, run_up, "left")]
+
+    #returns the ids of the castles in the box x_low <= x <= x_high, y_low < y <= y_high,
+    # without the x check (the cells are whole), so callers check x themselves
+    def candidates(self, x_low: float, x_high: float, y_low: float, y_high: float) -> np.ndarray:
+        first = max(int(self.cell(x_low)), 0)
+        last = min(int(self.cell(x_high)), len(self.cells) - 1)
+        found = list()
+        for k in range(first, last + 1):
+            (ids, ys) = self.cells[k]
+            found.append(ids[np.searchsorted(ys, y_low, "right"):np.searchsorted(ys, y_high, "right")])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
+
+
+#Castles of any shape placed on the beach
+class Layout:
+    castles: list #the shapes, as given
+    x: np.ndarray #meters along the shore
+    y: np.ndarray #meters up the beach from where the waves break
+    shape_code: np.ndarray #index into castle_test.shape_list
+    local: np.ndarray #row of each castle in its shape's batch
+    batches: dict #shape name -> batch.CastleBatch
+    members: dict #shape name -> ids of its castles
+    index: BeachIndex
+    shelter_front: np.ndarray #castle doing the sheltering, one per (front, behind) pair
+    shelter_behind: np.ndarray #castle in its lee
+    standing: np.ndarray #true until a castle falls
+    fell_at: np.ndarray #number of the wave a castle fell to, -1 if it didn't
+    waves: int #waves run so far
+    fields: dict #(shape name, wave height) -> (normal_force, rain_per_hit, adj) of the whole batch
+
+    #Constructor; castles are sand_castle_shapes objects, x and y one per castle
+    #with shelter=False every castle the run-up reaches is hit, whatever is in front of it
+    def __init__(self, castles: list, x, y, shelter: bool = True):
+        if not (len(castles) == len(x) == len(y)):
+            raise ValueError("Need an x and a y for every castle")
+        n = len(castles)
+        self.castles = list(castles)
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.shape_code = np.array([ct.shape_list.index(c.string_name()) for c in castles], dtype=np.int64)
+        self.local = np.zeros(n, dtype=np.int64)
+        self.batches = dict()
+        self.members = dict()
+        self.fields = dict()
+        #the batches start out hit at the average wave; hit() sets each castle up for its wave
+        start = waves.Wave(ct.AVG_WAVE_HEIGHT, ct.AVG_BREAK_DEPTH, 0.0)
+        for (code, shape_name) in enumerate(ct.shape_list):
+            ids = np.flatnonzero(self.shape_code == code)
+            if len(ids) == 0:
+                continue
+            self.members[shape_name] = ids
+            self.local[ids] = np.arange(len(ids))
+            batch = batches.CastleBatch.from_castles([self.castles[k] for k in ids], [start] * len(ids))
+            self.batches[shape_name] = batch
+            self.fields[(shape_name, start.wave_height)] = (batch.normal_force.copy(), batch.rain_per_hit.copy(),
+                                                            batch.adj.copy())
+        self.index = BeachIndex(self.x, self.y)
+        (self.shelter_front, self.shelter_behind) = self.shelter_pairs() if shelter else \
+            (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self.standing = np.ones(n, dtype=bool)
+        self.fell_at = np.full(n, -1, dtype=np.int64)
+        self.waves = 0
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "Layout: " + str(len(self)) + " castles | standing: " + str(int(self.standing.sum())) + \
+               " | waves: " + str(self.waves) + " | shelter pairs: " + str(len(self.shelter_front))
+
+    def __len__(self) -> int:
+        return len(self.castles)
+
+    #returns (front, behind) id arrays: behind sits in the lee of front, at most SHELTER_DISTANCE
+    # further up the beach and within front's width along the shore
+    def shelter_pairs(self) -> tuple:
+        front = list()
+        behind = list()
+        for k in range(len(self)):
+            reach = half_width(self.castles[k])
+            (x, y) = (self.x[k], self.y[k])
+            ids = self.index.candidates(x - reach, x + reach, y, y + SHELTER_DISTANCE)
+            ids = ids[np.abs(self.x[ids] - x) <= reach]
+            front.extend([k] * len(ids))
+            behind.extend(ids.tolist())
+        return (np.array(front, dtype=np.int64), np.array(behind, dtype=np.int64))
+
+    #returns the (normal_force, rain_per_hit, adj) arrays of a shape's batch at a wave height
+    def height_fields(self, shape_name: str, wave_height: float) -> tuple:
+        key = (shape_name, wave_height)
+        if key not in self.fields:
+            if len(self.fields) >= MAX_HEIGHT_FIELDS:
+                del self.fields[next(iter(self.fields))]
+            ids = self.members[shape_name]
+            self.fields[key] = batches.fixed_fields(shape_name, [self.castles[k] for k in ids],
+                                                    [wave_height] * len(ids), self.batches[shape_name].constants)
+        return self.fields[key]
+
+    #returns the ids of the standing castles a wave with this run-up gets to
+    def reached(self, run_up: float) -> np.ndarray:
+        ids = self.index.reached(run_up)
+        ids = ids[self.standing[ids]]
+        if len(self.shelter_front) > 0 and len(ids) > 0:
+            #a castle that falls to this wave still takes the brunt of it
+            sheltered = np.zeros(len(self), dtype=bool)
+            sheltered[self.shelter_behind[self.standing[self.shelter_front]]] = True
+            ids = ids[~sheltered[ids]]
+        return ids
+
+    #Hits every castle the wave gets to
+    #returns how many castles it got to
+    def hit(self, w, max_wave_hits: int = None) -> int:
+        if max_wave_hits is None:
+            max_wave_hits = math.inf
+        reached = self.reached(w.wave_distance_past_castle)
+        for (shape_name, batch) in self.batches.items():
+            ids = reached[self.shape_code[reached] == ct.shape_list.index(shape_name)]
+            if len(ids) == 0:
+                continue
+            idx = self.local[ids]
+            (normal_force, rain_per_hit, adj) = self.height_fields(shape_name, w.wave_height)
+            batch.base_height[idx] = w.wave_height
+            batch.wave_height[idx] = w.wave_height
+            batch.break_depth[idx] = w.break_depth
+            batch.wave_speed[idx] = w.wave_speed
+            batch.wave_distance[idx] = w.wave_distance_past_castle - self.y[ids]
+            batch.normal_force[idx] = normal_force[idx]
+            batch.rain_per_hit[idx] = rain_per_hit[idx]
+            batch.adj[idx] = adj[idx]
+            batches.step(batch, max_wave_hits, idx)
+            cause = batch.cause[idx]
+            self.standing[ids[cause != batches.STANDING]] = False
+            self.fell_at[ids[(cause != batches.STANDING) & (cause != batches.DID_NOT_FALL)]] = self.waves
+        self.waves += 1
+        return len(reached)
+
+    #Settles the castles still standing once the waves stop, like simulate_wave_train: a base
+    # worn to nothing by its last wave is erosion, everything else did_not_fall
+    def finish(self):
+        for (shape_name, batch) in self.batches.items():
+            idx = batch.alive()
+            gone = (batch.base_radius[idx] <= 0) & (batch.wave_hits[idx] > 0)
+            batch.cause[idx[gone]] = batches.EROSION
+            batch.cause[idx[~gone]] = batches.DID_NOT_FALL
+            ids = self.members[shape_name][idx[gone]]
+            self.standing[ids] = False
+            self.fell_at[ids] = self.waves
+        self.standing[:] = False
+
+    #Hits the layout with every wave of a train (an iterable of Waves) and settles it
+    #max_wave_hits caps the hits each castle takes (no cap by default)
+    #returns the wave hits of every castle
+    def run(self, train, max_wave_hits: int = None) -> np.ndarray:
+        for w in train:
+            self.hit(w, max_wave_hits)
+            if not self.standing.any():
+                break
+        self.finish()
+        return self.wave_hits()
+
+    #returns the wave hits of every castle, in the order they were given
+    def wave_hits(self) -> np.ndarray:
+        hits = np.zeros(len(self), dtype=np.int64)
+        for (shape_name, batch) in self.batches.items():
+            hits[self.members[shape_name]] = batch.wave_hits
+        return hits
+
+    #returns the failure cause of every castle as a name ("standing" if it hasn't been settled)
+    def cause_names(self) -> list:
+        names = ["standing"] * len(self)
+        for (shape_name, batch) in self.batches.items():
+            for (k, code) in zip(self.members[shape_name].tolist(), batch.cause.tolist()):
+                if code != batches.STANDING:
+                    names[k] = batches.CAUSE_NAMES[code]
+        return names
+
+    #adds how each castle ended up to an outcomes.OutcomeCounts
+    def add_to(self, counts):
+        for batch in self.batches.values():
+            batch.add_to(counts)
+
+
+#returns a Layout of count castles of random shapes and heights from the sweep, spread over
+# width meters of shore and the START_DISTANCE..END_DISTANCE stretch of beach
+def random_layout(count: int, width: float = BEACH_WIDTH, seed: int = None, shelter: bool = True) -> Layout:
+    rng = random.Random(seed)
+    castles = list()
+    x = list()
+    y = list()
+    for k in range(count):
+        shape_name = rng.choice(ct.shape_list)
+        castles.append(ct.build_shape(shape_name, rng.choice(ct.shape_steps(shape_name))))
+        x.append(rng.uniform(0, width))
+        y.append(rng.uniform(ct.START_DISTANCE, ct.END_DISTANCE))
+    return Layout(castles, x, y, shelter)
+
+#Reads a layout from a JSON list of {"shape", "height", "x", "y"}; every castle is VOL m^3 of
+# sand, built by castle_test.shape_with_height (a cube ignores the height)
+def load(path: str, shelter: bool = True) -> Layout:
+    with open(path, "r") as f:
+        data = json.load(f)
+    castles = [ct.shape_with_height(item["shape"], float(item.get("height", ct.VOL**(1/3)))) for item in data]
+    return Layout(castles, [float(item["x"]) for item in data], [float(item["y"]) for item in data], shelter)
+
+#yields count waves of the average height and break depth with run-ups drawn evenly from
+# START_DISTANCE..END_DISTANCE, the same range as the sweep's distances
+def random_run_ups(count: int, seed: int = None):
+    rng = random.Random(seed)
+    for k in range(count):
+        yield waves.Wave(ct.AVG_WAVE_HEIGHT, ct.AVG_BREAK_DEPTH, rng.uniform(ct.START_DISTANCE, ct.END_DISTANCE))
@@ -0,0 +1,251 @@
+import os
+import math
+import copy
+import time
+import collections
+import numpy as np
+import castle_test as ct
+import buoy_data
+import wave_train
+import stats
+
+#Live predictions from buoy files that keep growing
+#NDBC rows get appended to the files in ocean_data/ through the day. Instead of parsing the whole
+# file and re-running every castle for each new row, a Follower:
+#  - tails the file: it remembers the byte offset it has read up to and only parses the complete
+#    lines appended after it (a half-written last line waits for the next poll)
+#  - keeps running wave-height stats over the whole file and over the last WINDOW_SECONDS
+#  - keeps every castle's state (shape, saturation, wave hits) as of the last good reading, so
+#    new rows only cost the waves they add
+#The last reading's run of waves is provisional until the next row says how long it lasted
+# (until then it lasts the average reading interval, like wave_train.buoy_runs). A castle that
+# fell before the latest reading is final and never looked at again; only castles still standing
+# at the latest reading are re-evaluated when rows come in.
+#The beach scale is pinned when following starts (or given), so old predictions never move
+# because the average WVHT drifted.
+#A file that shrinks or is replaced is read again from the start.
+
+'''
+CONSTANTS for use in the file
+'''
+POLL_SECONDS = 0.1 #how often the file is checked for new rows
+WINDOW_SECONDS = 24 * 60 * 60 #rolling window of the wave-height stats
+READ_BYTES = 1 << 20 #bytes read from the file at a time
+
+
+#Reads the complete lines appended to a file since the last poll
+class Tail:
+    path: str
+    offset: int #bytes read so far
+    partial: bytes #start of a line that didn't have its newline yet
+    inode: int
+
+    #Constructor; the first poll reads the whole file
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.partial = b""
+        self.inode = None
+
+    #returns (new complete lines, true if the file shrank or was replaced and is being read from the start)
+    def poll(self) -> tuple:
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return (list(), False)
+        restarted = False
+        if (self.inode is not None and info.st_ino != self.inode) or info.st_size < self.offset:
+            (self.offset, self.partial) = (0, b"")
+            restarted = True
+        self.inode = info.st_ino
+        if info.st_size == self.offset:
+            return (list(), restarted)
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = self.partial + b"".join(iter(lambda: f.read(READ_BYTES), b""))
+            self.offset = f.tell()
+        end = data.rfind(b"\n") + 1
+        self.partial = data[end:]
+        return (data[:end].decode("ascii", "replace").splitlines(), restarted)
+
+
+#Wave-height stats of the whole file and of the last window_seconds of readings
+class WaveStats:
+    overall: stats.RunningStats
+    window_seconds: float
+    window: collections.deque #(timestamp, WVHT) of the readings in the window
+    latest: tuple #(timestamp, WVHT) of the last good reading
+
+    #Constructor
+    def __init__(self, window_seconds: float = WINDOW_SECONDS):
+        self.overall = stats.RunningStats()
+        self.window_seconds = window_seconds
+        self.window = collections.deque()
+        self.latest = None
+
+    #to_string method for pretty printing
+    def __str__(self):
+        if self.latest is None:
+            return "WVHT: no readings yet"
+        heights = [h for (t, h) in self.window]
+        return "WVHT latest: " + str(self.latest[1]) + " m | last " + str(round(self.window_seconds / 3600)) + \
+               " h mean: " + str(round(math.fsum(heights) / len(heights), 3)) + " max: " + str(max(heights)) + \
+               " | all mean: " + str(round(self.overall.mean, 3)) + " stdev: " + str(round(self.overall.stdev(), 3)) + \
+               " (" + str(self.overall.count) + " readings)"
+
+    #adds the good readings among new rows
+    def add(self, times, heights):
+        for (t, h) in zip(times.tolist(), heights.tolist()):
+            if math.isnan(h):
+                continue
+            self.overall.add(h)
+            self.window.append((t, h))
+            self.latest = (t, h)
+        if self.latest is not None:
+            while self.window[0][0] <= self.latest[0] - self.window_seconds:
+                self.window.popleft()
+
+
+#One castle design followed through the live wave train
+class LiveCastle:
+    description: str
+    shape: object #as of the start of the pending rows
+    state: tuple #wave_train.continue_runs state as of the start of the pending rows
+    outcome: tuple #(wave_hits, cause, timestamp) predicted from everything read so far
+    final: bool #fell before the latest reading, so new rows can't change the outcome
+
+    #Constructor
+    def __init__(self, shape):
+        self.description = str(shape)
+        self.shape = shape
+        self.state = wave_train.start_state()
+        self.outcome = None
+        self.final = False
+
+
+#Tails a buoy file and keeps a prediction for every castle up to date
+class Follower:
+    tail: Tail
+    shapes: list #the castles as built, kept for starting over
+    castles: list #LiveCastle
+    given_scale: float
+    scale: float #None until there is a reading to pin it to
+    distance: float
+    from_start: bool
+    built: float #timestamp the castles were built at, None until the first reading
+    window_seconds: float
+    wave_stats: WaveStats
+    pending: dict #columns of the rows from the last good reading on
+    rows: int #rows read so far
+    first_time: float
+    updates: int
+    reevaluated: int #castle re-evaluations over all updates
+
+    #Constructor
+    #castles are the shapes to follow, built at the first reading with from_start and at the latest
+    # reading in the file otherwise; distance defaults to wave_train.default_distance()
+    def __init__(self, path: str, castles, scale: float = None, distance: float = None,
+                 from_start: bool = False, window_seconds: float = WINDOW_SECONDS):
+        self.tail = Tail(path)
+        self.shapes = list(castles)
+        self.given_scale = scale
+        self.distance = distance if distance is not None else wave_train.default_distance()
+        self.from_start = from_start
+        self.window_seconds = window_seconds
+        self.updates = 0
+        self.reevaluated = 0
+        self.reset()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        final = sum(1 for castle in self.castles if castle.final)
+        return "Follower: " + buoy_data.station_name(self.tail.path) + " | rows: " + str(self.rows) + \
+               " | castles: " + str(len(self.castles)) + " (" + str(final) + " final)" + \
+               " | updates: " + str(self.updates) + " | re-evaluated: " + str(self.reevaluated)
+
+    #forgets everything read so far
+    def reset(self):
+        self.castles = [LiveCastle(copy.copy(shape)) for shape in self.shapes]
+        self.scale = self.given_scale
+        self.built = None
+        self.wave_stats = WaveStats(self.window_seconds)
+        self.pending = buoy_data.empty_columns()
+        self.rows = 0
+        self.first_time = None
+
+    #returns the average time between readings, which the last reading's run lasts for now
+    def average_interval(self) -> float:
+        if self.rows < 2:
+            return wave_train.MAX_GAP
+        return (float(self.pending["time"][-1]) - self.first_time) / (self.rows - 1)
+
+    #Reads the rows appended since the last poll and updates the castles they affect
+    #returns the LiveCastles whose prediction changed, or None if there were no new rows
+    def poll(self):
+        (lines, restarted) = self.tail.poll()
+        if restarted:
+            self.reset()
+        (columns, skipped) = buoy_data.parse_rows(lines)
+        if len(columns["time"]) == 0 and not restarted:
+            return None
+        self.updates += 1
+        return self.update(columns)
+
+    #adds parsed rows and re-evaluates the castles that are still standing
+    def update(self, columns: dict) -> list:
+        if self.first_time is None and len(columns["time"]) > 0:
+            self.first_time = float(columns["time"][0])
+        self.rows += len(columns["time"])
+        self.wave_stats.add(columns["time"], columns["WVHT"])
+        if self.wave_stats.latest is None:
+            return list()
+        if self.scale is None:
+            self.scale = ct.AVG_WAVE_HEIGHT / self.wave_stats.overall.mean
+        pending = {name: np.concatenate([self.pending[name], columns[name]]) for name in buoy_data.COLUMNS}
+        if self.built is None:
+            self.built = self.first_time if self.from_start else self.wave_stats.latest[0]
+        #rows before the last good reading are settled now: their next row is known
+        good = np.flatnonzero(~np.isnan(pending["WVHT"]))
+        settled = int(good[-1])
+        settled_time = float(pending["time"][settled])
+        old = buoy_data.BuoyData(self.tail.path, pending)
+        self.pending = {name: pending[name][settled:] for name in buoy_data.COLUMNS}
+        new = buoy_data.BuoyData(self.tail.path, self.pending)
+        changed = list()
+        for castle in self.castles:
+            if castle.final:
+                continue
+            self.reevaluated += 1
+            if settled > 0 and settled_time > self.built:
+                runs = wave_train.buoy_runs(old, self.scale, self.distance, start=self.built, end=settled_time)
+                (castle.state, outcome) = wave_train.continue_runs(castle.shape, runs, castle.state)
+                if outcome is not None:
+                    castle.final = True
+                    if outcome != castle.outcome:
+                        castle.outcome = outcome
+                        changed.append(castle)
+                    continue
+            shape = copy.copy(castle.shape)
+            runs = wave_train.buoy_runs(new, self.scale, self.distance, start=self.built,
+                                        last_interval=self.average_interval())
+            (state, outcome) = wave_train.continue_runs(shape, runs, castle.state)
+            if outcome is None:
+                outcome = wave_train.end_outcome(state)
+            if outcome != castle.outcome:
+                castle.outcome = outcome
+                changed.append(castle)
+        return changed
+
+    #Polls the file every poll_seconds for seconds (forever by default), calling report(follower,
+    # changed castles, seconds since the file changed) after every update
+    def follow(self, report, seconds: float = None, poll_seconds: float = POLL_SECONDS):
+        stop = None if seconds is None else time.monotonic() + seconds
+        while stop is None or time.monotonic() < stop:
+            changed = self.poll()
+            if changed is not None:
+                try:
+                    latency = time.time() - os.stat(self.tail.path).st_mtime
+                except OSError:
+                    latency = 0.0
+                report(self, changed, latency)
+            time.sleep(poll_seconds)
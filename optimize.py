@@ -0,0 +1,258 @@
+import math
+import random
+import castle_test as ct
+import wave as waves
+import outcomes
+import sampling
+
+#Searches each shape's dimensions for the most wave hits out of VOL m^3 of sand
+#With the volume fixed every shape has one free dimension, its height (the radius or side comes
+# from the volume), which is searched between the castle_test MIN/MAX_CASTLE_HEIGHT bounds
+# narrowed down to the heights whose radius is inside MIN/MAX_CASTLE_RADIUS.
+#A design is scored by its expected wave hits over a wave distribution (the sweep's wave grid by
+# default), and every score is cached, so a height that comes up again costs nothing.
+#Methods:
+#  - "golden": golden-section search on the height; finds the best height if the expected wave
+#    hits only go up and then down, which isn't guaranteed since the hits are whole numbers
+#  - "halving": successive-halving tournament; a spread of candidate heights is scored on a few
+#    waves, the better half goes on to twice as many waves, and so on until one is left; the
+#    waves are shuffled (seeded) first, so the early rounds see a spread of the whole
+#    distribution rather than the start of the grid, where only the distance changes
+
+'''
+CONSTANTS for use in the file
+'''
+METHODS = ["golden", "halving"]
+GOLDEN = (math.sqrt(5) - 1) / 2 #0.618...
+HEIGHT_TOLERANCE = 0.001 #meters | golden-section stops when the bracket is this narrow
+HALVING_CANDIDATES = 32 #heights entered into the tournament
+HALVING_FIRST_ROUND = 8 #waves the first round is scored on
+HALVING_SEED = 0 #seed of the order the tournament's waves are taken in
+CACHE_DIGITS = 9 #heights are rounded to this many decimals for the cache (nanometers)
+
+
+#Waves to score designs against, each with a weight
+class WaveDistribution:
+    waves: list
+    weights: list
+
+    #Constructor
+    def __init__(self, waves: list, weights: list = None):
+        if len(waves) == 0:
+            raise ValueError("A wave distribution needs at least one wave")
+        if weights is None:
+            weights = [1.0] * len(waves)
+        if len(weights) != len(waves):
+            raise ValueError("Need one weight per wave")
+        self.waves = waves
+        self.weights = weights
+
+    def __len__(self) -> int:
+        return len(self.waves)
+
+    #returns a distribution of the first n waves with their weights (n is capped at the length)
+    def head(self, n: int):
+        return WaveDistribution(self.waves[:n], self.weights[:n])
+
+    #returns the same waves and weights in a random order
+    def shuffled(self, seed = None):
+        order = list(range(len(self.waves)))
+        random.Random(seed).shuffle(order)
+        return WaveDistribution([self.waves[k] for k in order], [self.weights[k] for k in order])
+
+
+#returns the sweep's (INC-1)^3 wave grid as an even distribution
+def grid_waves() -> WaveDistribution:
+    grid = list()
+    for h in range(1, ct.INC):
+        for d in range(1, ct.INC):
+            for dist in range(1, ct.INC):
+                grid.append(ct.build_wave(h, d, dist))
+    return WaveDistribution(grid)
+
+#returns n waves drawn as a Latin hypercube over the sweep's wave ranges, as an even distribution
+def sampled_waves(n: int, seed = None) -> WaveDistribution:
+    ranges = sampling.sample_ranges()[1:]
+    drawn = list()
+    for point in sampling.latin_hypercube(n, len(ranges), random.Random(seed)):
+        (height, depth, dist) = [low + u * (high - low) for (u, (low, high)) in zip(point, ranges)]
+        drawn.append(waves.Wave(height, depth, dist))
+    return WaveDistribution(drawn)
+
+#returns the (low, high) heights a shape can have out of VOL m^3 of sand and still be inside the
+# castle_test height and radius bounds, or None if there is no such height
+def height_bounds(shape_name: str) -> tuple:
+    low = ct.MIN_CASTLE_HEIGHT
+    high = ct.MAX_CASTLE_HEIGHT
+    if shape_name == "cube":
+        side = ct.VOL**(1/3)
+        return (side, side) if low <= side <= high else None
+    #radius shrinks as the height grows, so the largest radius gives the lowest height
+    (low_radius, high_radius) = (radius_for_height(shape_name, low), radius_for_height(shape_name, high))
+    if low_radius > ct.MAX_CASTLE_RADIUS:
+        low = height_for_radius(shape_name, ct.MAX_CASTLE_RADIUS)
+    if high_radius < ct.MIN_CASTLE_RADIUS:
+        high = height_for_radius(shape_name, ct.MIN_CASTLE_RADIUS)
+    if low > high:
+        return None
+    return (low, high)
+
+#returns the radius the MIN/MAX_CASTLE_RADIUS bounds apply to for a shape of the given height
+#NOTE: for square bases this is half the side (the inscribed circle); the square base_radius the
+#      model erodes is close to the full side, which would rule out every pyramid at the default VOL
+def radius_for_height(shape_name: str, height: float) -> float:
+    shape = ct.shape_with_height(shape_name, height)
+    if shape_name == "cube" or shape_name == "pyramid":
+        return shape.side_length / 2
+    return shape.radius
+
+#returns the height that gives a shape the given base radius
+def height_for_radius(shape_name: str, radius: float) -> float:
+    if shape_name == "cylinder":
+        return ct.VOL / (math.pi * radius * radius)
+    elif shape_name == "cone":
+        return 3 * ct.VOL / (math.pi * radius * radius)
+    elif shape_name == "pyramid":
+        side = 2 * radius
+        return 3 * ct.VOL / (side * side)
+    raise ValueError("No radius bound for shape: " + str(shape_name))
+
+
+#Scores designs and remembers every score
+class Evaluator:
+    shape_name: str
+    engine: str
+    max_wave_hits: int
+    cache: dict #(rounded height, number of waves) -> expected wave hits
+    #NOTE: the number of waves is in the key so the tournament can score the first waves of a
+    #      distribution; an Evaluator should only ever be used with one distribution
+    hits: int #scores that came out of the cache
+    misses: int #scores that had to be simulated
+    counts: outcomes.OutcomeCounts #every simulated castle
+
+    #Constructor
+    def __init__(self, shape_name: str, engine: str = "fast", max_wave_hits: int = None):
+        if shape_name not in ct.shape_list:
+            raise ValueError("Unknown shape: " + str(shape_name))
+        self.shape_name = shape_name
+        self.engine = engine
+        self.max_wave_hits = max_wave_hits if max_wave_hits is not None else ct.MAX_WAVE_HITS
+        self.cache = dict()
+        self.hits = 0
+        self.misses = 0
+        self.counts = outcomes.OutcomeCounts()
+
+    #returns the weighted average wave hits of the shape at a height over the waves
+    def expected_wave_hits(self, height: float, distribution: WaveDistribution) -> float:
+        key = (round(height, CACHE_DIGITS), len(distribution))
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+        self.misses += 1
+        total = 0.0
+        for (w, weight) in zip(distribution.waves, distribution.weights):
+            shape = ct.shape_with_height(self.shape_name, height)
+            (wave_hits, cause) = sampling.run_castle(shape, w, self.engine, self.counts, self.max_wave_hits)
+            total = total + weight * wave_hits
+        score = total / sum(distribution.weights)
+        self.cache[key] = score
+        return score
+
+
+#Best design found for a shape
+class Design:
+    shape_name: str
+    height: float
+    expected_wave_hits: float
+    evaluations: int #designs that were actually simulated
+    cached: int #designs that came out of the cache
+
+    #Constructor
+    def __init__(self, shape_name: str, height: float, expected_wave_hits: float, evaluator: Evaluator):
+        self.shape_name = shape_name
+        self.height = height
+        self.expected_wave_hits = expected_wave_hits
+        self.evaluations = evaluator.misses
+        self.cached = evaluator.hits
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return str(self.shape()) + " | expected wave hits: " + str(round(self.expected_wave_hits, 3)) + \
+               " | evaluations: " + str(self.evaluations) + " | cached: " + str(self.cached)
+
+    #returns the designed shape
+    def shape(self):
+        return ct.shape_with_height(self.shape_name, self.height)
+
+
+#Golden-section search for the height with the most expected wave hits in [low, high]
+#returns (height, expected wave hits)
+def golden_section(evaluator: Evaluator, distribution: WaveDistribution, low: float, high: float,
+                   tolerance: float = HEIGHT_TOLERANCE) -> tuple:
+    a = high - GOLDEN * (high - low)
+    b = low + GOLDEN * (high - low)
+    while high - low > tolerance:
+        if evaluator.expected_wave_hits(a, distribution) >= evaluator.expected_wave_hits(b, distribution):
+            high = b
+            b = a
+            a = high - GOLDEN * (high - low)
+        else:
+            low = a
+            a = b
+            b = low + GOLDEN * (high - low)
+    #the ends were never scored, so compare them with the middle too
+    candidates = [low, (low + high) / 2, high]
+    scores = [evaluator.expected_wave_hits(height, distribution) for height in candidates]
+    best = max(range(len(candidates)), key=lambda k: scores[k])
+    return (candidates[best], scores[best])
+
+#Successive-halving tournament over evenly spread heights in [low, high]
+#every round scores the heights still in it on twice as many waves as the round before (up to
+# the whole distribution) and keeps the better half
+#the rounds take their waves from the front of the distribution shuffled with seed, so every
+# round is a random subset of the next one and of the whole distribution
+#returns (height, expected wave hits)
+def successive_halving(evaluator: Evaluator, distribution: WaveDistribution, low: float, high: float,
+                       candidates: int = HALVING_CANDIDATES, first_round: int = HALVING_FIRST_ROUND,
+                       seed = HALVING_SEED) -> tuple:
+    if candidates < 2 or low == high:
+        heights = [low]
+    else:
+        heights = [low + k * (high - low) / (candidates - 1) for k in range(candidates)]
+    waves_this_round = min(first_round, len(distribution))
+    order = distribution.shuffled(seed)
+    while len(heights) > 1:
+        subset = order.head(waves_this_round)
+        heights = sorted(heights, key=lambda height: -evaluator.expected_wave_hits(height, subset))
+        heights = heights[:len(heights) // 2]
+        waves_this_round = min(2 * waves_this_round, len(distribution))
+    return (heights[0], evaluator.expected_wave_hits(heights[0], distribution))
+
+#Finds the height with the most expected wave hits for a shape at the current VOL
+#distribution defaults to the sweep's wave grid
+#returns a Design, or None if no height fits the bounds
+def optimize_shape(shape_name: str, method: str = "golden", distribution: WaveDistribution = None,
+                   engine: str = "fast", max_wave_hits: int = None):
+    if method not in METHODS:
+        raise ValueError("Unknown optimization method: " + str(method))
+    if distribution is None:
+        distribution = grid_waves()
+    bounds = height_bounds(shape_name)
+    if bounds is None:
+        return None
+    (low, high) = bounds
+    evaluator = Evaluator(shape_name, engine, max_wave_hits)
+    if low == high:
+        (height, score) = (low, evaluator.expected_wave_hits(low, distribution))
+    elif method == "golden":
+        (height, score) = golden_section(evaluator, distribution, low, high)
+    else:
+        (height, score) = successive_halving(evaluator, distribution, low, high)
+    return Design(shape_name, height, score, evaluator)
+
+#Optimizes every shape (default: all of them)
+#returns a dict of shape name -> Design (or None when no height fits the bounds)
+def optimize_all(shape_names = None, **options) -> dict:
+    if shape_names is None:
+        shape_names = ct.shape_list
+    return {shape_name: optimize_shape(shape_name, **options) for shape_name in shape_names}
@@ -0,0 +1,59 @@
+#Counters for how the castles in a sweep ended up
+#Each sweep (or each worker in a parallel sweep) keeps its own OutcomeCounts instead of
+# bumping module globals, and the counts from different workers get merged at the end
+
+'''
+CONSTANTS for use in the file
+'''
+SHAPES = ["cube", "cylinder", "pyramid", "cone"]
+#ways a run can end; same order as the stat printouts in castle_test.py
+CAUSES = ["erosion", "knockout", "rain", "did_not_fall"]
+
+
+#Per-shape tally of each failure cause
+class OutcomeCounts:
+    counts: dict #cause -> {shape name -> number of castles}
+
+    #Constructor
+    def __init__(self):
+        self.counts = dict()
+        for cause in CAUSES:
+            self.counts[cause] = dict()
+            for shape_name in SHAPES:
+                self.counts[cause][shape_name] = 0
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "Erosion stats: " + str(self.counts["erosion"]) + \
+               "\nKnockout stats: " + str(self.counts["knockout"]) + \
+               "\nRain stats: " + str(self.counts["rain"]) + \
+               "\nStill-standing stats: " + str(self.counts["did_not_fall"])
+
+    def __eq__(self, other):
+        return isinstance(other, OutcomeCounts) and self.counts == other.counts
+
+    #records n castles of a shape that ended up with the given cause
+    def add(self, shape_name: str, cause: str, n: int = 1):
+        if cause not in self.counts:
+            raise ValueError("Unknown failure cause: " + str(cause))
+        self.counts[cause][shape_name] = self.counts[cause].get(shape_name, 0) + n
+
+    #adds the counts from another OutcomeCounts into this one and returns this one
+    #addition doesn't care about order, so merging worker results is deterministic
+    def merge(self, other):
+        for cause in CAUSES:
+            for (shape_name, n) in other.counts[cause].items():
+                self.counts[cause][shape_name] = self.counts[cause].get(shape_name, 0) + n
+        return self
+
+    #returns how many castles of a shape were counted
+    def total(self, shape_name: str) -> int:
+        return sum(self.counts[cause].get(shape_name, 0) for cause in CAUSES)
+
+
+#returns a new OutcomeCounts holding the sum of all of the given ones
+def merge_all(all_counts) -> OutcomeCounts:
+    merged = OutcomeCounts()
+    for counts in all_counts:
+        merged.merge(counts)
+    return merged
@@ -1 +1,260 @@
+import os
+import numpy as np
+import matplotlib
+matplotlib.use("Agg") #draw straight to files, no window needed
 import matplotlib.pyplot as pyplot
+import outcomes
+
+#Plotting for sweep results
+#NOTE: importing this pulls in matplotlib, which takes about a second;
+#      sandcastle.py only imports it when a plot is asked for
+#Heatmaps of a results store are binned with numpy before matplotlib sees them: every shard is
+# read (memory-mapped) BIN_ROWS rows at a time and added into a fixed grid of (shape height x
+# wave height x distance) cells per shape, holding the sum of the wave hits and a count per
+# failure cause. Only those small grids are drawn, one imshow per panel, so drawing takes the
+# same time for a thousand rows or a hundred million; only the binning grows with the rows.
+#Each figure is drawn on its own, so a batch of them can be spread over worker processes.
+
+'''
+CONSTANTS for use in the file
+'''
+HEATMAP_BINS = 100 #most bins along each axis of a heatmap
+DISTANCE_BANDS = 4 #most bins along the distance axis, one panel each
+MAX_CELLS = 400 #most cells drawn along an axis; bigger grids are summed down before drawing
+BIN_ROWS = 1 << 20 #store rows binned at a time
+AXES = ["height", "wave_height", "wave_distance"]
+CAUSE_COLORS = {"erosion": "tab:orange", "knockout": "tab:red", "rain": "tab:blue", "did_not_fall": "tab:green"}
+
+
+#Bar chart of the average number of wave hits per shape from a sweep.SweepResult
+#saves the figure to path
+def plot_average_wave_hits(result, path: str):
+    shape_names = result.shape_names()
+    averages = [result.average_wave_hits(shape_name) for shape_name in shape_names]
+    figure = pyplot.figure()
+    axes = figure.add_subplot(1, 1, 1)
+    axes.bar(shape_names, averages)
+    axes.set_xlabel("Shape")
+    axes.set_ylabel("Average wave hits")
+    axes.set_title("Average wave hits before falling")
+    figure.savefig(path)
+    pyplot.close(figure)
+
+
+'''
+Binning
+'''
+#Binned wave hits and failure causes of one shape over (shape height x wave height x distance)
+class HeatmapGrid:
+    shape_name: str
+    ranges: list #(low, high) of the bins along each of AXES
+    hits: np.ndarray #sum of the wave hits in each cell
+    causes: np.ndarray #castles per failure cause in each cell, outcomes.CAUSES first
+    rows: int
+
+    #Constructor; ranges are the (low, high) of the values along each of AXES and bins the
+    # number of bins to give each axis
+    #the bins are centered on the ends of the ranges, so a regular sweep grid with as many values
+    # as bins lands one value per bin
+    def __init__(self, shape_name: str, ranges: list, bins: list):
+        self.shape_name = shape_name
+        self.ranges = list()
+        cells = list()
+        for ((low, high), n) in zip(ranges, bins):
+            if high <= low or n < 2:
+                (n, half) = (1, 0.5)
+            else:
+                half = (high - low) / (n - 1) / 2
+            self.ranges.append((low - half, high + half))
+            cells.append(n)
+        self.hits = np.zeros(cells)
+        self.causes = np.zeros((len(outcomes.CAUSES),) + self.hits.shape, dtype=np.int64)
+        self.rows = 0
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "HeatmapGrid: " + self.shape_name + " | cells: " + " x ".join(str(n) for n in self.hits.shape) + \
+               " | rows: " + str(self.rows)
+
+    #returns the flat cell number of every row of a dict of columns
+    def cells(self, columns: dict) -> np.ndarray:
+        cell = np.zeros(len(columns["wave_hits"]), dtype=np.int64)
+        for (axis, (low, high), n) in zip(AXES, self.ranges, self.hits.shape):
+            k = ((np.asarray(columns[axis], dtype=float) - low) / (high - low) * n).astype(np.int64)
+            cell = cell * n + np.clip(k, 0, n - 1)
+        return cell
+
+    #adds rows given as a dict of columns (height, wave_height, wave_distance, wave_hits, cause)
+    def add(self, columns: dict):
+        size = self.hits.size
+        cell = self.cells(columns)
+        self.hits += np.bincount(cell, weights=columns["wave_hits"], minlength=size).reshape(self.hits.shape)
+        flat = np.asarray(columns["cause"], dtype=np.int64) * size + cell
+        self.causes += np.bincount(flat, minlength=self.causes.size).reshape(self.causes.shape)
+        self.rows += len(cell)
+
+    #returns the number of castles in each cell
+    def counts(self) -> np.ndarray:
+        return self.causes.sum(axis=0)
+
+    #returns the edges of the bins along an axis
+    def edges(self, axis: str) -> np.ndarray:
+        k = AXES.index(axis)
+        (low, high) = self.ranges[k]
+        return np.linspace(low, high, self.hits.shape[k] + 1)
+
+    #returns [(distance low, distance high, hits, causes)], one per distance bin, with each
+    # panel summed down so no axis has more than MAX_CELLS cells
+    def bands(self) -> list:
+        edges = self.edges("wave_distance")
+        panels = list()
+        for k in range(len(edges) - 1):
+            causes = np.stack([coarsen(c[:, :, k]) for c in self.causes])
+            panels.append((edges[k], edges[k + 1], coarsen(self.hits[:, :, k]), causes))
+        return panels
+
+
+#returns a 2D array summed down in blocks so neither axis has more than MAX_CELLS cells
+def coarsen(array: np.ndarray, cells: int = MAX_CELLS) -> np.ndarray:
+    for axis in range(2):
+        n = array.shape[axis]
+        factor = -(-n // cells)
+        if factor <= 1:
+            continue
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (0, factor * (-(-n // factor)) - n)
+        array = np.pad(array, pad)
+        shape = list(array.shape)
+        shape[axis:axis + 1] = [shape[axis] // factor, factor]
+        array = array.reshape(shape).sum(axis=axis + 1)
+    return array
+
+#returns the number of distinct values a shape has along an axis in one shard, or more than most
+#shards from a sweep know it from their sweep settings (R-1 shape heights, or 1 for the cube,
+# and INC-1 values along each wave axis); others are scanned BIN_ROWS rows at a time, stopping
+# as soon as there are more than most
+def shard_distinct(meta: dict, index: int, axis: str, most: int) -> int:
+    settings = meta.get("source", dict()).get("sweep")
+    if settings and "R" in settings and "INC" in settings:
+        if axis == "height":
+            return 1 if outcomes.SHAPES[index] == "cube" else settings["R"] - 1
+        return settings["INC"] - 1
+    import results_store
+    (shape, column) = (results_store.load_column(meta["path"], "shape"), results_store.load_column(meta["path"], axis))
+    values = set()
+    for start in range(0, meta["rows"], BIN_ROWS):
+        mask = np.asarray(shape[start:start + BIN_ROWS]) == index
+        values.update(np.unique(np.asarray(column[start:start + BIN_ROWS])[mask]).tolist())
+        if len(values) > most:
+            break
+    return len(values)
+
+#returns the bins to give a shape along each of AXES, at most bins (bands along the distance)
+#one value per bin when all the shape's shards hold the same grid (same sweep settings and the
+# same range); shards with different grids get as many bins as they have values between them,
+# which is at least one per value
+def grid_bins(metas: list, index: int, bins: int, bands: int) -> list:
+    sources = [meta.get("source", dict()).get("sweep") for meta in metas]
+    same_sweep = all(sources) and all(source == sources[0] for source in sources)
+    counts = list()
+    for (axis, most) in zip(AXES, [bins, bins, bands]):
+        same = same_sweep and all((meta["min"][axis], meta["max"][axis]) == (metas[0]["min"][axis], metas[0]["max"][axis])
+                                  for meta in metas)
+        distinct = [shard_distinct(meta, index, axis, most) for meta in (metas[:1] if same else metas)]
+        counts.append(max(1, min(sum(distinct), most)))
+    return counts
+
+#Bins the rows of a results_store.ResultsStore into a HeatmapGrid per shape
+#the ranges come from the shards' meta.json min/max, and the bins along each axis from the
+# distinct values over all the shape's shards (see grid_bins), so a store of sweeps with
+# different grids doesn't get binned by the first one alone
+#returns {shape name: HeatmapGrid} for the shapes that have rows
+def bin_store(store, shape_names = None, bins: int = HEATMAP_BINS, bands: int = DISTANCE_BANDS) -> dict:
+    import results_store
+    if shape_names is None:
+        shape_names = outcomes.SHAPES
+    indexes = [outcomes.SHAPES.index(shape_name) for shape_name in shape_names]
+    metas = [meta for meta in store.metas() if meta["rows"] > 0 and results_store.shard_might_match(meta, {"shape": indexes})]
+    needed = AXES + ["wave_hits", "cause"]
+    grids = dict()
+    for meta in metas:
+        columns = {name: results_store.load_column(meta["path"], name) for name in needed + ["shape"]}
+        for start in range(0, meta["rows"], BIN_ROWS):
+            chunk = {name: np.asarray(column[start:start + BIN_ROWS]) for (name, column) in columns.items()}
+            for index in np.unique(chunk["shape"]).tolist():
+                if index not in indexes:
+                    continue
+                mask = chunk["shape"] == index
+                rows = {name: chunk[name][mask] for name in needed}
+                shape_name = outcomes.SHAPES[index]
+                if shape_name not in grids:
+                    shards = [other for other in metas if results_store.shard_might_match(other, {"shape": [index]})]
+                    ranges = [(min(other["min"][axis] for other in shards), max(other["max"][axis] for other in shards))
+                              for axis in AXES]
+                    grids[shape_name] = HeatmapGrid(shape_name, ranges, grid_bins(shards, index, bins, bands))
+                grids[shape_name].add(rows)
+    return {shape_name: grids[shape_name] for shape_name in shape_names if shape_name in grids}
+
+
+'''
+Drawing
+'''
+#returns the (kind, shape name, panels, extent, path) tasks for drawing the wave-hits and
+# failure-cause heatmaps of every grid into directory
+def heatmap_tasks(grids: dict, directory: str) -> list:
+    tasks = list()
+    for (shape_name, grid) in grids.items():
+        (wave_edges, height_edges) = (grid.edges("wave_height"), grid.edges("height"))
+        extent = (wave_edges[0], wave_edges[-1], height_edges[0], height_edges[-1])
+        panels = grid.bands()
+        for kind in ["hits", "causes"]:
+            path = os.path.join(directory, shape_name + "_" + kind + ".png")
+            tasks.append((kind, shape_name, panels, extent, path))
+    return tasks
+
+#Draws one heatmap task: a panel per distance band, shape height up and wave height across
+#returns the path it was saved to
+def draw_heatmap(task: tuple) -> str:
+    from matplotlib.colors import ListedColormap
+    from matplotlib.patches import Patch
+    (kind, shape_name, panels, extent, path) = task
+    figure = pyplot.figure(figsize=(4 * len(panels), 4))
+    color_map = ListedColormap([CAUSE_COLORS[cause] for cause in outcomes.CAUSES])
+    top = max((np.nanmax(hits / np.maximum(causes.sum(axis=0), 1)) for (low, high, hits, causes) in panels), default=1)
+    image = None
+    for (k, (low, high, hits, causes)) in enumerate(panels):
+        axes = figure.add_subplot(1, len(panels), k + 1)
+        counts = causes.sum(axis=0)
+        if kind == "hits":
+            cells = np.ma.masked_where(counts == 0, hits / np.maximum(counts, 1))
+            image = axes.imshow(cells, origin="lower", aspect="auto", extent=extent, interpolation="nearest",
+                                vmin=0, vmax=max(top, 1))
+        else:
+            cells = np.ma.masked_where(counts == 0, causes.argmax(axis=0))
+            axes.imshow(cells, origin="lower", aspect="auto", extent=extent, interpolation="nearest",
+                        cmap=color_map, vmin=-0.5, vmax=len(outcomes.CAUSES) - 0.5)
+        axes.set_title("distance " + str(round(low, 2)) + "-" + str(round(high, 2)) + " m", fontsize=9)
+        axes.set_xlabel("Wave height (m)")
+        if k == 0:
+            axes.set_ylabel(shape_name.capitalize() + " height (m)")
+    if kind == "hits":
+        figure.colorbar(image, ax=figure.axes, label="Average wave hits")
+        figure.suptitle(shape_name.capitalize() + ": average wave hits before falling")
+    else:
+        figure.legend(handles=[Patch(color=CAUSE_COLORS[cause], label=cause) for cause in outcomes.CAUSES],
+                      loc="lower right", fontsize=8)
+        figure.suptitle(shape_name.capitalize() + ": most common failure cause")
+    figure.savefig(path)
+    pyplot.close(figure)
+    return path
+
+#Draws the heatmaps of every grid into directory, over jobs worker processes
+#returns the paths of the figures
+def render_heatmaps(grids: dict, directory: str, jobs: int = 1) -> list:
+    os.makedirs(directory, exist_ok=True)
+    tasks = heatmap_tasks(grids, directory)
+    if jobs == 1 or len(tasks) <= 1:
+        return [draw_heatmap(task) for task in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(draw_heatmap, tasks))
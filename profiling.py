@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+from collections import Counter
+import castle_test as ct
+import calculations as calc
+import sand_castle_shapes as shapes
+
+#Opt-in timers and call counters for the per-hit loop
+#enable() swaps each function in PHASES for a wrapper that counts its calls and times them, and
+# wraps simulate_castle (and fast_forward.fast_forward) to keep a histogram of the wave hits of
+# every castle by shape; disable() puts the originals back. Nothing is wrapped until enable() is
+# called, so a run that isn't being profiled runs exactly the same code as before.
+#Timers nest (erode_shape calls get_eroding_surface_area, for example), so every timer keeps its
+# total time and its self time, the part not spent in other timers; the phase breakdown adds up
+# self times, so a second is never counted twice.
+#Turned on with `python sandcastle.py --profile ...` or by setting SANDCASTLE_PROFILE=1
+#NOTE: only the process that called enable() is profiled; with --jobs above 1 the castles run
+#      in worker processes and don't show up, and the batch engine has no per-hit loop to time
+
+'''
+CONSTANTS for use in the file
+'''
+ENV_VAR = "SANDCASTLE_PROFILE" #any value but "" or "0" turns profiling on
+#phase -> (owner, attribute) of every function timed under it
+PHASES = {"geometry": [(cls, name) for cls in (shapes.Cube, shapes.Cylinder, shapes.Pyramid, shapes.Cone)
+                       for name in ("get_eroding_surface_area", "get_cross_sectional_area")],
+          "strength": [(calc, "maximum_shear_strength"), (ct, "survives_wave_hit"), (ct, "survives_erosion"),
+                       (ct, "critical_height")],
+          "rain": [(ct, "rain_on_shape")],
+          "erosion": [(ct, "erode_shape")]}
+CASTLE_TIMER = "castle" #timer around a whole castle; its self time is the loop itself
+HISTOGRAM_EDGES = [0, 1, 2, 5, 10, 25, 50, 100, 200] #low end of every wave hit bucket
+
+
+#returns true if the environment variable asks for profiling
+def requested() -> bool:
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+#returns the printable name of a timed function
+def timer_name(owner, attribute: str) -> str:
+    return owner.__name__ + "." + attribute
+
+
+#Timers, call counters and wave hit histograms for one profiled run
+class Profiler:
+    timers: dict #timer name -> [calls, total seconds, seconds spent in other timers]
+    phases: dict #timer name -> phase
+    histograms: dict #shape name -> Counter of wave hits -> castles
+    stack: list #seconds spent in other timers by each timed call that is still running
+    originals: list #(owner, attribute, function) to put back on disable
+    started: float #perf_counter when enabled, None when it isn't
+    elapsed: float #seconds enabled before the last disable
+
+    #Constructor
+    def __init__(self):
+        self.timers = dict()
+        self.phases = dict()
+        self.histograms = dict()
+        self.stack = list()
+        self.originals = list()
+        self.started = None
+        self.elapsed = 0.0
+
+    #returns a wrapper around function that adds every call to the named timer
+    def timed(self, name: str, function):
+        timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+        stack = self.stack
+        clock = time.perf_counter
+        def wrapper(*args, **kwargs):
+            stack.append(0.0)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                timer[0] += 1
+                timer[1] += elapsed
+                timer[2] += stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+        wrapper.__name__ = function.__name__
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    #returns a timed wrapper around a castle simulation that also adds its wave hits to the histogram
+    def counted(self, function):
+        timed = self.timed(CASTLE_TIMER, function)
+        histograms = self.histograms
+        def wrapper(shape, *args, **kwargs):
+            result = timed(shape, *args, **kwargs)
+            shape_name = shape.string_name()
+            if shape_name not in histograms:
+                histograms[shape_name] = Counter()
+            histograms[shape_name][result[0]] += 1
+            return result
+        wrapper.__name__ = function.__name__
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    #swaps in the wrapper for owner.attribute and remembers the original
+    def patch(self, owner, attribute: str, wrapper):
+        self.originals.append((owner, attribute, getattr(owner, attribute)))
+        setattr(owner, attribute, wrapper)
+
+    #Wraps every function in PHASES and the castle simulations
+    def enable(self):
+        if self.started is not None:
+            return
+        import fast_forward
+        for (phase, targets) in PHASES.items():
+            for (owner, attribute) in targets:
+                name = timer_name(owner, attribute)
+                self.phases[name] = phase
+                self.patch(owner, attribute, self.timed(name, getattr(owner, attribute)))
+        self.phases[CASTLE_TIMER] = "loop"
+        self.patch(ct, "simulate_castle", self.counted(ct.simulate_castle))
+        self.patch(fast_forward, "fast_forward", self.counted(fast_forward.fast_forward))
+        self.started = time.perf_counter()
+
+    #Puts the original functions back; the numbers collected so far are kept
+    def disable(self):
+        if self.started is None:
+            return
+        for (owner, attribute, function) in reversed(self.originals):
+            setattr(owner, attribute, function)
+        self.originals = list()
+        self.elapsed = self.elapsed + time.perf_counter() - self.started
+        self.started = None
+
+    #returns the seconds profiled so far
+    def wall_time(self) -> float:
+        if self.started is None:
+            return self.elapsed
+        return self.elapsed + time.perf_counter() - self.started
+
+    #returns {phase: self seconds} over every timer; "loop" is the time in the castle loop itself
+    def phase_breakdown(self) -> dict:
+        breakdown = dict()
+        for (name, (calls, total, child)) in self.timers.items():
+            phase = self.phases[name]
+            breakdown[phase] = breakdown.get(phase, 0.0) + total - child
+        return breakdown
+
+    #returns {bucket label: castles} for one shape, using HISTOGRAM_EDGES
+    def bucketed(self, shape_name: str) -> dict:
+        buckets = dict()
+        edges = HISTOGRAM_EDGES
+        for k in range(len(edges)):
+            if k + 1 == len(edges):
+                label = str(edges[k]) + "+"
+            elif edges[k + 1] - edges[k] == 1:
+                label = str(edges[k])
+            else:
+                label = str(edges[k]) + "-" + str(edges[k + 1] - 1)
+            buckets[label] = 0
+        labels = list(buckets.keys())
+        for (wave_hits, castles) in self.histograms.get(shape_name, dict()).items():
+            k = len(edges) - 1
+            while edges[k] > wave_hits:
+                k = k - 1
+            buckets[labels[k]] += castles
+        return buckets
+
+    #returns everything collected as a JSON-ready dict
+    def to_dict(self) -> dict:
+        return {"wall_seconds": self.wall_time(),
+                "phases": self.phase_breakdown(),
+                "timers": {name: {"phase": self.phases[name], "calls": calls, "seconds": total, "self_seconds": total - child}
+                           for (name, (calls, total, child)) in self.timers.items()},
+                "histograms": {shape_name: {str(wave_hits): castles for (wave_hits, castles) in sorted(histogram.items())}
+                               for (shape_name, histogram) in self.histograms.items()}}
+
+    #returns the breakdown and histograms as printable lines
+    def report(self) -> list:
+        lines = list()
+        breakdown = self.phase_breakdown()
+        timed = sum(breakdown.values())
+        lines.append("Profile: " + str(round(self.wall_time(), 3)) + " s wall | " + str(round(timed, 3)) + " s in the castle loop")
+        for (phase, seconds) in sorted(breakdown.items(), key=lambda item: -item[1]):
+            share = 100 * seconds / timed if timed > 0 else 0.0
+            lines.append("  " + phase + ": " + str(round(seconds, 4)) + " s (" + str(round(share, 1)) + "%)")
+        lines.append("Timers (calls | total s | self s):")
+        for (name, (calls, total, child)) in sorted(self.timers.items(), key=lambda item: -(item[1][1] - item[1][2])):
+            if calls == 0:
+                continue
+            lines.append("  " + name + " [" + self.phases[name] + "]: " + str(calls) + " | " +
+                         str(round(total, 4)) + " | " + str(round(total - child, 4)))
+        for shape_name in sorted(self.histograms):
+            castles = sum(self.histograms[shape_name].values())
+            lines.append(shape_name.capitalize() + " wave hits (" + str(castles) + " castles):")
+            for (label, count) in self.bucketed(shape_name).items():
+                lines.append("  " + label.rjust(7) + ": " + str(count))
+        return lines
+
+
+#Starts profiling and returns the Profiler
+def enable() -> Profiler:
+    profiler = Profiler()
+    profiler.enable()
+    return profiler
+
+#Stops profiling and prints the report to stderr, so it doesn't mix with the results on stdout
+def finish(profiler: Profiler, stream = None):
+    profiler.disable()
+    if stream is None:
+        stream = sys.stderr
+    for line in profiler.report():
+        print(line, file=stream)
@@ -0,0 +1,125 @@
+from array import array
+import tracemalloc
+import sand_castle_shapes as shapes
+import wave as waves
+import outcomes
+
+#Packed per-run results
+#castle_test.shape_loop used to keep a (wave_hits, shape, wave) tuple of full Python objects for
+# every castle in the sweep, which adds up to gigabytes at R=1001 just to take an average.
+#RunRecords keeps the same information as one typed array per field instead (struct of arrays),
+# about 50 bytes a castle; the shape and the wave are only built again when a row is asked for.
+
+'''
+CONSTANTS for use in the file
+'''
+FLOAT_FIELDS = ["dim_a", "dim_b", "wave_height", "break_depth", "wave_distance"]
+#the constructor arguments of each shape, as (dim_a, dim_b)
+SHAPE_DIMS = {"cube": ("side_length", "height"), "cylinder": ("radius", "height"),
+              "pyramid": ("side_length", "height"), "cone": ("radius", "height")}
+BENCHMARK_CASTLES = 2000 #castles simulated by bytes_per_castle
+
+
+#Results of a run of castles of one shape, one row per castle
+class RunRecords:
+    shape_name: str
+    wave_hits: array
+    causes: bytearray #index into outcomes.CAUSES, one per castle
+    dim_a: array #first constructor argument of the shape, see SHAPE_DIMS
+    dim_b: array #second constructor argument of the shape (the cube's is its side again)
+    wave_height: array
+    break_depth: array
+    wave_distance: array
+
+    #Constructor
+    def __init__(self, shape_name: str):
+        if shape_name not in SHAPE_DIMS:
+            raise ValueError("Unknown shape: " + str(shape_name))
+        self.shape_name = shape_name
+        self.wave_hits = array("l")
+        self.causes = bytearray()
+        for name in FLOAT_FIELDS:
+            setattr(self, name, array("d"))
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "RunRecords: " + self.shape_name + " | castles: " + str(len(self)) + " | bytes: " + str(self.nbytes())
+
+    def __len__(self) -> int:
+        return len(self.wave_hits)
+
+    #returns row k as (wave_hits, shape, wave) like the old shape_loop tuples
+    #NOTE: the shape is built again from its dimensions, so it is the uneroded castle
+    def __getitem__(self, k: int) -> tuple:
+        return (self.wave_hits[k], self.shape(k), self.wave(k))
+
+    #adds a castle's result
+    def append(self, wave_hits: int, cause: str, shape, wave):
+        (a, b) = SHAPE_DIMS[self.shape_name]
+        self.wave_hits.append(wave_hits)
+        self.causes.append(outcomes.CAUSES.index(cause))
+        self.dim_a.append(getattr(shape, a))
+        self.dim_b.append(getattr(shape, b))
+        self.wave_height.append(wave.wave_height)
+        self.break_depth.append(wave.break_depth)
+        self.wave_distance.append(wave.wave_distance_past_castle)
+
+    #returns the failure cause of row k
+    def cause(self, k: int) -> str:
+        return outcomes.CAUSES[self.causes[k]]
+
+    #returns a fresh (uneroded) shape for row k
+    def shape(self, k: int):
+        if self.shape_name == "cube":
+            return shapes.Cube(self.dim_a[k])
+        elif self.shape_name == "cylinder":
+            return shapes.Cylinder(self.dim_a[k], self.dim_b[k])
+        elif self.shape_name == "pyramid":
+            return shapes.Pyramid(self.dim_a[k], self.dim_b[k])
+        return shapes.Cone(self.dim_a[k], self.dim_b[k])
+
+    #returns the Wave for row k
+    def wave(self, k: int):
+        return waves.Wave(self.wave_height[k], self.break_depth[k], self.wave_distance[k])
+
+    #returns the average number of wave hits
+    def average_wave_hits(self) -> float:
+        return sum(self.wave_hits) / len(self.wave_hits)
+
+    #returns the bytes taken up by the packed fields
+    def nbytes(self) -> int:
+        total = len(self.wave_hits) * self.wave_hits.itemsize + len(self.causes)
+        for name in FLOAT_FIELDS:
+            column = getattr(self, name)
+            total += len(column) * column.itemsize
+        return total
+
+
+#Memory benchmark: simulates count castles of the sweep and keeps their results either as
+# (wave_hits, shape, wave) tuples (packed=False, the old shape_loop) or as RunRecords
+#returns the bytes kept alive per castle, measured with tracemalloc
+def bytes_per_castle(shape_name: str, packed: bool, count: int = BENCHMARK_CASTLES) -> float:
+    import castle_test as ct
+    points = list()
+    for point in ct.sweep_points(shape_name):
+        points.append(point)
+        if len(points) == count:
+            break
+    counts = outcomes.OutcomeCounts()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        results = RunRecords(shape_name) if packed else list()
+        for (i, h, d, dist) in points:
+            shape = ct.build_shape(shape_name, i)
+            w = ct.build_wave(h, d, dist)
+            (wave_hits, cause) = ct.simulate_castle(shape, w, counts)
+            if packed:
+                results.append(wave_hits, cause, shape, w)
+            else:
+                results.append((wave_hits, shape, w))
+        shape = w = None
+        kept = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return kept / len(points)
@@ -0,0 +1,236 @@
+import itertools
+from collections import deque
+import castle_test as ct
+import wave as waves
+import outcomes
+
+#Adaptive sweep that maps where the castles stop surviving
+#Most of the uniform grid lands where every castle survives all MAX_WAVE_HITS or falls on the
+# first hit, so instead this starts with a few coarse cells over the sweep ranges and only splits
+# (in half along every dimension) the cells whose corners disagree on the failure cause (and,
+# if a hit_tolerance is given, on the wave hits), down to 2^max_depth steps per dimension.
+#Corners are shared between neighbouring cells and only ever simulated once, and some are never
+# simulated at all because monotonicity already says how they end: a castle knocked over by the
+# very first wave is knocked over by any wave at least as tall and breaking at least as deep, at any
+# distance (a taller wave hits more surface and leaves less sand on top holding the base together,
+# a deeper one is faster, and nothing has eroded yet), as long as the wave is lower than the castle;
+# waves over the top of a cone or pyramid give negative areas and the rule breaks down
+#NOTE: there is no rule like that for survivors; a pyramid that survives every hit of a wave can
+#      still erode away under a smaller or shorter one. check_pruning runs the pruned corners for
+#      real to test the knockout rule
+
+'''
+CONSTANTS for use in the file
+'''
+DIMENSIONS = ["shape_height", "wave_height", "break_depth", "distance"]
+FIRST_HIT = ["wave_height", "break_depth"] #bigger knocks a castle over on the first hit at least as easily
+DEFAULT_MAX_DEPTH = 5 #finest cells are 1/32 of each range
+DEFAULT_START_DEPTH = 1 #start with 2 cells per dimension
+
+
+#Outcome of every corner the refinement looked at, and the cells it ended up with
+class RefinedMap:
+    shape_name: str
+    dimensions: list #names of the dimensions that vary, the rest sit in the middle of their range
+    max_depth: int
+    points: dict #lattice coordinate tuple -> (wave_hits, cause)
+    implied: set #lattice coordinates whose outcome came from monotonicity, not a simulation
+    leaves: list #(low corner, size) of every cell that wasn't split any further
+    counts: outcomes.OutcomeCounts #one per simulated corner
+
+    #Constructor
+    def __init__(self, shape_name: str, dimensions: list, max_depth: int):
+        self.shape_name = shape_name
+        self.dimensions = dimensions
+        self.max_depth = max_depth
+        self.points = dict()
+        self.implied = set()
+        self.leaves = list()
+        self.counts = outcomes.OutcomeCounts()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "RefinedMap: " + self.shape_name + " | dimensions: " + ", ".join(self.dimensions) + \
+               " | simulated: " + str(self.simulated()) + " | implied: " + str(len(self.implied)) + \
+               " | full grid: " + str(self.full_grid_size()) + " | boundary cells: " + str(len(self.boundary_cells()))
+
+    #returns the number of steps along each dimension at the finest level
+    def resolution(self) -> int:
+        return 2**self.max_depth
+
+    #returns how many corners were actually simulated
+    def simulated(self) -> int:
+        return len(self.points) - len(self.implied)
+
+    #returns how many castles the uniform grid at the finest level would have simulated
+    def full_grid_size(self) -> int:
+        return (self.resolution() + 1)**len(self.dimensions)
+
+    #returns the finest cells whose corners still disagree; this is the mapped boundary
+    def boundary_cells(self) -> list:
+        return [(low, size) for (low, size) in self.leaves if size == 1 and not corners_agree(self, low, size)]
+
+    #returns the physical values (shape_height, wave_height, break_depth, distance) of a lattice coordinate
+    def values(self, coordinate: tuple) -> dict:
+        values = dict()
+        for name in DIMENSIONS:
+            (low, high) = dimension_range(name)
+            if name in self.dimensions:
+                u = coordinate[self.dimensions.index(name)] / self.resolution()
+            else:
+                u = 0.5
+            values[name] = low + u * (high - low)
+        return values
+
+
+#returns the (low, high) range of a dimension
+def dimension_range(name: str) -> tuple:
+    if name == "shape_height":
+        return (ct.START_SHAPE_HEIGHT, ct.END_SHAPE_HEIGHT)
+    elif name == "wave_height":
+        return (ct.START_HEIGHT, ct.END_HEIGHT)
+    elif name == "break_depth":
+        return (ct.START_DEPTH, ct.END_DEPTH)
+    elif name == "distance":
+        return (ct.START_DISTANCE, ct.END_DISTANCE)
+    raise ValueError("Unknown dimension: " + str(name))
+
+#returns the corners of a cell
+def cell_corners(low: tuple, size: int) -> list:
+    return [tuple(l + size * bit for (l, bit) in zip(low, bits)) for bits in itertools.product((0, 1), repeat=len(low))]
+
+#returns true if every corner of the cell has the same cause and (unless hit_tolerance is None)
+# wave hits within hit_tolerance of each other
+def corners_agree(refined: RefinedMap, low: tuple, size: int, hit_tolerance: int = None) -> bool:
+    outcomes_seen = [refined.points[corner] for corner in cell_corners(low, size)]
+    causes = set(cause for (wave_hits, cause) in outcomes_seen)
+    if len(causes) != 1:
+        return False
+    if hit_tolerance is None:
+        return True
+    hits = [wave_hits for (wave_hits, cause) in outcomes_seen]
+    return max(hits) - min(hits) <= hit_tolerance
+
+#Corners known to have been knocked over by the first hit, kept as a frontier: for each value of
+# the dimensions that have to match (the shape height), only the mildest knockouts are kept, so
+# lookups stay quick however many corners there are
+class Frontier:
+    first_hit: list #positions of the FIRST_HIT dimensions
+    fixed: list #positions of the dimensions that have to match (not distance, it doesn't matter)
+    knocked_over: dict #values of the fixed dimensions -> list of coordinates
+
+    #Constructor
+    def __init__(self, dimensions: list):
+        self.first_hit = [k for (k, name) in enumerate(dimensions) if name in FIRST_HIT]
+        self.fixed = [k for (k, name) in enumerate(dimensions) if name not in FIRST_HIT and name != "distance"]
+        self.knocked_over = dict()
+
+    #returns true if a is at most b along every FIRST_HIT dimension
+    def milder(self, a: tuple, b: tuple) -> bool:
+        return all(a[k] <= b[k] for k in self.first_hit)
+
+    #remembers a corner knocked over by the first hit, unless a milder one is already there
+    def add_knockout(self, coordinate: tuple):
+        frontier = self.knocked_over.setdefault(tuple(coordinate[k] for k in self.fixed), list())
+        if any(self.milder(other, coordinate) for other in frontier):
+            return
+        frontier[:] = [other for other in frontier if not self.milder(coordinate, other)]
+        frontier.append(coordinate)
+
+    #returns the outcome monotonicity implies for a coordinate, or None
+    def implied_outcome(self, coordinate: tuple):
+        for other in self.knocked_over.get(tuple(coordinate[k] for k in self.fixed), ()):
+            if self.milder(other, coordinate):
+                return (0, "knockout")
+        return None
+
+#returns true if the wave at a lattice coordinate is lower than the castle there
+def wave_below_top(refined: RefinedMap, coordinate: tuple) -> bool:
+    values = refined.values(coordinate)
+    return values["wave_height"] < ct.shape_with_height(refined.shape_name, values["shape_height"]).height
+
+#simulates the castle at a lattice coordinate
+#returns (wave_hits, cause)
+def simulate_point(refined: RefinedMap, coordinate: tuple, engine: str, max_wave_hits: int) -> tuple:
+    values = refined.values(coordinate)
+    shape = ct.shape_with_height(refined.shape_name, values["shape_height"])
+    w = waves.Wave(values["wave_height"], values["break_depth"], values["distance"])
+    if engine == "fast":
+        import fast_forward
+        (wave_hits, cause) = fast_forward.fast_forward(shape, w, max_wave_hits)
+        refined.counts.add(refined.shape_name, cause)
+        return (wave_hits, cause)
+    elif engine == "scalar":
+        return ct.simulate_castle(shape, w, refined.counts, max_wave_hits)
+    raise ValueError("Unknown engine: " + str(engine))
+
+#Maps one shape's survive/fail boundary by recursively splitting the cells whose corners disagree
+#dimensions picks what varies (default: all of DIMENSIONS, without shape_height for the cube)
+#cells whose corners share a cause aren't split, unless hit_tolerance is given and their wave hits
+# are further apart than that
+#prune=False simulates every corner instead of filling some in from monotonicity
+#returns a RefinedMap
+def refine(shape_name: str, dimensions: list = None, max_depth: int = DEFAULT_MAX_DEPTH,
+           start_depth: int = DEFAULT_START_DEPTH, hit_tolerance: int = None, prune: bool = True,
+           engine: str = "scalar", max_wave_hits: int = None) -> RefinedMap:
+    if shape_name not in ct.shape_list:
+        raise ValueError("Unknown shape: " + str(shape_name))
+    if dimensions is None:
+        dimensions = [name for name in DIMENSIONS if not (shape_name == "cube" and name == "shape_height")]
+    for name in dimensions:
+        if name not in DIMENSIONS:
+            raise ValueError("Unknown dimension: " + str(name))
+    if not 0 <= start_depth <= max_depth:
+        raise ValueError("start_depth has to be between 0 and max_depth")
+    if max_wave_hits is None:
+        max_wave_hits = ct.MAX_WAVE_HITS
+    refined = RefinedMap(shape_name, list(dimensions), max_depth)
+    frontier = Frontier(refined.dimensions)
+
+    #returns the outcome at a corner, simulating it only if it isn't known or implied
+    def outcome_at(coordinate: tuple) -> tuple:
+        if coordinate in refined.points:
+            return refined.points[coordinate]
+        result = None
+        if prune and wave_below_top(refined, coordinate):
+            result = frontier.implied_outcome(coordinate)
+        if result is not None:
+            refined.implied.add(coordinate)
+        else:
+            result = simulate_point(refined, coordinate, engine, max_wave_hits)
+            if result == (0, "knockout"):
+                frontier.add_knockout(coordinate)
+        refined.points[coordinate] = result
+        return result
+
+    #breadth first, so the coarse corners that prune the most get found first
+    size = 2**(max_depth - start_depth)
+    steps = range(0, refined.resolution(), size)
+    cells = deque((low, size) for low in itertools.product(steps, repeat=len(dimensions)))
+    while cells:
+        (low, size) = cells.popleft()
+        for corner in cell_corners(low, size):
+            outcome_at(corner)
+        if size == 1 or corners_agree(refined, low, size, hit_tolerance):
+            refined.leaves.append((low, size))
+            continue
+        half = size // 2
+        for bits in itertools.product((0, 1), repeat=len(dimensions)):
+            cells.append((tuple(l + half * bit for (l, bit) in zip(low, bits)), half))
+    return refined
+
+#Simulates every corner of a RefinedMap that was filled in from monotonicity
+#returns the coordinates where the simulation disagrees with what was implied
+def check_pruning(refined: RefinedMap, engine: str = "scalar", max_wave_hits: int = None) -> list:
+    if max_wave_hits is None:
+        max_wave_hits = ct.MAX_WAVE_HITS
+    mismatches = list()
+    counts = refined.counts
+    refined.counts = outcomes.OutcomeCounts()
+    try:
+        for coordinate in sorted(refined.implied):
+            if simulate_point(refined, coordinate, engine, max_wave_hits) != refined.points[coordinate]:
+                mismatches.append(coordinate)
+    finally:
+        refined.counts = counts
+    return mismatches
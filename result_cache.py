@@ -0,0 +1,210 @@
+import time
+import sqlite3
+import hashlib
+import castle_test as ct
+import calculations as calc
+import sand_castle_shapes as shapes
+import outcomes
+import records
+
+#Disk cache of castle outcomes, addressed by what the outcome depends on
+#Every castle hashes (shape, its dimensions, the wave, MAX_WAVE_HITS and the material constants
+# at the top of castle_test.py / sand_castle_shapes.py) to a key, and the (wave_hits, cause)
+# it ended up with is stored under that key in an sqlite file, so a sweep that repeats or
+# overlaps an earlier one only simulates the castles it hasn't seen before.
+#The rain constants (AVG_RAINFALL_PER_WAVE, INITIAL_SATURATION, OVERSATURATED) are only hashed
+# into the key of castles that fell to the rain. Nothing else in the per-hit loop depends on
+# the saturation, and rain_on_shape is the same for every hit of a castle, so a castle that
+# fell some other way after N hits goes exactly the same way under any rain unless the
+# saturation crosses OVERSATURATED first; that crossing is worked out from the stored N with
+# fast_forward.first_crossing, so changing RAIN_MULTIPLIER doesn't throw the cache away.
+#The cache holds at most max_entries outcomes; past that the least recently used ones go.
+
+'''
+CONSTANTS for use in the file
+'''
+MODEL_VERSION = 1 #bump when the simulation changes, so old outcomes are never handed back
+DEFAULT_MAX_ENTRIES = 1000000 #about 90 bytes each on disk
+EVICT_TO = 0.9 #eviction cuts the cache down to this fraction of max_entries
+LOOKUP_BATCH = 500 #keys per SELECT
+#constants every outcome depends on
+MATERIAL_CONSTANTS = [(ct, "SAND_DENSITY"), (ct, "SAND_DIAMETER"), (ct, "WATER_DENSITY"), (ct, "GRAVITY"),
+                      (ct, "Z"), (ct, "J"), (ct, "E"), (ct, "ALPHA"), (ct, "GAMMA"),
+                      (shapes, "SAND_DENSITY"), (shapes, "SAND_VOLUME"), (shapes, "WATER_DENSITY"), (shapes, "GRAVITY"),
+                      (calc, "MU"), (calc, "PHI"), (calc, "KAPPA"), (calc, "S"), (calc, "SAND_SIZE")]
+#constants only the castles that fell to the rain depend on
+RAIN_CONSTANTS = [(ct, "AVG_RAINFALL_PER_WAVE"), (ct, "INITIAL_SATURATION"), (ct, "OVERSATURATED")]
+
+
+#returns the current values of a list of (module, name) constants
+def constant_values(constants: list) -> tuple:
+    return tuple(getattr(module, name) for (module, name) in constants)
+
+#returns the shape, wave and limit part of a castle's key
+#repr keeps every float exactly, so two castles only share a key if they are the same castle
+def castle_part(shape, w, max_wave_hits: int) -> bytes:
+    shape_name = shape.string_name()
+    dims = tuple(getattr(shape, name) for name in records.SHAPE_DIMS[shape_name])
+    return repr((shape_name, dims, w.wave_height, w.break_depth, w.wave_speed, w.wave_distance_past_castle,
+                 max_wave_hits)).encode()
+
+#returns the outcome a castle that went (wave_hits, cause) without the rain has under the current
+# rain constants, following the order of the checks in castle_test.simulate_castle
+def with_rain(shape, w, wave_hits: int, cause: str) -> tuple:
+    if wave_hits == 0:
+        return (wave_hits, cause)
+    if ct.INITIAL_SATURATION > ct.OVERSATURATED:
+        return (0, "rain")
+    shape.set_base_height(w.wave_height)
+    rain = ct.rain_on_shape(shape)
+    if rain <= 0:
+        return (wave_hits, cause)
+    import fast_forward
+    crossing = fast_forward.first_crossing(ct.INITIAL_SATURATION, rain, ct.OVERSATURATED, wave_hits - 1)
+    if crossing is None:
+        return (wave_hits, cause)
+    return (crossing, "rain")
+
+
+#sqlite file of castle outcomes
+class ResultCache:
+    path: str
+    max_entries: int
+    connection: sqlite3.Connection
+    dry_prefix: bytes #hashed before the castle part for outcomes that don't depend on the rain
+    rain_prefix: bytes #hashed before the castle part for castles that fell to the rain
+    hits: int #castles handed back this session
+    rain_hits: int #hits that were worked out again for the current rain constants
+    misses: int #castles that had to be simulated this session
+    evicted: int #outcomes thrown out this session
+
+    #Constructor; opens (or makes) the cache file
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if max_entries < 1:
+            raise ValueError("max_entries has to be at least 1")
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS outcomes (key BLOB PRIMARY KEY, wave_hits INTEGER, "
+                                "cause INTEGER, used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outcomes_used ON outcomes (used)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.commit()
+        self.hits = 0
+        self.rain_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.refresh_constants()
+        #the file might have been filled with a bigger max_entries
+        self.evict()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        looked_up = self.hits + self.misses
+        rate = 100 * self.hits / looked_up if looked_up > 0 else 0.0
+        return "Result cache: " + self.path + " | hits: " + str(self.hits) + " (" + str(self.rain_hits) + \
+               " re-rained) | misses: " + str(self.misses) + " | hit rate: " + str(round(rate, 1)) + "%" + \
+               " | entries: " + str(len(self)) + " / " + str(self.max_entries) + " | evicted: " + str(self.evicted)
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM outcomes").fetchone()[0]
+
+    #hashes the current constants again; call after changing anything in MATERIAL_CONSTANTS or
+    # RAIN_CONSTANTS (castle_test.configure doesn't touch them, so sweeps don't need to)
+    def refresh_constants(self):
+        material = repr((MODEL_VERSION, constant_values(MATERIAL_CONSTANTS))).encode()
+        self.dry_prefix = b"dry" + material
+        self.rain_prefix = b"rain" + material + repr(constant_values(RAIN_CONSTANTS)).encode()
+
+    #returns the (dry key, rain key) of a castle
+    def keys(self, shape, w, max_wave_hits: int) -> tuple:
+        part = castle_part(shape, w, max_wave_hits)
+        return (hashlib.blake2b(self.dry_prefix + part, digest_size=16).digest(),
+                hashlib.blake2b(self.rain_prefix + part, digest_size=16).digest())
+
+    #returns {key: (wave_hits, cause index)} for the keys that are in the cache
+    def fetch(self, keys: list) -> dict:
+        found = dict()
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            query = "SELECT key, wave_hits, cause FROM outcomes WHERE key IN (" + ",".join("?" * len(batch)) + ")"
+            for (key, wave_hits, cause) in self.connection.execute(query, batch):
+                found[bytes(key)] = (wave_hits, cause)
+        return found
+
+    #Looks up castles given as (shape, wave) pairs
+    #returns (outcomes, keys): outcomes has (wave_hits, cause) for every castle in the cache and
+    # None for the rest, keys has every castle's (dry key, rain key) to hand back to store
+    def lookup(self, castles: list, max_wave_hits: int) -> tuple:
+        keys = [self.keys(shape, w, max_wave_hits) for (shape, w) in castles]
+        found = self.fetch([key for pair in keys for key in pair])
+        results = list()
+        used = list()
+        for ((shape, w), (dry_key, rain_key)) in zip(castles, keys):
+            if dry_key in found:
+                (wave_hits, cause) = found[dry_key]
+                results.append(with_rain(shape, w, wave_hits, outcomes.CAUSES[cause]))
+                used.append(dry_key)
+                if results[-1][1] == "rain":
+                    self.rain_hits += 1
+            elif rain_key in found:
+                (wave_hits, cause) = found[rain_key]
+                results.append((wave_hits, outcomes.CAUSES[cause]))
+                used.append(rain_key)
+            else:
+                results.append(None)
+                self.misses += 1
+                continue
+            self.hits += 1
+        if used:
+            now = time.time()
+            self.connection.executemany("UPDATE outcomes SET used = ? WHERE key = ?", [(now, key) for key in used])
+            self.connection.commit()
+        return (results, keys)
+
+    #Stores simulated castles: (dry key, rain key) pairs from lookup with their (wave_hits, cause)
+    #castles that fell to the rain go under the rain key, the rest under the dry key
+    def store(self, keys: list, results: list):
+        now = time.time()
+        rows = list()
+        for ((dry_key, rain_key), (wave_hits, cause)) in zip(keys, results):
+            key = rain_key if cause == "rain" else dry_key
+            rows.append((key, wave_hits, outcomes.CAUSES.index(cause), now))
+        self.connection.executemany("INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?)", rows)
+        self.connection.commit()
+        self.evict()
+
+    #throws out the least recently used outcomes once there are more than max_entries
+    def evict(self):
+        entries = len(self)
+        if entries <= self.max_entries:
+            return
+        extra = entries - int(self.max_entries * EVICT_TO)
+        self.connection.execute("DELETE FROM outcomes WHERE key IN "
+                                "(SELECT key FROM outcomes ORDER BY used LIMIT ?)", (extra,))
+        self.connection.commit()
+        self.evicted += extra
+
+    #adds this session's hits and misses to the totals kept in the file (close does this)
+    #returns the totals as {"hits", "misses", "evicted"}
+    def save_stats(self) -> dict:
+        totals = self.totals()
+        for name in totals:
+            totals[name] = totals[name] + getattr(self, name)
+            self.connection.execute("INSERT OR REPLACE INTO stats VALUES (?, ?)", (name, totals[name]))
+        self.connection.commit()
+        return totals
+
+    #returns the hits, misses and evictions saved in the file by earlier sessions
+    def totals(self) -> dict:
+        totals = {"hits": 0, "misses": 0, "evicted": 0}
+        for (name, value) in self.connection.execute("SELECT name, value FROM stats"):
+            totals[name] = value
+        return totals
+
+    #saves the stats and closes the file
+    #returns the totals from save_stats
+    def close(self) -> dict:
+        totals = self.save_stats()
+        self.connection.close()
+        return totals
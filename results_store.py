@@ -0,0 +1,224 @@
+import os
+import json
+import shutil
+import numpy as np
+import outcomes
+import records
+
+#On-disk store of per-castle sweep results
+#A store is a directory of shards, one per append. Each shard is a directory with one .npy per
+# column plus a meta.json holding the row count, the min/max of every column and where the
+# rows came from (the castle_test sweep settings, when they are known).
+#Queries read the meta.json files first and skip any shard whose min/max can't match, then
+# memory-map only the columns they need from the shards that are left, so a filtered query
+# never has to load the whole store.
+
+'''
+CONSTANTS for use in the file
+'''
+COLUMNS = {"shape": np.uint8, #index into outcomes.SHAPES
+           "dim_a": np.float64, #first constructor argument of the shape, see records.SHAPE_DIMS
+           "dim_b": np.float64,
+           "height": np.float64, #height of the castle in meters
+           "wave_height": np.float64,
+           "break_depth": np.float64,
+           "wave_distance": np.float64,
+           "wave_hits": np.int64,
+           "cause": np.uint8} #index into outcomes.CAUSES
+SHARD_PREFIX = "shard-"
+STORE_VERSION = 1 #bump when the shard layout changes
+
+
+#returns the number in a shard directory name, or None if it isn't a shard
+def shard_number(name: str):
+    if not name.startswith(SHARD_PREFIX):
+        return None
+    try:
+        return int(name[len(SHARD_PREFIX):])
+    except ValueError:
+        return None
+
+#returns the castle heights of a RunRecords
+def record_heights(run: records.RunRecords) -> np.ndarray:
+    if run.shape_name == "cube":
+        return np.frombuffer(run.dim_a, dtype=np.float64).copy()
+    return np.frombuffer(run.dim_b, dtype=np.float64).copy()
+
+#returns the columns for a RunRecords
+def columns_from_records(run: records.RunRecords) -> dict:
+    columns = dict()
+    columns["shape"] = np.full(len(run), outcomes.SHAPES.index(run.shape_name), dtype=COLUMNS["shape"])
+    for name in records.FLOAT_FIELDS:
+        columns[name] = np.frombuffer(getattr(run, name), dtype=np.float64).copy()
+    columns["height"] = record_heights(run)
+    columns["wave_hits"] = np.array(run.wave_hits, dtype=COLUMNS["wave_hits"])
+    columns["cause"] = np.frombuffer(bytes(run.causes), dtype=COLUMNS["cause"]).copy()
+    return columns
+
+#returns a RunRecords per shape for a sweep.SweepResult, with the castles rebuilt from its grid
+def records_from_sweep(result) -> list:
+    import castle_test as ct
+    import sweep
+    if not result.keep_castles:
+        raise ValueError("The sweep only kept its stats, there are no castles to store")
+    runs = list()
+    old_settings = ct.configure(**result.settings)
+    try:
+        for shape_name in result.wave_hits:
+            run = records.RunRecords(shape_name)
+            hits = result.wave_hits[shape_name]
+            causes = result.causes[shape_name]
+            for index in range(len(hits)):
+                (i, h, d, dist) = sweep.grid_point(shape_name, index)
+                run.append(hits[index], outcomes.CAUSES[causes[index]], ct.build_shape(shape_name, i), ct.build_wave(h, d, dist))
+            runs.append(run)
+    finally:
+        ct.configure(**old_settings)
+    return runs
+
+
+#Directory of column shards
+class ResultsStore:
+    path: str
+
+    #Constructor; makes the directory if it isn't there yet
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "ResultsStore: " + self.path + " | shards: " + str(len(self.shards())) + " | rows: " + str(len(self))
+
+    def __len__(self) -> int:
+        return sum(meta["rows"] for meta in self.metas())
+
+    #returns the shard directories in the order they were appended
+    def shards(self) -> list:
+        numbered = list()
+        for name in os.listdir(self.path):
+            number = shard_number(name)
+            if number is not None and os.path.isdir(os.path.join(self.path, name)):
+                numbered.append((number, name))
+        numbered.sort()
+        return [os.path.join(self.path, name) for (number, name) in numbered]
+
+    #returns the meta.json of every shard
+    def metas(self) -> list:
+        metas = list()
+        for shard in self.shards():
+            with open(os.path.join(shard, "meta.json"), "r") as f:
+                meta = json.load(f)
+            meta["path"] = shard
+            metas.append(meta)
+        return metas
+
+    #writes a new shard with the given columns and returns its path
+    #the shard is written to a temporary directory and moved into place, so a crash part way
+    # through never leaves a half-written shard for queries to trip over
+    def append_columns(self, columns: dict, source: dict = None) -> str:
+        rows = len(columns["wave_hits"])
+        for name in COLUMNS:
+            if name not in columns:
+                raise ValueError("Missing column: " + name)
+            if len(columns[name]) != rows:
+                raise ValueError("Column " + name + " has " + str(len(columns[name])) + " rows, not " + str(rows))
+        numbers = [shard_number(os.path.basename(shard)) for shard in self.shards()]
+        number = max(numbers) + 1 if numbers else 0
+        shard = os.path.join(self.path, SHARD_PREFIX + str(number).zfill(6))
+        temporary = shard + ".tmp" + str(os.getpid())
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        meta = {"version": STORE_VERSION, "rows": rows, "source": source or dict(), "min": dict(), "max": dict()}
+        for (name, dtype) in COLUMNS.items():
+            column = np.asarray(columns[name], dtype=dtype)
+            np.save(os.path.join(temporary, name + ".npy"), column)
+            if rows > 0:
+                meta["min"][name] = column.min().item()
+                meta["max"][name] = column.max().item()
+        with open(os.path.join(temporary, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, shard)
+        return shard
+
+    #appends a records.RunRecords as a new shard
+    def append_records(self, run: records.RunRecords, source: dict = None) -> str:
+        return self.append_columns(columns_from_records(run), source)
+
+    #appends every shape of a sweep.SweepResult, one shard per shape
+    #returns the new shard paths
+    def append_sweep(self, result) -> list:
+        shards = list()
+        for run in records_from_sweep(result):
+            shards.append(self.append_records(run, {"sweep": result.settings}))
+        return shards
+
+    #Returns the rows that match every filter, as a dict of column arrays
+    #shape and cause are names (or lists of names); ranges are column -> (low, high) with
+    # low <= value <= high and None for no bound, e.g. query(shape="cone", cause="rain", height=(0.5, None))
+    #columns picks which columns to hand back (default: all of them)
+    def query(self, shape = None, cause = None, columns: list = None, **ranges) -> dict:
+        if columns is None:
+            columns = list(COLUMNS.keys())
+        for name in list(columns) + list(ranges.keys()):
+            if name not in COLUMNS:
+                raise ValueError("Unknown column: " + str(name))
+        if shape is not None:
+            ranges["shape"] = [outcomes.SHAPES.index(name) for name in ([shape] if isinstance(shape, str) else shape)]
+        if cause is not None:
+            ranges["cause"] = [outcomes.CAUSES.index(name) for name in ([cause] if isinstance(cause, str) else cause)]
+        pieces = {name: list() for name in columns}
+        for meta in self.metas():
+            if meta["rows"] == 0 or not shard_might_match(meta, ranges):
+                continue
+            mask = np.ones(meta["rows"], dtype=bool)
+            for (name, bounds) in ranges.items():
+                mask &= column_mask(load_column(meta["path"], name), bounds)
+            if not mask.any():
+                continue
+            for name in columns:
+                pieces[name].append(np.asarray(load_column(meta["path"], name)[mask]))
+        result = dict()
+        for name in columns:
+            if pieces[name]:
+                result[name] = np.concatenate(pieces[name])
+            else:
+                result[name] = np.zeros(0, dtype=COLUMNS[name])
+        return result
+
+    #returns how many rows match the filters (same arguments as query)
+    def count(self, shape = None, cause = None, **ranges) -> int:
+        return len(self.query(shape, cause, columns=["wave_hits"], **ranges)["wave_hits"])
+
+
+#memory-maps one column of a shard
+def load_column(shard: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(shard, name + ".npy"), mmap_mode="r")
+
+#returns the rows of a column inside the bounds: a (low, high) range or a list of allowed values
+def column_mask(column: np.ndarray, bounds) -> np.ndarray:
+    if isinstance(bounds, list):
+        return np.isin(column, bounds)
+    (low, high) = bounds
+    mask = np.ones(len(column), dtype=bool)
+    if low is not None:
+        mask &= column >= low
+    if high is not None:
+        mask &= column <= high
+    return mask
+
+#returns false if the shard's min/max rule out every row, so it doesn't have to be read
+def shard_might_match(meta: dict, ranges: dict) -> bool:
+    for (name, bounds) in ranges.items():
+        lowest = meta["min"][name]
+        highest = meta["max"][name]
+        if isinstance(bounds, list):
+            if not any(lowest <= value <= highest for value in bounds):
+                return False
+            continue
+        (low, high) = bounds
+        if low is not None and highest < low:
+            return False
+        if high is not None and lowest > high:
+            return False
+    return True
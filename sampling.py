@@ -0,0 +1,203 @@
+import math
+import random
+import statistics
+from array import array
+import castle_test as ct
+import wave as waves
+import outcomes
+
+#Sampling mode for the castle_test.py sweep
+#Instead of the INC^3 x R Cartesian grid, castles are drawn from the same ranges (shape height
+# START_SHAPE_HEIGHT..END_SHAPE_HEIGHT, wave height START_HEIGHT..END_HEIGHT, break depth
+# START_DEPTH..END_DEPTH, distance START_DISTANCE..END_DISTANCE) in batches, and a shape stops
+# as soon as the confidence interval on its mean wave hits is narrower than asked for.
+#Methods:
+#  - "random": plain Monte Carlo, the interval comes from the spread of the castles
+#  - "lhs": each batch is its own Latin hypercube
+#  - "halton": each batch is the first batch_size points of the Halton sequence, shifted by a
+#    random offset (mod 1) of its own
+#For "lhs" and "halton" the batches are independent of each other, so the interval comes from
+# the spread of the batch means.
+
+'''
+CONSTANTS for use in the file
+'''
+METHODS = ["random", "lhs", "halton"]
+HALTON_BASES = [2, 3, 5, 7] #one prime per dimension
+MIN_BATCHES = 4 #batches run before trusting the interval
+DEFAULT_TOLERANCE = 2.0 #wave hits | half-width of the interval to stop at
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_SAMPLES = 20000 #castles per shape, converged or not
+
+
+#Running estimate of one shape's mean wave hits
+class SampleEstimate:
+    shape_name: str
+    method: str
+    wave_hits: array #wave hits of every castle in the order they were run
+    batch_means: list
+    half_width: float #half-width of the confidence interval, inf until there are enough batches
+    converged: bool
+    counts: outcomes.OutcomeCounts
+
+    #Constructor
+    def __init__(self, shape_name: str, method: str):
+        self.shape_name = shape_name
+        self.method = method
+        self.wave_hits = array("l")
+        self.batch_means = list()
+        self.half_width = math.inf
+        self.converged = False
+        self.counts = outcomes.OutcomeCounts()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return self.shape_name.capitalize() + " mean: " + str(round(self.mean(), 3)) + " +/- " + \
+               str(round(self.half_width, 3)) + " | samples: " + str(self.samples()) + \
+               " | " + ("converged" if self.converged else "did not converge")
+
+    #returns the number of castles run
+    def samples(self) -> int:
+        return len(self.wave_hits)
+
+    #returns the mean wave hits so far
+    def mean(self) -> float:
+        return sum(self.wave_hits) / len(self.wave_hits)
+
+    #works out the interval again after a batch
+    def update(self, z: float):
+        if self.method == "random":
+            #every castle is independent
+            if len(self.wave_hits) < 2:
+                return
+            spread = statistics.stdev(self.wave_hits)
+            self.half_width = z * spread / math.sqrt(len(self.wave_hits))
+        else:
+            if len(self.batch_means) < 2:
+                return
+            spread = statistics.stdev(self.batch_means)
+            self.half_width = z * spread / math.sqrt(len(self.batch_means))
+
+
+'''
+Points in the unit cube
+'''
+#returns the radical inverse of n in the given base (the n-th Halton coordinate)
+def radical_inverse(n: int, base: int) -> float:
+    result = 0.0
+    f = 1.0 / base
+    while n > 0:
+        (n, digit) = divmod(n, base)
+        result = result + digit * f
+        f = f / base
+    return result
+
+#returns n points of a Latin hypercube in [0, 1)^dims: every dimension has exactly one point in
+# each of its n strata
+def latin_hypercube(n: int, dims: int, rng: random.Random) -> list:
+    columns = list()
+    for dim in range(dims):
+        strata = list(range(n))
+        rng.shuffle(strata)
+        columns.append([(stratum + rng.random()) / n for stratum in strata])
+    return [tuple(column[k] for column in columns) for k in range(n)]
+
+#returns the first n Halton points in [0, 1)^dims, shifted by a random offset mod 1
+def shifted_halton(n: int, dims: int, rng: random.Random) -> list:
+    if dims > len(HALTON_BASES):
+        raise ValueError("Only " + str(len(HALTON_BASES)) + " Halton dimensions")
+    shift = [rng.random() for dim in range(dims)]
+    points = list()
+    for k in range(1, n + 1):
+        points.append(tuple((radical_inverse(k, HALTON_BASES[dim]) + shift[dim]) % 1.0 for dim in range(dims)))
+    return points
+
+#returns n independent uniform points in [0, 1)^dims
+def uniform_points(n: int, dims: int, rng: random.Random) -> list:
+    return [tuple(rng.random() for dim in range(dims)) for k in range(n)]
+
+#returns a batch of n points in [0, 1)^dims drawn with the given method
+def unit_points(method: str, n: int, dims: int, rng: random.Random) -> list:
+    if method == "lhs":
+        return latin_hypercube(n, dims, rng)
+    elif method == "halton":
+        return shifted_halton(n, dims, rng)
+    elif method == "random":
+        return uniform_points(n, dims, rng)
+    raise ValueError("Unknown sampling method: " + str(method))
+
+
+'''
+Sampling
+'''
+#returns the (low, high) range of each sampled dimension, in the order of the unit points
+def sample_ranges() -> list:
+    return [(ct.START_SHAPE_HEIGHT, ct.END_SHAPE_HEIGHT), (ct.START_HEIGHT, ct.END_HEIGHT),
+            (ct.START_DEPTH, ct.END_DEPTH), (ct.START_DISTANCE, ct.END_DISTANCE)]
+
+#returns the shape and wave for a point in the unit cube
+def castle_at(shape_name: str, point: tuple) -> tuple:
+    values = [low + u * (high - low) for (u, (low, high)) in zip(point, sample_ranges())]
+    (height, wave_height, break_depth, distance) = values
+    return (ct.shape_with_height(shape_name, height), waves.Wave(wave_height, break_depth, distance))
+
+#runs one castle with the given engine ("scalar" or "fast")
+#returns (wave_hits, cause)
+def run_castle(shape, w, engine: str, counts: outcomes.OutcomeCounts, max_wave_hits: int) -> tuple:
+    if engine == "fast":
+        import fast_forward
+        (wave_hits, cause) = fast_forward.fast_forward(shape, w, max_wave_hits)
+        counts.add(shape.string_name(), cause)
+        return (wave_hits, cause)
+    elif engine == "scalar":
+        return ct.simulate_castle(shape, w, counts, max_wave_hits)
+    raise ValueError("Unknown engine: " + str(engine))
+
+#Samples castles of one shape in batches until the confidence interval on the mean wave hits
+# has a half-width of at most tolerance, or max_samples castles have been run
+#returns a SampleEstimate
+def sample_shape(shape_name: str, method: str = "lhs", tolerance: float = DEFAULT_TOLERANCE,
+                 confidence: float = DEFAULT_CONFIDENCE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_samples: int = DEFAULT_MAX_SAMPLES, seed = None, engine: str = "scalar",
+                 max_wave_hits: int = None) -> SampleEstimate:
+    if method not in METHODS:
+        raise ValueError("Unknown sampling method: " + str(method))
+    if shape_name not in ct.shape_list:
+        raise ValueError("Unknown shape: " + str(shape_name))
+    if not 0 < confidence < 1:
+        raise ValueError("confidence has to be between 0 and 1")
+    if batch_size < 1 or tolerance <= 0:
+        raise ValueError("batch_size and tolerance have to be positive")
+    if max_samples < batch_size:
+        raise ValueError("max_samples (" + str(max_samples) + ") has to be at least batch_size (" +
+                         str(batch_size) + ")")
+    if max_wave_hits is None:
+        max_wave_hits = ct.MAX_WAVE_HITS
+    rng = random.Random(seed)
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    estimate = SampleEstimate(shape_name, method)
+    while estimate.samples() + batch_size <= max_samples:
+        batch_hits = 0
+        for point in unit_points(method, batch_size, len(sample_ranges()), rng):
+            (shape, w) = castle_at(shape_name, point)
+            (wave_hits, cause) = run_castle(shape, w, engine, estimate.counts, max_wave_hits)
+            estimate.wave_hits.append(wave_hits)
+            batch_hits = batch_hits + wave_hits
+        estimate.batch_means.append(batch_hits / batch_size)
+        estimate.update(z)
+        if len(estimate.batch_means) >= MIN_BATCHES and estimate.half_width <= tolerance:
+            estimate.converged = True
+            break
+    return estimate
+
+#Samples every shape (default: all of them) with the same options
+#returns a dict of shape name -> SampleEstimate
+def sample_sweep(shape_names = None, seed = None, **options) -> dict:
+    if shape_names is None:
+        shape_names = ct.shape_list
+    rng = random.Random(seed)
+    estimates = dict()
+    for shape_name in shape_names:
+        estimates[shape_name] = sample_shape(shape_name, seed=rng.random(), **options)
+    return estimates
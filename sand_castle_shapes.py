@@ -11,14 +11,107 @@ SAND_RADIUS = SAND_DIAMETER / 2 #meters
 SAND_VOLUME = (4/3) * math.pi * (SAND_RADIUS**3)
 WATER_DENSITY = 1023.6 # kg / m^3
 GRAVITY = 9.81 # m / s^2
-AVG_WAVE_HEIGHT = 0.02 # meters | 1.039 m from two bouys off CA and 3 off FL, but that's when the big ones are breaking
-AVG_BREAK_DEPTH = AVG_WAVE_HEIGHT * 1.3 # meters 
+#NOTE: the wave height and break depth live in castle_test.py (AVG_WAVE_HEIGHT, AVG_BREAK_DEPTH)
 #Friendly reminder that N = (kg * m) / s^2
 
+
+'''
+CACHED GEOMETRY
+'''
+#The derived geometry (surface area, cross-sectional area, top volume, ...) gets asked for several
+# times per wave hit but only changes when the shape does, so the shapes remember it:
+#  - "top" values only depend on base_height and are cleared by set_base_height
+#  - "base" values also depend on the eroded base and are cleared by update_base_radius and
+#    by assigning base_side_length, as well as by set_base_height
+#set_base_height with the height the shape already has doesn't clear anything
+#NOTE: clearing swaps in new dicts instead of emptying the old ones, so a copy.copy of a shape
+#      never clears or fills the cache of the shape it was copied from
+cache_stats = {"hits": 0, "misses": 0} #for every shape since the last reset_cache_stats
+
+#returns the fraction of derived-geometry lookups that came out of the cache
+def cache_hit_rate() -> float:
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    if lookups == 0:
+        return 0.0
+    return cache_stats["hits"] / lookups
+
+#zeroes the hit/miss counters
+def reset_cache_stats():
+    cache_stats["hits"] = 0
+    cache_stats["misses"] = 0
+
+#Decorator for a shape method with no arguments whose result is kept until the cache at the
+# given level ("top" or "base") is cleared
+def cached(level: str):
+    if level not in ("top", "base"):
+        raise ValueError("Unknown cache level: " + str(level))
+    def decorate(method):
+        key = method.__name__
+        if level == "top":
+            def lookup(self):
+                cache = self._top_cache
+                if key in cache:
+                    cache_stats["hits"] += 1
+                    return cache[key]
+                cache_stats["misses"] += 1
+                value = cache[key] = method(self)
+                return value
+        else:
+            def lookup(self):
+                cache = self._base_cache
+                if key in cache:
+                    cache_stats["hits"] += 1
+                    return cache[key]
+                cache_stats["misses"] += 1
+                value = cache[key] = method(self)
+                return value
+        lookup.__name__ = key
+        return lookup
+    return decorate
+
+#Shared cache bookkeeping for the shapes
+#NOTE: the shapes all use __slots__ so each one is a handful of floats instead of a dict
+class CachedGeometry:
+    __slots__ = ("_top_cache", "_base_cache")
+    _top_cache: dict
+    _base_cache: dict
+
+    #forgets everything, for a new base_height
+    def clear_cache(self):
+        self._top_cache = dict()
+        self._base_cache = dict()
+
+    #forgets what depends on the eroded base
+    def clear_base_cache(self):
+        self._base_cache = dict()
+
+    #returns a value another module worked out from the shape and remembered at the given level
+    # (see castle_test.critical_height), or None if it was cleared since
+    def cached_value(self, level: str, key: str):
+        value = (self._top_cache if level == "top" else self._base_cache).get(key)
+        if value is None:
+            cache_stats["misses"] += 1
+        else:
+            cache_stats["hits"] += 1
+        return value
+
+    #remembers a value worked out from the shape until the cache at the given level is cleared
+    def cache_value(self, level: str, key: str, value):
+        (self._top_cache if level == "top" else self._base_cache)[key] = value
+
+    #sets base_height, only clearing the cache when it actually changes
+    def _set_base_height(self, h: float) -> bool:
+        if getattr(self, "base_height", None) == h:
+            return False
+        self.base_height = h
+        self.clear_cache()
+        return True
+
 '''
 CUBE
 '''
-class Cube:
+class Cube(CachedGeometry):
+    __slots__ = ("side_length", "height", "base_grains", "base_radius", "_base_side_length", "base_height")
     side_length: float
     height: float   
     base_grains: float
@@ -42,14 +135,25 @@ class Cube:
 
     #Constructor for Cubes
     def __init__(self, side: float):
+        self.clear_cache()
         self.side_length = side
         self.height = side
         self.base_radius = Cube.determine_square_radius(self, side)
         self.base_side_length = side
+
+    #base_side_length is a property so that eroding it clears the cached geometry
+    @property
+    def base_side_length(self) -> float:
+        return self._base_side_length
+
+    @base_side_length.setter
+    def base_side_length(self, n: float):
+        self._base_side_length = n
+        self.clear_base_cache()
     
     #sets the base_height value
     def set_base_height(self, h: float) -> float:
-        self.base_height = h
+        self._set_base_height(h)
 
     #Returns the volume of the cube
     def get_volume(self) -> float:
@@ -60,10 +164,12 @@ class Cube:
         return self.top_vol + self.bottom_vol
 
     #returns vol of cube not being eroded
+    @cached("top")
     def get_top_vol(self) -> float:
         return self.side_length * self.side_length * (self.side_length - self.base_height)
 
     #returns vol of part of cube being eroded
+    @cached("base")
     def get_eroded_vol(self) -> float:
         return self.base_height * self.base_side_length * self.base_side_length
 
@@ -79,8 +185,10 @@ class Cube:
     #updates the base_radius field
     def update_base_radius(self, n: float):
         self.base_radius = n
+        self.clear_base_cache()
 
     #Returns the force of the top sand weighing down on our eroding base
+    @cached("top")
     def get_normal_sand(self) -> float:
         global SAND_DENSITY
         global GRAVITY
@@ -89,6 +197,7 @@ class Cube:
         return weight
 
     #Returns # of sand grains in the eroding base
+    @cached("base")
     def get_base_grains(self) -> float:
         global SAND_DIAMETER
         global SAND_VOLUME
@@ -97,10 +206,12 @@ class Cube:
         return grains
 
     #Returns the surface area of the eroding part of the cube
+    @cached("base")
     def get_eroding_surface_area(self) -> float:
         return self.base_height * self.base_side_length * 4 + 0.00001 #add a little to make sure we don't divide by 0
 
     #returns cross-sectional area of the top part being eroded
+    @cached("base")
     def get_cross_sectional_area(self) -> float:
         return self.base_side_length * self.base_side_length
 
@@ -112,7 +223,8 @@ class Cube:
 '''
 CYLINDER
 '''
-class Cylinder:
+class Cylinder(CachedGeometry):
+    __slots__ = ("radius", "height", "base_grains", "base_radius", "base_height")
     radius: float
     height: float    
     base_grains: float
@@ -125,6 +237,7 @@ class Cylinder:
 
     #Constructor for Cylinders
     def __init__(self, r: float, h: float):
+        self.clear_cache()
         self.radius = r
         self.height = h
         self.base_radius = r
@@ -140,14 +253,16 @@ class Cylinder:
 
     #sets the base_height value
     def set_base_height(self, h: float) -> float:
-        self.base_height = h
+        self._set_base_height(h)
 
     #Returns the area of the top of the Cylinder 
+    @cached("top")
     def get_top_area(self) -> float:
         top = math.pi * self.radius * self.radius
         return top
 
     #Returns the area of the of the base of the Cylinder, even during erosion process
+    @cached("base")
     def get_eroded_base(self) -> float:
         base = math.pi * self.base_radius * self.base_radius
         return base
@@ -159,18 +274,22 @@ class Cylinder:
         return top_vol + bottom_vol
 
     #Returns the volume of the top part of the Cylinder that never gets eroded by a wave
+    @cached("top")
     def get_top_vol(self) -> float:
         return (self.height - self.base_height) * self.get_top_area()
 
     #Returns the volume of the bottom part of the Cylinder that does get hit by waves
+    @cached("base")
     def get_eroded_vol(self) -> float:
         return self.base_height * self.get_eroded_base()
 
     #updates the base_radius
     def update_base_radius(self, n: float):
         self.base_radius = n
+        self.clear_base_cache()
 
     #Returns the force of the top of the Cylinder weighing down on the eroding base
+    @cached("top")
     def get_normal_sand(self) -> float:
         global SAND_DENSITY
         global GRAVITY
@@ -179,6 +298,7 @@ class Cylinder:
         return weight
 
     #Returns # of sand grains in the eroding base
+    @cached("base")
     def get_base_grains(self) -> float:
         global SAND_DIAMETER
         global SAND_VOLUME
@@ -187,11 +307,13 @@ class Cylinder:
         return grains
 
     #Returns the surface area of the eroding part of the cylinder
+    @cached("base")
     def get_eroding_surface_area(self) -> float:
         circumference = self.base_radius * 2 * math.pi
         return circumference * self.base_height + 0.00001 #add a little to make sure we don't divide by 0
 
     #returns cross-sectional area of the top part being eroded
+    @cached("base")
     def get_cross_sectional_area(self) -> float:
         return self.get_eroded_base()
 
@@ -202,10 +324,15 @@ class Cylinder:
 '''
 PYRAMID
 '''
-class Pyramid:
+class Pyramid(CachedGeometry):
+    __slots__ = ("side_length", "height", "angle", "sin_angle", "cos_angle", "tan_angle", "base_grains",
+                 "base_radius", "_base_side_length", "base_height")
     side_length: float
     height: float
     angle: float #internal angle of the pyramid (two base angles of a cut-away pyramid slice)
+    sin_angle: float
+    cos_angle: float
+    tan_angle: float
     base_grains: float
     base_radius: float
     base_side_length: float
@@ -218,11 +345,26 @@ class Pyramid:
 
     #Constructor for Pyramids
     def __init__(self, side: float, height: float):
+        self.clear_cache()
         self.side_length = side
         self.height = height
         self.base_radius = Pyramid.determine_square_radius(self, side)
         self.base_side_length = side
         self.angle = math.atan(height / (side / 2))
+        #the angle never changes, so neither does its trig
+        self.sin_angle = math.sin(self.angle)
+        self.cos_angle = math.cos(self.angle)
+        self.tan_angle = math.tan(self.angle)
+
+    #base_side_length is a property so that eroding it clears the cached geometry
+    @property
+    def base_side_length(self) -> float:
+        return self._base_side_length
+
+    @base_side_length.setter
+    def base_side_length(self, n: float):
+        self._base_side_length = n
+        self.clear_base_cache()
 
 
     #to_string method for pretty printing
@@ -236,7 +378,7 @@ class Pyramid:
     
     #sets the base_height value
     def set_base_height(self, h: float) -> float:
-        self.base_height = h
+        self._set_base_height(h)
 
     #Returns the volume of the pyramid
     def get_volume(self) -> float:
@@ -253,6 +395,7 @@ class Pyramid:
         return (s * s * h) / 3
 
     #returns vol of pyramid not being eroded
+    @cached("top")
     def get_top_vol(self) -> float:
         length = self.get_length_at_h(self.side_length, self.base_height)
         height = self.height - self.base_height
@@ -262,11 +405,12 @@ class Pyramid:
     #returns the length of the Pyramid at height h
     #NOTE that base_length is not self here, it varies 
     def get_length_at_h(self, base_length: float, h: float) -> float:
-        triangle_adj = h / (math.tan(self.angle) + 0.000001) #add a little to not divide by 0
+        triangle_adj = h / (self.tan_angle + 0.000001) #add a little to not divide by 0
         return base_length - (2 * triangle_adj)
         
 
     #returns vol of part of pyramid being eroded
+    @cached("base")
     def get_eroded_vol(self) -> float:
         #Compute volume by getting volume of the rectangular brick and then adding the "ramps" 
         # on each side of the base
@@ -275,8 +419,8 @@ class Pyramid:
         #Make opposite, adjacent, and hypotenuse values
         #See pics in git repo of big_board for the diagram on these values
         opp = self.base_height 
-        hyp = opp / math.sin(theta)
-        adj = math.cos(theta) * hyp
+        hyp = opp / self.sin_angle
+        adj = self.cos_angle * hyp
         #Get the volume of the frustum
         #From: https://keisan.casio.com/exec/system/1223368185
         a = self.base_side_length
@@ -297,8 +441,10 @@ class Pyramid:
     #updates the base_radius field
     def update_base_radius(self, n: float):
         self.base_radius = n
+        self.clear_base_cache()
 
     #Returns the force of the top sand weighing down on our eroding base
+    @cached("top")
     def get_normal_sand(self) -> float:
         global SAND_DENSITY
         global GRAVITY
@@ -307,6 +453,7 @@ class Pyramid:
         return weight
 
     #Returns # of sand grains in the eroding base
+    @cached("base")
     def get_base_grains(self) -> float:
         global SAND_DIAMETER
         global SAND_VOLUME
@@ -316,14 +463,15 @@ class Pyramid:
 
 
     #Returns the surface area of the eroding part of the pyramid
+    @cached("base")
     def get_eroding_surface_area(self) -> float:
         #Get the theta value for the angle in the triangle we're considering
         theta =  self.angle
         #Make opposite, adjacent, and hypotenuse values
         #See pics in git repo of big_board for the diagram on these values
         opp = self.base_height 
-        hyp = opp / math.sin(theta)
-        adj = math.cos(theta) * hyp
+        hyp = opp / self.sin_angle
+        adj = self.cos_angle * hyp
         #Get the lateral surface area of the frustum
         #From: https://keisan.casio.com/exec/system/1223368185
         a = self.base_side_length
@@ -334,14 +482,15 @@ class Pyramid:
         return surface_area + 0.00001 #add a little to make sure we don't divide by 0
 
     #returns cross-sectional area of the top part being eroded
+    @cached("base")
     def get_cross_sectional_area(self) -> float:
         #Get the theta value for the angle in the triangle we're considering
         theta =  self.angle
         #Make opposite, adjacent, and hypotenuse values
         #See pics in git repo of big_board for the diagram on these values
         opp = self.base_height 
-        hyp = opp / math.sin(theta)
-        adj = math.cos(theta) * hyp
+        hyp = opp / self.sin_angle
+        adj = self.cos_angle * hyp
         #Get the lateral surface area of the frustum
         #From: https://keisan.casio.com/exec/system/1223368185
         a = self.base_side_length
@@ -353,12 +502,16 @@ class Pyramid:
 CONE
 '''
 
-class Cone:
+class Cone(CachedGeometry):
+    __slots__ = ("radius", "height", "angle", "tan_angle", "base_grains", "base_height_ratio", "height_radius_ratio",
+                 "base_radius", "base_height", "radius_above_base_height")
     radius: float
     height: float
     angle: float #internal angle of the cylinder in radians
+    tan_angle: float
     base_grains: float
     base_height_ratio: float #used for getting r at a height for the truncated cone
+    height_radius_ratio: float
     base_radius: float
     base_height: float
     radius_above_base_height: float #radius of the Cone just above the erosion
@@ -369,11 +522,13 @@ class Cone:
 
     #Constructor for Cones
     def __init__(self, r: float, h: float):
+        self.clear_cache()
         self.radius = r
         self.height = h
         self.base_radius = r
         self.height_radius_ratio = h / r
         self.angle = math.atan(h / r)
+        self.tan_angle = math.tan(self.angle) #the angle never changes, so neither does its tan
 
     #to_string method for pretty printing
     def __str__(self):
@@ -386,10 +541,11 @@ class Cone:
 
     #sets the base_height value, and the radius_above_base_height value as well
     def set_base_height(self, h: float) -> float:
-        self.base_height = h
+        self._set_base_height(h)
         self.radius_above_base_height = self.get_radius_at_h(self.radius, h) #this value is used for top_volume method
 
     #Returns the radius value at base_height (so: radius at the top of the wave-erosion area)
+    @cached("base")
     def get_radius_at_base_height(self) -> float:
         #h is the height of the imaginary cone extending from the truncated cone that is the 
         # base being eroded; use the base_height_ratio to keep it consistent
@@ -400,16 +556,18 @@ class Cone:
     #returns the radius of the Cone at height h
     #NOTE that base_radius is not self here, it varies 
     def get_radius_at_h(self, base_radius: float, h: float) -> float:
-        triangle_adj = h / (math.tan(self.angle) + 0.000001) #add a little to not divide by 0
+        triangle_adj = h / (self.tan_angle + 0.000001) #add a little to not divide by 0
         return base_radius - triangle_adj
 
 
     #Returns the area of the base of the Cone that doesn't get eroded
+    @cached("top")
     def get_top_area(self) -> float:
         top = math.pi * self.radius_above_base_height * self.radius_above_base_height
         return top
 
     #Returns the area of the of the base of the Cone, even during erosion process
+    @cached("base")
     def get_eroded_base(self) -> float:
         base = math.pi * self.base_radius * self.base_radius
 
@@ -420,10 +578,12 @@ class Cone:
         return top_vol + bottom_vol
 
     #Returns the volume of the top part of the Cone that never gets eroded by a wave
+    @cached("top")
     def get_top_vol(self) -> float:
         return ((self.height - self.base_height) * self.get_top_area() ) / 3
 
     #Returns the volume of the bottom part of the Cone that does get hit by waves
+    @cached("base")
     def get_eroded_vol(self) -> float:
         #From: https://keisan.casio.com/exec/system/1223372110
         r1 = self.base_radius
@@ -436,8 +596,10 @@ class Cone:
     #updates the base_radius
     def update_base_radius(self, n: float):
         self.base_radius = n
+        self.clear_base_cache()
 
     #Returns the force of the top of the Cylinder weighing down on the eroding base
+    @cached("top")
     def get_normal_sand(self) -> float:
         global SAND_DENSITY
         global GRAVITY
@@ -446,6 +608,7 @@ class Cone:
         return weight
 
     #Returns # of sand grains in the eroding base
+    @cached("base")
     def get_base_grains(self) -> float:
         global SAND_DIAMETER
         global SAND_VOLUME
@@ -455,6 +618,7 @@ class Cone:
 
 
     #Returns the lateral surface area of the bottom part of the Cone that does get hit by waves
+    @cached("base")
     def get_eroding_surface_area(self) -> float:
         #From: https://keisan.casio.com/exec/system/1223372110
         r1 = self.base_radius
@@ -465,6 +629,7 @@ class Cone:
         return surface_area + 0.00001 #add a little to make sure we don't divide by 0
 
     #returns cross-sectional area of the top part being eroded
+    @cached("base")
     def get_cross_sectional_area(self) -> float:
         return self.get_radius_at_base_height()
 
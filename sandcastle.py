@@ -0,0 +1,692 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+#Command line entry point
+#   python sandcastle.py sweep --shape cone --R 1001 --jobs 8
+#   python sandcastle.py sweep --shape cone --store results/
+#   python sandcastle.py sweep --R 1001 --checkpoint sweep.ckpt --resume
+#   python sandcastle.py sweep --cache outcomes.sqlite
+#   python sandcastle.py sweep --R 1001 --engine fast --stats-only --export results.csv
+#   python sandcastle.py sweep --R 1001 --serve 0.0.0.0:5577 --local-workers 4
+#   python sandcastle.py worker --connect coordinator-host:5577
+#   python sandcastle.py scenarios whatif.toml --engine fast
+#   python sandcastle.py query results/ --shape cone --cause rain --min-height 0.5
+#   python sandcastle.py heatmaps results/ --output plots/ --jobs 4
+#   python sandcastle.py sample --method lhs --tolerance 1.0
+#   python sandcastle.py refine --shape cone --max-depth 6 --engine fast
+#   python sandcastle.py optimize --method halving --VOL 0.1
+#   python sandcastle.py events --station scripps_south_california --tide synthetic --storms 0.5
+#   python sandcastle.py follow --station scripps_south_california --shape cone
+#   python sandcastle.py layout --castles 5000 --waves 300 --seed 1
+#   python sandcastle.py train --station scripps_south_california --shape cone
+#   python sandcastle.py buoy
+#   python sandcastle.py buoy-stats --station east_florida --start 2019-06-01 --end 2019-07-01 --quantile 0.9
+#   python sandcastle.py startup
+#   python sandcastle.py memory --shape cone
+#   python sandcastle.py bench --output bench.json --baseline baseline.json
+#   python sandcastle.py --profile sweep --shape cone
+#Only the sweep code is imported up front; numpy (batch engine) and matplotlib (plots)
+# are imported when they are actually used, so the CLI starts in well under a second
+
+'''
+CONSTANTS for use in the file
+'''
+COLD_START_BUDGET = 0.25 #seconds | budget for starting python and importing everything a sweep needs
+STARTUP_RUNS = 5 #how many fresh interpreters to time for the startup check
+
+
+#runs the sweep subcommand
+def sweep_command(args) -> int:
+    import sweep
+    if args.resume and not args.checkpoint:
+        print("--resume needs a --checkpoint directory")
+        return 1
+    if args.stats_only and args.store:
+        print("--store needs every castle, it can't be used with --stats-only")
+        return 1
+    if args.local_workers and not args.serve:
+        print("--local-workers needs --serve")
+        return 1
+    shape_names = args.shape if args.shape else None
+    cache = None
+    if args.cache:
+        import result_cache
+        cache = result_cache.ResultCache(args.cache, args.cache_max_entries)
+    exporter = None
+    if args.export:
+        import export
+        try:
+            exporter = export.open_exporter(args.export)
+        except (ImportError, ValueError) as error:
+            print(str(error))
+            if cache is not None:
+                cache.close()
+            return 1
+    coordinator = None
+    local_workers = list()
+    try:
+        if args.serve:
+            import cluster
+            (host, port) = cluster.parse_address(args.serve)
+            coordinator = cluster.Coordinator(host, port, args.token)
+            print("Coordinator listening on " + coordinator.address_text(), file=sys.stderr)
+            local_workers = cluster.spawn_local_workers(coordinator.address, args.local_workers, args.token)
+        result = sweep.run_sweep(shape_names, R=args.R, INC=args.INC, VOL=args.VOL,
+                                 max_wave_hits=args.max_wave_hits, jobs=args.jobs, engine=args.engine,
+                                 checkpoint=args.checkpoint, resume=args.resume, cache=cache,
+                                 keep_castles=not args.stats_only, coordinator=coordinator, exporter=exporter)
+    except ValueError as error:
+        #a --checkpoint that is already used or is for other settings, a bad --serve address, ...
+        if cache is not None:
+            cache.close()
+        print(str(error))
+        return 1
+    except BaseException:
+        if cache is not None:
+            cache.close()
+        raise
+    finally:
+        if exporter is not None:
+            exporter.close()
+        if coordinator is not None:
+            coordinator.close()
+            print(str(coordinator), file=sys.stderr)
+            cluster.stop_local_workers(local_workers)
+    for shape_name in result.shape_names():
+        print("Size of " + shape_name + "_array: " + str(result.castles[shape_name]))
+    print("\n")
+    for shape_name in result.shape_names():
+        print(shape_name.capitalize() + " average: " + str(result.average_wave_hits(shape_name)))
+    print("\n")
+    print(str(result.counts))
+    if args.stats or args.stats_only:
+        print("\n")
+        print(str(result.stats))
+    if args.plot:
+        import plots
+        plots.plot_average_wave_hits(result, args.plot)
+        print("Saved plot to " + args.plot)
+    if exporter is not None:
+        print(str(exporter))
+    if args.store:
+        import results_store
+        shards = results_store.ResultsStore(args.store).append_sweep(result)
+        print("Appended " + str(len(shards)) + " shards to " + args.store)
+    if cache is not None:
+        print(str(cache))
+        totals = cache.close()
+        print("Result cache totals: hits: " + str(totals["hits"]) + " | misses: " + str(totals["misses"]) +
+              " | evicted: " + str(totals["evicted"]))
+    return 0
+
+#runs the worker subcommand: runs sweep chunks for a coordinator until it's done
+def worker_command(args) -> int:
+    import cluster
+    (host, port) = cluster.parse_address(args.connect)
+    ran = cluster.run_worker(host, port, args.token, args.name)
+    print("Worker ran " + str(ran) + " chunks", file=sys.stderr)
+    return 0
+
+#runs the scenarios subcommand: the sweep once per scenario in a JSON/TOML file
+def scenarios_command(args) -> int:
+    import scenario
+    cache = None
+    if args.cache:
+        import result_cache
+        cache = result_cache.ResultCache(args.cache)
+    try:
+        results = scenario.run_scenarios(scenario.load(args.file), args.shape, jobs=args.jobs, engine=args.engine,
+                                         cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+    for (what_if, result) in results:
+        print(str(what_if))
+        for shape_name in result.shape_names():
+            print(shape_name.capitalize() + " average: " + str(result.average_wave_hits(shape_name)))
+        print(str(result.counts))
+        print("\n")
+    if cache is not None:
+        print(str(cache))
+    return 0
+
+#runs the query subcommand: filtered rows from a results store
+def query_command(args) -> int:
+    import results_store
+    import outcomes
+    store = results_store.ResultsStore(args.store)
+    ranges = dict()
+    if args.min_height is not None or args.max_height is not None:
+        ranges["height"] = (args.min_height, args.max_height)
+    rows = store.query(args.shape, args.cause, **ranges)
+    hits = rows["wave_hits"]
+    print("Matching castles: " + str(len(hits)) + " of " + str(len(store)))
+    if len(hits) > 0:
+        print("Average wave hits: " + str(hits.mean()))
+    for k in range(min(args.rows, len(hits))):
+        print(outcomes.SHAPES[rows["shape"][k]] + " | height: " + str(rows["height"][k]) +
+              " | wave height: " + str(rows["wave_height"][k]) + " | break depth: " + str(rows["break_depth"][k]) +
+              " | distance: " + str(rows["wave_distance"][k]) + " | wave hits: " + str(hits[k]) +
+              " | cause: " + outcomes.CAUSES[rows["cause"][k]])
+    return 0
+
+#runs the heatmaps subcommand: wave-hits and failure-cause heatmaps of a results store
+def heatmaps_command(args) -> int:
+    import results_store
+    import plots
+    store = results_store.ResultsStore(args.store)
+    start = time.perf_counter()
+    grids = plots.bin_store(store, args.shape, bins=args.bins, bands=args.bands)
+    binned = time.perf_counter()
+    if not grids:
+        print("No castles in " + args.store)
+        return 1
+    paths = plots.render_heatmaps(grids, args.output, jobs=args.jobs)
+    finished = time.perf_counter()
+    for grid in grids.values():
+        print(str(grid))
+    print("Saved " + str(len(paths)) + " heatmaps to " + args.output)
+    print("Binned in " + str(round(binned - start, 3)) + " s, drew in " + str(round(finished - binned, 3)) + " s")
+    return 0
+
+#runs the sample subcommand: sampled sweep that stops once the mean wave hits are pinned down
+def sample_command(args) -> int:
+    import castle_test as ct
+    import sampling
+    settings = dict()
+    if args.VOL is not None:
+        settings["VOL"] = args.VOL
+    old_settings = ct.configure(**settings)
+    try:
+        estimates = sampling.sample_sweep(args.shape, seed=args.seed, method=args.method, tolerance=args.tolerance,
+                                          confidence=args.confidence, batch_size=args.batch_size,
+                                          max_samples=args.max_samples, engine=args.engine,
+                                          max_wave_hits=args.max_wave_hits)
+    except ValueError as error:
+        print(str(error))
+        return 1
+    finally:
+        ct.configure(**old_settings)
+    for estimate in estimates.values():
+        print(str(estimate))
+    print("\n")
+    print(str(sampling.outcomes.merge_all(estimate.counts for estimate in estimates.values())))
+    return 0
+
+#runs the refine subcommand: adaptive map of where the castles stop surviving
+def refine_command(args) -> int:
+    import refine
+    refined = refine.refine(args.shape, args.dimension, max_depth=args.max_depth, start_depth=args.start_depth,
+                            hit_tolerance=args.hit_tolerance, prune=not args.no_prune, engine=args.engine,
+                            max_wave_hits=args.max_wave_hits)
+    print(str(refined))
+    print(str(refined.counts))
+    if args.check:
+        mismatches = refine.check_pruning(refined, engine=args.engine, max_wave_hits=args.max_wave_hits)
+        print("Pruned corners that disagree with a real run: " + str(len(mismatches)))
+        if mismatches:
+            return 1
+    return 0
+
+#runs the optimize subcommand: best height for each shape at a fixed volume of sand
+def optimize_command(args) -> int:
+    import castle_test as ct
+    import optimize
+    settings = dict()
+    if args.VOL is not None:
+        settings["VOL"] = args.VOL
+    old_settings = ct.configure(**settings)
+    try:
+        distribution = optimize.sampled_waves(args.waves, args.seed) if args.waves else None
+        designs = optimize.optimize_all(args.shape, method=args.method, distribution=distribution,
+                                        engine=args.engine, max_wave_hits=args.max_wave_hits)
+        for (shape_name, design) in designs.items():
+            if design is None:
+                print(shape_name.capitalize() + ": no height fits the radius and height bounds")
+            else:
+                print(str(design))
+    finally:
+        ct.configure(**old_settings)
+    return 0
+
+#returns epoch seconds for a YYYY-MM-DD date (UTC), or None
+def parse_date(text: str):
+    if text is None:
+        return None
+    import datetime
+    day = datetime.datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    return day.timestamp()
+
+#runs the train subcommand: every castle design of the sweep against a buoy wave train
+def train_command(args) -> int:
+    import datetime
+    import castle_test as ct
+    import wave_train
+    if args.R is not None:
+        ct.configure(R=args.R)
+    data = wave_train.load_station(args.station)
+    shape_names = args.shape if args.shape else ct.shape_list
+    for shape_name in shape_names:
+        castles = [ct.build_shape(shape_name, i) for i in ct.shape_steps(shape_name)]
+        descriptions = [str(castle) for castle in castles]
+        results = wave_train.evaluate_designs(castles, data, scale=args.scale, distance=args.distance,
+                                              start=parse_date(args.start), end=parse_date(args.end))
+        for (description, (wave_hits, cause, timestamp)) in zip(descriptions, results):
+            when = "never" if timestamp is None else \
+                datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            print(description + " | wave hits: " + str(wave_hits) + " | cause: " + cause + " | fell: " + when)
+    return 0
+
+#runs the events subcommand: every castle design of the sweep against a buoy wave train, with
+# tides and rain bursts, on the event scheduler
+def events_command(args) -> int:
+    import datetime
+    import castle_test as ct
+    import wave_train
+    import events
+    if args.R is not None:
+        ct.configure(R=args.R)
+    data = wave_train.load_station(args.station)
+    start = parse_date(args.start)
+    end = parse_date(args.end)
+    first = float(data["time"][0]) if start is None else start
+    last = float(data["time"][-1]) if end is None else end
+    reference = 0.0
+    if args.tide == "buoy":
+        reference = events.buoy_tide_reference(data)
+        if next(events.buoy_tides(data), None) is None:
+            print(data.station() + " has no TIDE readings, running without tides")
+    bursts = events.random_bursts(first, last, args.storms, args.storm_rain, args.seed)
+    shape_names = args.shape if args.shape else ct.shape_list
+    for shape_name in shape_names:
+        for i in ct.shape_steps(shape_name):
+            castle = ct.build_shape(shape_name, i)
+            description = str(castle)
+            if args.tide == "buoy":
+                tides = events.buoy_tides(data)
+            elif args.tide == "synthetic":
+                tides = events.synthetic_tides(first, last, args.tide_amplitude)
+            else:
+                tides = None
+            runs = wave_train.buoy_runs(data, scale=args.scale, distance=args.distance, start=start, end=end)
+            simulation = events.EventSimulation(castle, runs, tides, events.rain_bursts(bursts),
+                                                slope=args.slope, tide_reference=reference)
+            (wave_hits, cause, timestamp) = simulation.run()
+            when = "never" if timestamp is None else \
+                datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            print(description + " | wave hits: " + str(wave_hits) + " | cause: " + cause + " | fell: " + when)
+            print("  " + str(simulation))
+    return 0
+
+#runs the follow subcommand: tails a buoy file and keeps every castle design's prediction up to
+# date as rows get appended
+def follow_command(args) -> int:
+    import datetime
+    import castle_test as ct
+    import wave_train
+    import live
+    if args.R is not None:
+        ct.configure(R=args.R)
+    shape_names = args.shape if args.shape else ct.shape_list
+    castles = [ct.build_shape(shape_name, i) for shape_name in shape_names for i in ct.shape_steps(shape_name)]
+    follower = live.Follower(wave_train.station_path(args.station), castles, scale=args.scale, distance=args.distance, from_start=args.from_start,
+                             window_seconds=args.window_hours * 60 * 60)
+
+    def report(follower, changed, latency):
+        for castle in changed:
+            (wave_hits, cause, timestamp) = castle.outcome
+            when = "never" if timestamp is None else \
+                datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            print(castle.description + " | wave hits: " + str(wave_hits) + " | cause: " + cause + " | fell: " + when)
+        print("  " + str(follower.wave_stats))
+        print("  " + str(follower) + " | changed: " + str(len(changed)) + " | " +
+              str(round(latency * 1000)) + " ms after the file changed", flush=True)
+
+    try:
+        follower.follow(report, args.seconds, args.poll)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+#runs the layout subcommand: a whole beach of castles hit by waves with random run-ups
+def layout_command(args) -> int:
+    import layout
+    import outcomes
+    start = time.perf_counter()
+    if args.file:
+        beach = layout.load(args.file, shelter=not args.no_shelter)
+    else:
+        beach = layout.random_layout(args.castles, width=args.width, seed=args.seed, shelter=not args.no_shelter)
+    built = time.perf_counter()
+    wave_hits = beach.run(layout.random_run_ups(args.waves, seed=args.seed), args.max_wave_hits)
+    finished = time.perf_counter()
+    counts = outcomes.OutcomeCounts()
+    beach.add_to(counts)
+    print(str(beach))
+    for (shape_name, ids) in beach.members.items():
+        print(shape_name.capitalize() + " average: " + str(float(wave_hits[ids].mean())) + " (" + str(len(ids)) + " castles)")
+    print(str(counts))
+    print("Built in " + str(round(built - start, 3)) + " s, ran in " + str(round(finished - built, 3)) + " s")
+    return 0
+
+#runs the buoy subcommand: average wave heights per station, like ocean_data/avg_wave_heights.txt
+def buoy_command(args) -> int:
+    import buoy_data
+    paths = args.files if args.files else buoy_data.station_files()
+    for path in paths:
+        data = buoy_data.load(path, use_sidecar=not args.no_cache)
+        print(data.station() + " average waveheight: " + str(round(data.average("WVHT"), 3)) + " m")
+    return 0
+
+#runs the buoy-stats subcommand: aggregates of a buoy field over a range, from the buoy index
+def buoy_stats_command(args) -> int:
+    import datetime
+    import buoy_index
+    index = buoy_index.BuoyIndex()
+    if index.rebuilt:
+        print("Indexed " + ", ".join(index.rebuilt))
+    (start, end) = (parse_date(args.start), parse_date(args.end))
+    stations = args.station if args.station else list(index.paths)
+    for station in index.match(stations):
+        print(station + " | " + str(index.summary(station, args.field, start, end)))
+    total = index.summary(stations, args.field, start, end)
+    if len(index.match(stations)) > 1:
+        print("all | " + str(total))
+    for q in args.quantile or []:
+        print("p" + format(100 * q, "g") + " " + args.field + ": " + str(total.quantile(q)))
+    if args.by:
+        if start is None or end is None:
+            print("--by needs --start and --end")
+            return 2
+        for (first, summary) in index.breakdown(stations, args.field, args.by, start, end):
+            when = datetime.datetime.fromtimestamp(first, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")
+            print(when + " | " + str(summary))
+    return 0
+
+#runs the startup subcommand: times cold starts of the sweep imports against COLD_START_BUDGET
+def startup_command(args) -> int:
+    times = list()
+    for run in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import sandcastle, sweep"], check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    median = times[len(times) // 2]
+    print("Cold start: median " + str(round(median * 1000, 1)) + " ms over " + str(args.runs) +
+          " runs (budget " + str(round(COLD_START_BUDGET * 1000)) + " ms)")
+    if median > COLD_START_BUDGET:
+        print("Over budget!")
+        return 1
+    return 0
+
+#runs the memory subcommand: bytes kept per simulated castle with and without records.RunRecords
+def memory_command(args) -> int:
+    import records
+    shape_names = args.shape if args.shape else ["cube", "cylinder", "pyramid", "cone"]
+    for shape_name in shape_names:
+        count = args.castles if args.castles else records.BENCHMARK_CASTLES
+        tuples = records.bytes_per_castle(shape_name, packed=False, count=count)
+        packed = records.bytes_per_castle(shape_name, packed=True, count=count)
+        print(shape_name.capitalize() + ": " + str(round(tuples)) + " bytes/castle as tuples, " +
+              str(round(packed)) + " bytes/castle packed (" + str(round(tuples / packed, 1)) + "x smaller)")
+    return 0
+
+#runs the bench subcommand: micro and macro benchmarks, optionally compared against a baseline
+def bench_command(args) -> int:
+    import benchmarks
+    results = benchmarks.run_benchmarks(args.shape, quick=args.quick, engine=args.engine,
+                                        micro=not args.macro_only, macro=not args.micro_only)
+    for line in benchmarks.report(results):
+        print(line)
+    if args.output:
+        benchmarks.save(results, args.output)
+        print("Saved results to " + args.output)
+    if args.baseline:
+        regressions = benchmarks.compare(results, benchmarks.load(args.baseline), args.threshold)
+        for (name, metric, old, new, ratio) in regressions:
+            print("REGRESSION " + name + " " + metric + ": " + str(round(old, 1)) + " -> " + str(round(new, 1)) +
+                  " (" + str(round(ratio, 2)) + "x worse)")
+        if regressions:
+            return 1
+        print("No regressions against " + args.baseline)
+    return 0
+
+#builds the argument parser
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="sandcastle", description="Sandcastle wave-erosion simulations")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each phase of the per-hit loop and print a breakdown to stderr (or set SANDCASTLE_PROFILE=1)")
+    parser.add_argument("--profile-output", metavar="PATH", help="also save the profile as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sweep_parser = commands.add_parser("sweep", help="run the castle_test.py sweep")
+    sweep_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                              help="shape to sweep (repeat for more than one; default: all)")
+    sweep_parser.add_argument("--R", type=int, help="number of shape heights to try (castle_test.R)")
+    sweep_parser.add_argument("--INC", type=int, help="wave grid steps + 1 (castle_test.INC)")
+    sweep_parser.add_argument("--VOL", type=float, help="volume of sand in m^3 (castle_test.VOL)")
+    sweep_parser.add_argument("--max-wave-hits", type=int, help="hits a castle has to survive (castle_test.MAX_WAVE_HITS)")
+    sweep_parser.add_argument("--jobs", type=int, default=1, help="worker processes (default: 1)")
+    sweep_parser.add_argument("--engine", choices=["scalar", "fast", "batch"], default="scalar",
+                              help="per-hit loop, fast-forward solver or numpy batch (default: scalar)")
+    sweep_parser.add_argument("--plot", metavar="PATH", help="save a bar chart of the averages to PATH")
+    sweep_parser.add_argument("--store", metavar="DIR", help="append the per-castle results to a results store")
+    sweep_parser.add_argument("--stats", action="store_true",
+                              help="print the mean, spread, extremes and quantiles of the wave hits per shape and cause")
+    sweep_parser.add_argument("--stats-only", action="store_true",
+                              help="keep only the streaming stats, not every castle's result (implies --stats)")
+    sweep_parser.add_argument("--checkpoint", metavar="DIR", help="save every finished chunk to DIR as the sweep goes")
+    sweep_parser.add_argument("--resume", action="store_true", help="skip the chunks already saved in --checkpoint")
+    sweep_parser.add_argument("--cache", metavar="PATH", help="sqlite file of castle outcomes to reuse and add to")
+    sweep_parser.add_argument("--cache-max-entries", type=int, default=1000000,
+                              help="outcomes the cache keeps before dropping the least recently used (default: 1000000)")
+    sweep_parser.add_argument("--export", metavar="PATH",
+                              help="write every castle and the per-shape summaries to a .csv or .xlsx file as the sweep runs")
+    sweep_parser.add_argument("--serve", metavar="HOST:PORT",
+                              help="hand the chunks to workers connecting to this address instead of local processes")
+    sweep_parser.add_argument("--local-workers", type=int, default=0,
+                              help="worker processes to start on this machine for --serve")
+    sweep_parser.add_argument("--token", help="token workers need to connect (default: $SANDCASTLE_TOKEN)")
+    sweep_parser.set_defaults(func=sweep_command)
+
+    worker_parser = commands.add_parser("worker", help="run sweep chunks for a coordinator started with sweep --serve")
+    worker_parser.add_argument("--connect", required=True, metavar="HOST:PORT", help="address of the coordinator")
+    worker_parser.add_argument("--token", help="token the coordinator asks for (default: $SANDCASTLE_TOKEN)")
+    worker_parser.add_argument("--name", help="name to show in the coordinator's stats (default: host-pid)")
+    worker_parser.set_defaults(func=worker_command)
+
+    scenarios_parser = commands.add_parser("scenarios", help="run the sweep for every scenario in a JSON or TOML file")
+    scenarios_parser.add_argument("file", help="scenario file (.json or .toml)")
+    scenarios_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                                  help="shape to sweep (repeat for more than one; default: all)")
+    scenarios_parser.add_argument("--jobs", type=int, default=1, help="worker processes per scenario (default: 1)")
+    scenarios_parser.add_argument("--engine", choices=["scalar", "fast", "batch"], default="scalar",
+                                  help="per-hit loop, fast-forward solver or numpy batch (default: scalar)")
+    scenarios_parser.add_argument("--cache", metavar="PATH", help="sqlite file of castle outcomes to reuse and add to")
+    scenarios_parser.set_defaults(func=scenarios_command)
+
+    query_parser = commands.add_parser("query", help="filter the castles in a results store")
+    query_parser.add_argument("store", help="results store directory")
+    query_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                              help="shape to match (repeat for more than one; default: all)")
+    query_parser.add_argument("--cause", action="append", choices=["erosion", "knockout", "rain", "did_not_fall"],
+                              help="failure cause to match (repeat for more than one; default: all)")
+    query_parser.add_argument("--min-height", type=float, help="shortest castle height in meters")
+    query_parser.add_argument("--max-height", type=float, help="tallest castle height in meters")
+    query_parser.add_argument("--rows", type=int, default=0, help="matching rows to print")
+    query_parser.set_defaults(func=query_command)
+
+    heatmaps_parser = commands.add_parser("heatmaps", help="wave-hits and failure-cause heatmaps of a results store")
+    heatmaps_parser.add_argument("store", help="results store directory")
+    heatmaps_parser.add_argument("--output", default="heatmaps", help="directory to save the figures to (default: heatmaps)")
+    heatmaps_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                                 help="shape to draw (repeat for more than one; default: all)")
+    heatmaps_parser.add_argument("--bins", type=int, default=100, help="most bins along the shape and wave height axes")
+    heatmaps_parser.add_argument("--bands", type=int, default=4, help="distance bands, one panel each")
+    heatmaps_parser.add_argument("--jobs", type=int, default=1, help="worker processes drawing the figures (default: 1)")
+    heatmaps_parser.set_defaults(func=heatmaps_command)
+
+    sample_parser = commands.add_parser("sample", help="sample castles until the mean wave hits converge")
+    sample_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                               help="shape to sample (repeat for more than one; default: all)")
+    sample_parser.add_argument("--method", choices=["random", "lhs", "halton"], default="lhs",
+                               help="Monte Carlo, Latin hypercube or randomly shifted Halton points (default: lhs)")
+    sample_parser.add_argument("--tolerance", type=float, default=2.0, help="half-width of the interval to stop at, in wave hits")
+    sample_parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the interval")
+    sample_parser.add_argument("--batch-size", type=int, default=64, help="castles per batch")
+    sample_parser.add_argument("--max-samples", type=int, default=20000, help="castles per shape before giving up")
+    sample_parser.add_argument("--seed", type=int, help="random seed")
+    sample_parser.add_argument("--VOL", type=float, help="volume of sand in m^3 (castle_test.VOL)")
+    sample_parser.add_argument("--max-wave-hits", type=int, help="hits a castle has to survive (castle_test.MAX_WAVE_HITS)")
+    sample_parser.add_argument("--engine", choices=["scalar", "fast"], default="scalar",
+                               help="per-hit loop or fast-forward solver (default: scalar)")
+    sample_parser.set_defaults(func=sample_command)
+
+    refine_parser = commands.add_parser("refine", help="adaptively map where a shape stops surviving")
+    refine_parser.add_argument("--shape", choices=["cube", "cylinder", "pyramid", "cone"], default="cone")
+    refine_parser.add_argument("--dimension", action="append",
+                               choices=["shape_height", "wave_height", "break_depth", "distance"],
+                               help="dimension to vary (repeat for more than one; default: all)")
+    refine_parser.add_argument("--max-depth", type=int, default=5, help="finest cells are 1/2^depth of each range")
+    refine_parser.add_argument("--start-depth", type=int, default=1, help="depth of the first, coarse cells")
+    refine_parser.add_argument("--hit-tolerance", type=int,
+                               help="also split cells whose wave hits differ by more than this (default: causes only)")
+    refine_parser.add_argument("--no-prune", action="store_true", help="simulate every corner, even implied ones")
+    refine_parser.add_argument("--check", action="store_true", help="run the pruned corners too and compare")
+    refine_parser.add_argument("--max-wave-hits", type=int, help="hits a castle has to survive (castle_test.MAX_WAVE_HITS)")
+    refine_parser.add_argument("--engine", choices=["scalar", "fast"], default="scalar",
+                               help="per-hit loop or fast-forward solver (default: scalar)")
+    refine_parser.set_defaults(func=refine_command)
+
+    optimize_parser = commands.add_parser("optimize", help="find the height with the most expected wave hits at a fixed volume")
+    optimize_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                                 help="shape to optimize (repeat for more than one; default: all)")
+    optimize_parser.add_argument("--method", choices=["golden", "halving"], default="golden",
+                                 help="golden-section search or successive-halving tournament (default: golden)")
+    optimize_parser.add_argument("--VOL", type=float, help="volume of sand in m^3 (castle_test.VOL)")
+    optimize_parser.add_argument("--waves", type=int, help="score against this many Latin-hypercube waves (default: the sweep's wave grid)")
+    optimize_parser.add_argument("--seed", type=int, help="random seed for --waves")
+    optimize_parser.add_argument("--max-wave-hits", type=int, help="hits a castle has to survive (castle_test.MAX_WAVE_HITS)")
+    optimize_parser.add_argument("--engine", choices=["scalar", "fast"], default="fast",
+                                 help="per-hit loop or fast-forward solver (default: fast)")
+    optimize_parser.set_defaults(func=optimize_command)
+
+    train_parser = commands.add_parser("train", help="hit each castle design with waves from a buoy file")
+    train_parser.add_argument("--station", default="scripps_south_california",
+                              help="station name in ocean_data/ or a path to an NDBC file")
+    train_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                              help="shape to test (repeat for more than one; default: all)")
+    train_parser.add_argument("--R", type=int, help="number of shape heights to try (castle_test.R)")
+    train_parser.add_argument("--scale", type=float, help="buoy-to-beach wave height scale (default: average WVHT -> AVG_WAVE_HEIGHT)")
+    train_parser.add_argument("--distance", type=float, help="meters each wave runs past the castle (default: middle of the sweep distances)")
+    train_parser.add_argument("--start", help="first day of the train, YYYY-MM-DD")
+    train_parser.add_argument("--end", help="day the train stops, YYYY-MM-DD")
+    train_parser.set_defaults(func=train_command)
+
+    events_parser = commands.add_parser("events", help="hit each castle design with buoy waves, tides and rain bursts")
+    events_parser.add_argument("--station", default="scripps_south_california",
+                               help="station name in ocean_data/ or a path to an NDBC file")
+    events_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                               help="shape to test (repeat for more than one; default: all)")
+    events_parser.add_argument("--R", type=int, help="number of shape heights to try (castle_test.R)")
+    events_parser.add_argument("--scale", type=float, help="buoy-to-beach wave height scale (default: average WVHT -> AVG_WAVE_HEIGHT)")
+    events_parser.add_argument("--distance", type=float, help="meters each wave runs past the castle at the average tide (default: middle of the sweep distances)")
+    events_parser.add_argument("--start", help="first day of the train, YYYY-MM-DD")
+    events_parser.add_argument("--end", help="day the train stops, YYYY-MM-DD")
+    events_parser.add_argument("--tide", choices=["none", "buoy", "synthetic"], default="synthetic",
+                               help="tides from the buoy's TIDE column, a sine tide, or none (default: synthetic)")
+    events_parser.add_argument("--tide-amplitude", type=float, default=0.5, help="meters, for the synthetic tide")
+    events_parser.add_argument("--slope", type=float, default=0.05, help="rise over run of the beach")
+    events_parser.add_argument("--storms", type=float, default=0.0, help="random rain bursts per day")
+    events_parser.add_argument("--storm-rain", type=float, default=10.0, help="extra rain during a burst, in multiples of the usual rain")
+    events_parser.add_argument("--seed", type=int, help="seed for the rain bursts")
+    events_parser.set_defaults(func=events_command)
+
+    follow_parser = commands.add_parser("follow", help="tail a buoy file and update each castle design's prediction as rows come in")
+    follow_parser.add_argument("--station", default="scripps_south_california",
+                               help="station name in ocean_data/ or a path to an NDBC file")
+    follow_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                               help="shape to follow (repeat for more than one; default: all)")
+    follow_parser.add_argument("--R", type=int, help="number of shape heights to try (castle_test.R)")
+    follow_parser.add_argument("--scale", type=float, help="buoy-to-beach wave height scale (default: pinned from the file when following starts)")
+    follow_parser.add_argument("--distance", type=float, help="meters each wave runs past the castle (default: middle of the sweep distances)")
+    follow_parser.add_argument("--from-start", action="store_true",
+                               help="build the castles at the first reading instead of the latest one")
+    follow_parser.add_argument("--window-hours", type=float, default=24.0, help="rolling window of the wave-height stats")
+    follow_parser.add_argument("--poll", type=float, default=0.1, help="seconds between checks of the file")
+    follow_parser.add_argument("--seconds", type=float, help="stop following after this long (default: until Ctrl-C)")
+    follow_parser.set_defaults(func=follow_command)
+
+    layout_parser = commands.add_parser("layout", help="hit a whole beach layout of castles with waves")
+    layout_parser.add_argument("--file", help="JSON list of {shape, height, x, y} castles (default: a random layout)")
+    layout_parser.add_argument("--castles", type=int, default=1000, help="castles in a random layout")
+    layout_parser.add_argument("--width", type=float, default=100.0, help="meters of shore a random layout covers")
+    layout_parser.add_argument("--waves", type=int, default=300, help="waves to hit the layout with")
+    layout_parser.add_argument("--max-wave-hits", type=int, help="hits a castle has to survive (default: no cap)")
+    layout_parser.add_argument("--seed", type=int, help="seed for the layout and the run-ups")
+    layout_parser.add_argument("--no-shelter", action="store_true", help="castles don't shelter the ones behind them")
+    layout_parser.set_defaults(func=layout_command)
+
+    buoy_parser = commands.add_parser("buoy", help="average wave heights from the NDBC buoy files")
+    buoy_parser.add_argument("files", nargs="*", help="buoy files (default: everything in ocean_data/)")
+    buoy_parser.add_argument("--no-cache", action="store_true", help="parse the text files and skip the sidecars")
+    buoy_parser.set_defaults(func=buoy_command)
+
+    buoy_stats_parser = commands.add_parser("buoy-stats", help="mean, spread and quantiles of a buoy field over a date range")
+    buoy_stats_parser.add_argument("--station", action="append",
+                                   help="station name or part of one, e.g. east_florida (repeat for more; default: all)")
+    buoy_stats_parser.add_argument("--field", choices=["WVHT", "DPD", "APD"], default="WVHT", help="buoy field (default: WVHT)")
+    buoy_stats_parser.add_argument("--start", help="first day, YYYY-MM-DD (default: the first reading)")
+    buoy_stats_parser.add_argument("--end", help="day the range stops, YYYY-MM-DD (default: the last reading)")
+    buoy_stats_parser.add_argument("--quantile", type=float, action="append", help="quantile to print, e.g. 0.9 (repeat for more)")
+    buoy_stats_parser.add_argument("--by", choices=["year", "month", "day", "hour"], help="also print every bucket of the range")
+    buoy_stats_parser.set_defaults(func=buoy_stats_command)
+
+    bench_parser = commands.add_parser("bench", help="benchmark the geometry, the erosion step and whole sweeps")
+    bench_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                              help="shape to benchmark (repeat for more than one; default: all)")
+    bench_parser.add_argument("--quick", action="store_true", help="one small sweep size instead of several")
+    bench_parser.add_argument("--micro-only", action="store_true", help="skip the sweeps")
+    bench_parser.add_argument("--macro-only", action="store_true", help="skip the micro benchmarks")
+    bench_parser.add_argument("--engine", choices=["scalar", "fast", "batch"], default="scalar",
+                              help="engine for the sweeps (default: scalar)")
+    bench_parser.add_argument("--output", metavar="PATH", help="save the results as JSON")
+    bench_parser.add_argument("--baseline", metavar="PATH", help="saved results to compare against")
+    bench_parser.add_argument("--threshold", type=float, default=0.25,
+                              help="how much worse than the baseline counts as a regression (default: 0.25)")
+    bench_parser.set_defaults(func=bench_command)
+
+    startup_parser = commands.add_parser("startup", help="check the cold-start time against the budget")
+    startup_parser.add_argument("--runs", type=int, default=STARTUP_RUNS)
+    startup_parser.set_defaults(func=startup_command)
+
+    memory_parser = commands.add_parser("memory", help="bytes kept per simulated castle, tuples vs packed records")
+    memory_parser.add_argument("--shape", action="append", choices=["cube", "cylinder", "pyramid", "cone"],
+                               help="shape to measure (repeat for more than one; default: all)")
+    memory_parser.add_argument("--castles", type=int, help="castles to simulate per shape (default: records.BENCHMARK_CASTLES)")
+    memory_parser.set_defaults(func=memory_command)
+    return parser
+
+def main(argv = None) -> int:
+    args = make_parser().parse_args(argv)
+    if not (args.profile or args.profile_output or os.environ.get("SANDCASTLE_PROFILE", "") not in ("", "0")):
+        return args.func(args)
+    #profiling is only imported when it's asked for, so a normal run pays nothing for it
+    import json
+    import profiling
+    profiler = profiling.enable()
+    try:
+        return args.func(args)
+    finally:
+        profiling.finish(profiler)
+        if args.profile_output:
+            with open(args.profile_output, "w") as f:
+                json.dump(profiler.to_dict(), f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
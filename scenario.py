@@ -0,0 +1,213 @@
+import os
+import json
+import math
+import castle_test as ct
+import calculations as calc
+import sand_castle_shapes as shapes
+import wave as waves
+
+#What-if scenarios
+#A Scenario holds every knob of the model in one place: the sweep knobs, the multipliers and
+# the material constants that are otherwise spread over castle_test.py, sand_castle_shapes.py,
+# wave.py and calculations.py (some of them in more than one file). Applying a scenario sets
+# each knob in every module that has a copy of it, works out everything that is derived from
+# them with the same formulas as the top of castle_test.py, and hands back the scenario that
+# was there before, the same way castle_test.configure works:
+#       old = scenario.apply()
+#       try: ...
+#       finally: old.apply()
+#Scenarios load from JSON or TOML, so a batch of them runs back to back in one process that
+# keeps its imports and warmed caches, instead of editing the constants and starting over.
+#A scenario doesn't have to be applied to be simulated: constants() hands back its physics
+# constants as a castle_test.Constants, which simulate_castle, simulate_wave_train,
+# fast_forward.advance/fast_forward and batch.CastleBatch take instead of reading the module
+# constants, so castles of two scenarios can be simulated side by side in one process:
+#       storm = scenario.Scenario("storm", RAIN_MULTIPLIER=40.0).constants()
+#       ct.simulate_castle(shape, storm.wave(h, d, dist), counts, constants=storm)
+#NOTE: the sweep grid, the sweep drivers (sweep, run_scenarios) and the defaults of wave_train,
+#      events and live still come from the module constants, so those need the scenario applied,
+#      which is process-wide: run them one after the other (run_scenarios), or in separate
+#      processes. Everything with a default from the constants reads it when it runs, never when
+#      it is imported, so an applied scenario reaches them too. Parallel sweeps hand the whole
+#      scenario to every worker process.
+
+'''
+CONSTANTS for use in the file
+'''
+#knob -> (module, name) of every copy of it
+KNOBS = {"VOL": [(ct, "VOL")],
+         "R": [(ct, "R")],
+         "INC": [(ct, "INC")],
+         "MAX_WAVE_HITS": [(ct, "MAX_WAVE_HITS")],
+         "WAVE_MULTIPLIER": [(ct, "WAVE_MULTIPLIER")],
+         "RAIN_MULTIPLIER": [(ct, "RAIN_MULTIPLIER")],
+         "BASE_WAVE_HEIGHT": [(ct, "BASE_WAVE_HEIGHT")],
+         "BASE_RAINFALL": [(ct, "BASE_RAINFALL")],
+         "TIME_PER_WAVE": [(ct, "TIME_PER_WAVE")],
+         "INITIAL_SATURATION": [(ct, "INITIAL_SATURATION")],
+         "OVERSATURATED": [(ct, "OVERSATURATED")],
+         "START_DISTANCE": [(ct, "START_DISTANCE")],
+         "END_DISTANCE": [(ct, "END_DISTANCE")],
+         "MIN_CASTLE_RADIUS": [(ct, "MIN_CASTLE_RADIUS")],
+         "MAX_CASTLE_RADIUS": [(ct, "MAX_CASTLE_RADIUS")],
+         "MIN_CASTLE_HEIGHT": [(ct, "MIN_CASTLE_HEIGHT")],
+         "MAX_CASTLE_HEIGHT": [(ct, "MAX_CASTLE_HEIGHT")],
+         "SAND_DENSITY": [(ct, "SAND_DENSITY"), (shapes, "SAND_DENSITY")],
+         "SAND_DIAMETER": [(ct, "SAND_DIAMETER"), (shapes, "SAND_DIAMETER"), (calc, "SAND_SIZE")],
+         "WATER_DENSITY": [(ct, "WATER_DENSITY"), (shapes, "WATER_DENSITY"), (waves, "WATER_DENSITY")],
+         "GRAVITY": [(ct, "GRAVITY"), (shapes, "GRAVITY"), (waves, "GRAVITY")],
+         "Z": [(ct, "Z")],
+         "J": [(ct, "J")],
+         "E": [(ct, "E")],
+         "ALPHA": [(ct, "ALPHA")],
+         "GAMMA": [(ct, "GAMMA")],
+         "MU": [(calc, "MU")],
+         "PHI": [(calc, "PHI")],
+         "KAPPA": [(calc, "KAPPA")],
+         "S": [(calc, "S")]}
+INTEGER_KNOBS = ["R", "INC", "MAX_WAVE_HITS"]
+
+
+#Every knob of the model, under a name
+class Scenario:
+    name: str
+    values: dict #knob -> value, one for every knob in KNOBS
+
+    #Constructor; knobs that aren't given keep the value the modules have right now
+    def __init__(self, name: str = "default", **values):
+        for knob in values:
+            if knob not in KNOBS:
+                raise ValueError("Unknown scenario knob: " + str(knob))
+        for knob in INTEGER_KNOBS:
+            if knob in values and values[knob] != int(values[knob]):
+                raise ValueError(knob + " has to be a whole number")
+            if knob in values:
+                values[knob] = int(values[knob])
+        self.name = name
+        self.values = dict()
+        for (knob, copies) in KNOBS.items():
+            (module, attribute) = copies[0]
+            self.values[knob] = values.get(knob, getattr(module, attribute))
+
+    #to_string method for pretty printing
+    def __str__(self):
+        changed = [knob + "=" + str(value) for (knob, value) in self.values.items() if value != DEFAULTS.values[knob]]
+        return "Scenario: " + self.name + " | " + (", ".join(changed) if changed else "defaults")
+
+    def __eq__(self, other):
+        return isinstance(other, Scenario) and self.name == other.name and self.values == other.values
+
+    #returns the scenario as a JSON-ready dict
+    def to_dict(self) -> dict:
+        return dict(self.values, name=self.name)
+
+    #returns {(module, name): value} for everything derived from the knobs, with the formulas at
+    # the top of castle_test.py
+    def derived(self) -> dict:
+        v = self.values
+        sand_radius = v["SAND_DIAMETER"] / 2
+        sand_volume = (4/3) * math.pi * (sand_radius**3)
+        avg_wave_height = v["BASE_WAVE_HEIGHT"] * v["WAVE_MULTIPLIER"]
+        avg_break_depth = avg_wave_height * 1.3 * v["WAVE_MULTIPLIER"]
+        avg_rainfall = v["BASE_RAINFALL"] * v["RAIN_MULTIPLIER"]
+        return {(ct, "SAND_RADIUS"): sand_radius, (ct, "SAND_VOLUME"): sand_volume,
+                (shapes, "SAND_RADIUS"): sand_radius, (shapes, "SAND_VOLUME"): sand_volume,
+                (ct, "AVG_WAVE_HEIGHT"): avg_wave_height, (ct, "AVG_BREAK_DEPTH"): avg_break_depth,
+                (ct, "AVG_RAINFALL"): avg_rainfall,
+                (ct, "AVG_RAINFALL_PER_WAVE"): avg_rainfall * (1/60) * (1/60) * v["TIME_PER_WAVE"],
+                (ct, "START_HEIGHT"): avg_wave_height * .9, (ct, "END_HEIGHT"): avg_wave_height * 1.1,
+                (ct, "START_DEPTH"): avg_break_depth * .9, (ct, "END_DEPTH"): avg_break_depth * 1.1}
+
+    #returns the scenario's physics constants as a castle_test.Constants, without applying it
+    def constants(self):
+        v = self.values
+        rain_per_wave = self.derived()[(ct, "AVG_RAINFALL_PER_WAVE")]
+        return ct.Constants(sand_density=v["SAND_DENSITY"], sand_diameter=v["SAND_DIAMETER"],
+                            water_density=v["WATER_DENSITY"], gravity=v["GRAVITY"], j=v["J"], e=v["E"],
+                            alpha=v["ALPHA"], gamma=v["GAMMA"], mu=v["MU"],
+                            cohesion=calc.cohesion_with(v["Z"], v["MU"], v["PHI"], v["KAPPA"], v["S"], v["SAND_DIAMETER"]),
+                            rain_per_wave=rain_per_wave, time_per_wave=v["TIME_PER_WAVE"],
+                            initial_saturation=v["INITIAL_SATURATION"], oversaturated=v["OVERSATURATED"])
+
+    #Sets every module up for this scenario
+    #returns the scenario the modules had before, so it can be put back with old.apply()
+    def apply(self):
+        if self.values["R"] < 2 or self.values["INC"] < 2:
+            raise ValueError("R and INC have to be at least 2")
+        old = current("previous")
+        for (knob, copies) in KNOBS.items():
+            for (module, attribute) in copies:
+                setattr(module, attribute, self.values[knob])
+        for ((module, attribute), value) in self.derived().items():
+            setattr(module, attribute, value)
+        #works out the sweep loop values again from the new ranges
+        ct.configure(VOL=self.values["VOL"], R=self.values["R"], INC=self.values["INC"],
+                     MAX_WAVE_HITS=self.values["MAX_WAVE_HITS"])
+        #cohesion remembers its answers, which depend on the constants
+        calc.cohesion.cache_clear()
+        return old
+
+
+#returns the scenario the modules are set up for right now
+def current(name: str = "current") -> Scenario:
+    return Scenario(name)
+
+#returns a Scenario from a dict of knobs with an optional "name"
+#an optional "buoy" table ({"station", "start", "end", "quantile"}, all but station optional, days
+# as YYYY-MM-DD) sets BASE_WAVE_HEIGHT from that range of the buoy data, see buoy_index.base_wave_height
+def from_dict(data: dict, name: str = "default") -> Scenario:
+    values = dict(data)
+    name = str(values.pop("name", name))
+    if "buoy" in values:
+        values["BASE_WAVE_HEIGHT"] = buoy_wave_height(values.pop("buoy"), values.get("BASE_WAVE_HEIGHT"))
+    return Scenario(name, **values)
+
+#returns the BASE_WAVE_HEIGHT for a scenario's "buoy" table
+def buoy_wave_height(buoy: dict, base: float = None) -> float:
+    import buoy_index
+    unknown = set(buoy) - {"station", "start", "end", "quantile"}
+    if "station" not in buoy or unknown:
+        raise ValueError("A buoy table needs a station and takes start, end and quantile: " + str(buoy))
+    return buoy_index.base_wave_height(buoy_index.BuoyIndex(), buoy["station"], buoy_index.day_timestamp(buoy.get("start")),
+                                       buoy_index.day_timestamp(buoy.get("end")), buoy.get("quantile"), base)
+
+#Reads scenarios from a .json or .toml file
+#the file holds either the knobs of a single scenario, or a list of scenarios under "scenario"
+# (a JSON list of objects works too); scenarios without a name are numbered
+#returns a list of Scenarios
+def load(path: str) -> list:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        import tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif extension == ".json":
+        with open(path, "r") as f:
+            data = json.load(f)
+    else:
+        raise ValueError("Scenario files have to be .json or .toml: " + str(path))
+    if isinstance(data, dict) and "scenario" in data:
+        data = data["scenario"]
+    if isinstance(data, dict):
+        data = [data]
+    return [from_dict(item, "scenario-" + str(k + 1)) for (k, item) in enumerate(data)]
+
+#Runs the sweep for every scenario, one after the other in this process
+#sweep options (shape_names, jobs, engine, cache, ...) go to sweep.run_parallel_sweep; with jobs
+# above 1 every scenario's chunks are spread over that many worker processes
+#returns a list of (Scenario, sweep.SweepResult) in the same order as scenarios
+def run_scenarios(scenarios: list, shape_names = None, **options) -> list:
+    import sweep
+    options.setdefault("jobs", 1)
+    results = list()
+    for scenario in scenarios:
+        old = scenario.apply()
+        try:
+            results.append((scenario, sweep.run_parallel_sweep(shape_names, **options)))
+        finally:
+            old.apply()
+    return results
+
+
+#the knobs as they are written in the files
+DEFAULTS = current("default")
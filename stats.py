@@ -0,0 +1,300 @@
+import math
+
+#Streaming statistics of the wave hits in a sweep
+#Every accumulator here is updated one castle at a time, keeps a fixed amount of memory however
+# many castles it has seen, and can be merged with another one of the same kind, so each worker
+# (or chunk) keeps its own and the parent adds them up at the end:
+#  - RunningStats: count, mean and variance (Welford; Chan et al. to merge), min and max
+#  - Histogram: counts in fixed-width bins over [0, max_wave_hits]
+#  - TDigest: approximate quantiles (a merging t-digest)
+#SweepStats keeps one of each per shape and per (shape, failure cause).
+
+'''
+CONSTANTS for use in the file
+'''
+HISTOGRAM_BINS = 30
+COMPRESSION = 100 #t-digest: more keeps more centroids and gives better quantiles
+DIGEST_BUFFER = 500 #t-digest: points held back before they are merged into the centroids
+REPORT_QUANTILES = [0.5, 0.9, 0.99]
+
+
+#Count, mean, variance, min and max of a stream of numbers
+class RunningStats:
+    count: int
+    mean: float
+    m2: float #sum of squared differences from the mean
+    minimum: float
+    maximum: float
+
+    #Constructor
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    #adds one number
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (x - self.mean)
+        if x < self.minimum:
+            self.minimum = x
+        if x > self.maximum:
+            self.maximum = x
+
+    #adds another RunningStats into this one and returns this one
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            (self.count, self.mean, self.m2) = (other.count, other.mean, other.m2)
+            (self.minimum, self.maximum) = (other.minimum, other.maximum)
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    #returns the sample variance (0 with fewer than two numbers)
+    def variance(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def stdev(self) -> float:
+        return math.sqrt(self.variance())
+
+
+#Counts in HISTOGRAM_BINS equal bins over [low, high]; anything outside goes in the end bins
+class Histogram:
+    low: float
+    high: float
+    counts: list
+
+    #Constructor
+    def __init__(self, low: float, high: float, bins: int = HISTOGRAM_BINS):
+        if high <= low or bins < 1:
+            raise ValueError("A histogram needs high > low and at least one bin")
+        self.low = low
+        self.high = high
+        self.counts = [0] * bins
+
+    #returns the bin a number falls in
+    def bin(self, x: float) -> int:
+        k = int((x - self.low) / (self.high - self.low) * len(self.counts))
+        return min(max(k, 0), len(self.counts) - 1)
+
+    #adds one number
+    def add(self, x: float):
+        self.counts[self.bin(x)] += 1
+
+    #adds another Histogram with the same bins into this one and returns this one
+    def merge(self, other):
+        if (other.low, other.high, len(other.counts)) != (self.low, self.high, len(self.counts)):
+            raise ValueError("Can only merge histograms with the same bins")
+        for k in range(len(self.counts)):
+            self.counts[k] += other.counts[k]
+        return self
+
+    #returns the (low, high) edges of a bin
+    def edges(self, k: int) -> tuple:
+        width = (self.high - self.low) / len(self.counts)
+        return (self.low + k * width, self.low + (k + 1) * width)
+
+
+#Approximate quantiles of a stream in a bounded number of centroids (merging t-digest)
+#Centroids near the middle of the distribution can hold more points than the ones near the
+# ends, so the tails stay sharp
+class TDigest:
+    compression: float
+    centroids: list #[mean, weight] sorted by mean
+    buffer: list #[x, weight] not merged in yet
+    weight: float #total weight, centroids and buffer
+    minimum: float
+    maximum: float
+
+    #Constructor
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self.centroids = list()
+        self.buffer = list()
+        self.weight = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def __len__(self) -> int:
+        return len(self.centroids) + len(self.buffer)
+
+    #adds a number with a weight
+    def add(self, x: float, weight: float = 1.0):
+        self.buffer.append([x, weight])
+        self.weight = self.weight + weight
+        if x < self.minimum:
+            self.minimum = x
+        if x > self.maximum:
+            self.maximum = x
+        if len(self.buffer) >= DIGEST_BUFFER:
+            self.compress()
+
+    #merges the buffer into the centroids
+    def compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = list()
+        merged = list()
+        (mean, weight) = points[0]
+        before = 0.0 #weight of the centroids already finished
+        for (x, w) in points[1:]:
+            proposed = weight + w
+            q = (before + proposed / 2) / self.weight
+            #biggest centroid allowed at q, the k1 scale function
+            if proposed <= 4 * self.weight * q * (1 - q) / self.compression:
+                mean = mean + (x - mean) * w / proposed
+                weight = proposed
+            else:
+                merged.append([mean, weight])
+                before = before + weight
+                (mean, weight) = (x, w)
+        merged.append([mean, weight])
+        self.centroids = merged
+
+    #adds another TDigest into this one and returns this one
+    def merge(self, other):
+        for (x, w) in other.centroids + other.buffer:
+            self.buffer.append([x, w])
+        self.weight = self.weight + other.weight
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.compress()
+        return self
+
+    #returns the approximate q quantile (0 <= q <= 1), or None if nothing was added
+    def quantile(self, q: float):
+        if not 0 <= q <= 1:
+            raise ValueError("q has to be between 0 and 1")
+        self.compress()
+        if not self.centroids:
+            return None
+        target = q * self.weight
+        #each centroid sits at the middle of the weight it covers
+        centers = list()
+        before = 0.0
+        for (mean, weight) in self.centroids:
+            centers.append(before + weight / 2)
+            before = before + weight
+        if target <= centers[0]:
+            (x0, x1, c0, c1) = (self.minimum, self.centroids[0][0], 0.0, centers[0])
+        elif target >= centers[-1]:
+            (x0, x1, c0, c1) = (self.centroids[-1][0], self.maximum, centers[-1], self.weight)
+        else:
+            k = 0
+            while centers[k + 1] < target:
+                k = k + 1
+            (x0, x1, c0, c1) = (self.centroids[k][0], self.centroids[k + 1][0], centers[k], centers[k + 1])
+        if c1 == c0:
+            return x0
+        return x0 + (x1 - x0) * (target - c0) / (c1 - c0)
+
+
+#RunningStats, Histogram and TDigest of the same stream
+class Accumulator:
+    running: RunningStats
+    histogram: Histogram
+    digest: TDigest
+
+    #Constructor; max_wave_hits is the top of the histogram
+    def __init__(self, max_wave_hits: int):
+        self.running = RunningStats()
+        self.histogram = Histogram(0, max(max_wave_hits, 1))
+        self.digest = TDigest()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        r = self.running
+        if r.count == 0:
+            return "castles: 0"
+        s = "castles: " + str(r.count) + " | mean: " + str(round(r.mean, 3)) + " | stdev: " + str(round(r.stdev(), 3)) + \
+            " | min: " + str(r.minimum) + " | max: " + str(r.maximum)
+        for q in REPORT_QUANTILES:
+            s = s + " | p" + str(round(100 * q)) + ": " + str(round(self.digest.quantile(q), 1))
+        return s
+
+    #adds one castle's wave hits
+    def add(self, wave_hits: int):
+        self.running.add(wave_hits)
+        self.histogram.add(wave_hits)
+        self.digest.add(wave_hits)
+
+    #adds another Accumulator into this one and returns this one
+    def merge(self, other):
+        self.running.merge(other.running)
+        self.histogram.merge(other.histogram)
+        self.digest.merge(other.digest)
+        return self
+
+
+#Accumulators of the wave hits per shape and per (shape, failure cause)
+class SweepStats:
+    max_wave_hits: int
+    shapes: dict #shape name -> Accumulator
+    causes: dict #(shape name, cause) -> Accumulator
+
+    #Constructor
+    def __init__(self, max_wave_hits: int):
+        self.max_wave_hits = max_wave_hits
+        self.shapes = dict()
+        self.causes = dict()
+
+    #to_string method for pretty printing
+    def __str__(self):
+        return "\n".join(self.report())
+
+    #adds one castle
+    def add(self, shape_name: str, wave_hits: int, cause: str):
+        if shape_name not in self.shapes:
+            self.shapes[shape_name] = Accumulator(self.max_wave_hits)
+        self.shapes[shape_name].add(wave_hits)
+        key = (shape_name, cause)
+        if key not in self.causes:
+            self.causes[key] = Accumulator(self.max_wave_hits)
+        self.causes[key].add(wave_hits)
+
+    #adds another SweepStats into this one and returns this one
+    def merge(self, other):
+        if other.max_wave_hits != self.max_wave_hits:
+            raise ValueError("Can only merge stats with the same max_wave_hits")
+        for (shape_name, accumulator) in other.shapes.items():
+            self.shapes.setdefault(shape_name, Accumulator(self.max_wave_hits)).merge(accumulator)
+        for (key, accumulator) in other.causes.items():
+            self.causes.setdefault(key, Accumulator(self.max_wave_hits)).merge(accumulator)
+        return self
+
+    #returns the average wave hits of a shape
+    def average_wave_hits(self, shape_name: str) -> float:
+        return self.shapes[shape_name].running.mean
+
+    #returns the stats as printable lines, a line per shape followed by a line per cause
+    def report(self) -> list:
+        lines = list()
+        for (shape_name, accumulator) in self.shapes.items():
+            lines.append(shape_name.capitalize() + " | " + str(accumulator))
+            for ((name, cause), by_cause) in self.causes.items():
+                if name == shape_name:
+                    lines.append("  " + cause + " | " + str(by_cause))
+        return lines
+
+
+#returns a SweepStats of one shape's castles from their wave hits and cause names
+def from_castles(shape_name: str, wave_hits, causes, max_wave_hits: int) -> SweepStats:
+    sweep_stats = SweepStats(max_wave_hits)
+    for (hits, cause) in zip(wave_hits, causes):
+        sweep_stats.add(shape_name, hits, cause)
+    return sweep_stats
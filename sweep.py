@@ -0,0 +1,328 @@
+import os
+from array import array
+import castle_test as ct
+import outcomes
+import stats
+
+#Parallel runner for the castle_test.py sweep
+#The (shape dims x wave height x break depth x distance) grid of every shape is numbered in the
+# same order castle_test.sweep_points visits it and cut into chunks of consecutive points.
+#Each chunk runs on its own (in a worker process or in-process) and hands back the wave_hits
+# of its castles plus its own OutcomeCounts, so no worker ever touches the module dictionaries.
+#Chunks are put back together in chunk order, so the results are the same however many
+# workers ran them.
+
+'''
+CONSTANTS for use in the file
+'''
+ENGINES = ["scalar", "fast", "batch"] #castle_test.simulate_castle, fast_forward.fast_forward, batch.CastleBatch
+CHUNKS_PER_JOB = 4 #more chunks than workers so a slow chunk doesn't leave the others idle
+
+
+#Results of running one chunk of the grid
+class ChunkResult:
+    shape_name: str
+    start: int #flat grid index of the first castle in the chunk
+    wave_hits: array #one entry per castle
+    causes: bytes #index into outcomes.CAUSES, one per castle
+    counts: outcomes.OutcomeCounts
+    stats: stats.SweepStats #of this chunk's castles, merged into the sweep's
+
+    #Constructor
+    def __init__(self, shape_name: str, start: int):
+        self.shape_name = shape_name
+        self.start = start
+        self.wave_hits = array("l")
+        self.causes = b""
+        self.counts = outcomes.OutcomeCounts()
+        self.stats = None
+
+    #works out the stats from the wave hits and causes
+    def add_stats(self, max_wave_hits: int):
+        self.stats = stats.from_castles(self.shape_name, self.wave_hits,
+                                        [outcomes.CAUSES[cause] for cause in self.causes], max_wave_hits)
+
+
+#Results of a whole sweep, per shape in grid order
+#with keep_castles=False only the counts and the streaming stats are kept, so a sweep of any
+# size fits in the same memory; wave_hits and causes stay empty
+class SweepResult:
+    wave_hits: dict #shape name -> array of wave_hits in sweep_points order
+    causes: dict #shape name -> bytearray of cause indices in sweep_points order
+    counts: outcomes.OutcomeCounts
+    stats: stats.SweepStats
+    settings: dict #castle_test.sweep_settings the sweep ran with, so its grid can be rebuilt later
+    keep_castles: bool
+    castles: dict #shape name -> castles added so far
+
+    #Constructor
+    def __init__(self, keep_castles: bool = True, max_wave_hits: int = None):
+        self.wave_hits = dict()
+        self.causes = dict()
+        self.counts = outcomes.OutcomeCounts()
+        self.stats = stats.SweepStats(max_wave_hits if max_wave_hits is not None else ct.MAX_WAVE_HITS)
+        self.settings = dict()
+        self.keep_castles = keep_castles
+        self.castles = dict()
+
+    #returns the shapes in the sweep
+    def shape_names(self) -> list:
+        return list(self.castles.keys())
+
+    #returns the average number of wave hits for a shape
+    def average_wave_hits(self, shape_name: str) -> float:
+        if not self.keep_castles:
+            return self.stats.average_wave_hits(shape_name)
+        hits = self.wave_hits[shape_name]
+        return sum(hits) / len(hits)
+
+    #adds a finished chunk; chunks of a shape have to come in grid order
+    def add_chunk(self, chunk: ChunkResult):
+        if chunk.shape_name not in self.castles:
+            self.castles[chunk.shape_name] = 0
+            if self.keep_castles:
+                self.wave_hits[chunk.shape_name] = array("l")
+                self.causes[chunk.shape_name] = bytearray()
+        if chunk.start != self.castles[chunk.shape_name]:
+            raise ValueError("Chunks have to be added in grid order")
+        self.castles[chunk.shape_name] += len(chunk.wave_hits)
+        if self.keep_castles:
+            self.wave_hits[chunk.shape_name].extend(chunk.wave_hits)
+            self.causes[chunk.shape_name].extend(chunk.causes)
+        self.counts.merge(chunk.counts)
+        if chunk.stats is None:
+            chunk.add_stats(self.stats.max_wave_hits)
+        self.stats.merge(chunk.stats)
+
+
+'''
+Grid numbering
+'''
+#returns how many castles are in the sweep grid of a shape
+def grid_size(shape_name: str) -> int:
+    waves_per_shape = (ct.INC - 1)**3
+    return len(ct.shape_steps(shape_name)) * waves_per_shape
+
+#returns the (i, h, d, dist) grid point at a flat index, same order as castle_test.sweep_points
+def grid_point(shape_name: str, index: int) -> tuple:
+    n = ct.INC - 1
+    (rest, dist) = divmod(index, n)
+    (rest, d) = divmod(rest, n)
+    (step, h) = divmod(rest, n)
+    return (ct.shape_steps(shape_name)[step], h + 1, d + 1, dist + 1)
+
+#Cuts the grids of the given shapes into (shape_name, start, stop) chunks of consecutive points
+def make_chunks(shape_names, chunk_size: int) -> list:
+    chunks = list()
+    for shape_name in shape_names:
+        size = grid_size(shape_name)
+        for start in range(0, size, chunk_size):
+            chunks.append((shape_name, start, min(start + chunk_size, size)))
+    return chunks
+
+
+'''
+Running chunks
+'''
+#Runs one chunk of the grid with the given engine
+#known is a list with the (wave_hits, cause) of every castle in the chunk that is already known
+# (from a result_cache.ResultCache) and None for the ones to simulate
+#this is what the worker processes run, so it only takes and returns picklable things
+def run_chunk(chunk: tuple, engine: str = "scalar", max_wave_hits: int = None, known: list = None) -> ChunkResult:
+    (shape_name, start, stop) = chunk
+    if max_wave_hits is None:
+        max_wave_hits = ct.MAX_WAVE_HITS
+    result = ChunkResult(shape_name, start)
+    points = [grid_point(shape_name, index) for index in range(start, stop)]
+    if known is None:
+        known = [None] * len(points)
+    todo = [k for k in range(len(points)) if known[k] is None]
+    simulated = dict()
+    if engine == "batch" and todo:
+        import batch
+        castles = [ct.build_shape(shape_name, points[k][0]) for k in todo]
+        waves = [ct.build_wave(*points[k][1:]) for k in todo]
+        castle_batch = batch.CastleBatch.from_castles(castles, waves)
+        batch.run_batch(castle_batch, max_wave_hits)
+        for (n, k) in enumerate(todo):
+            simulated[k] = (int(castle_batch.wave_hits[n]), outcomes.CAUSES[castle_batch.cause[n]])
+        castle_batch.add_to(result.counts)
+    elif todo:
+        for k in todo:
+            (i, h, d, dist) = points[k]
+            shape = ct.build_shape(shape_name, i)
+            w = ct.build_wave(h, d, dist)
+            if engine == "fast":
+                import fast_forward
+                simulated[k] = fast_forward.fast_forward(shape, w, max_wave_hits)
+                result.counts.add(shape_name, simulated[k][1])
+            elif engine == "scalar":
+                simulated[k] = ct.simulate_castle(shape, w, result.counts, max_wave_hits)
+            else:
+                raise ValueError("Unknown engine: " + str(engine))
+    causes = bytearray()
+    for k in range(len(points)):
+        if known[k] is None:
+            (wave_hits, cause) = simulated[k]
+        else:
+            (wave_hits, cause) = known[k]
+            result.counts.add(shape_name, cause)
+        result.wave_hits.append(wave_hits)
+        causes.append(outcomes.CAUSES.index(cause))
+    result.causes = bytes(causes)
+    result.add_stats(max_wave_hits)
+    return result
+
+#Looks up the castles of a chunk in a result_cache.ResultCache
+#returns (known, keys) for run_chunk and store_chunk
+def lookup_chunk(cache, chunk: tuple) -> tuple:
+    (shape_name, start, stop) = chunk
+    castles = list()
+    for index in range(start, stop):
+        (i, h, d, dist) = grid_point(shape_name, index)
+        castles.append((ct.build_shape(shape_name, i), ct.build_wave(h, d, dist)))
+    return cache.lookup(castles, ct.MAX_WAVE_HITS)
+
+#stores the castles of a finished chunk that weren't in the cache
+def store_chunk(cache, chunk_result: ChunkResult, known: list, keys: list):
+    missing = [k for k in range(len(known)) if known[k] is None]
+    if missing:
+        cache.store([keys[k] for k in missing],
+                     [(chunk_result.wave_hits[k], outcomes.CAUSES[chunk_result.causes[k]]) for k in missing])
+
+#sets up a worker process with the same knobs and constants as the parent (a scenario.Scenario
+# as a dict), so a sweep run under a scenario runs under it in every worker
+def _init_worker(values: dict):
+    import scenario
+    scenario.from_dict(values).apply()
+
+#Runs the sweep for the given shapes over jobs worker processes (jobs=1 runs in this process)
+#settings are castle_test.configure knobs (VOL, R, INC, MAX_WAVE_HITS) used for this sweep only
+#checkpoint is a directory to save every finished chunk to (see checkpoint.py); with resume the
+# chunks already saved there are loaded instead of run again
+#cache is a result_cache.ResultCache; castles found in it aren't simulated, and the ones that
+# are get added to it
+#keep_castles=False keeps only the counts and streaming stats of the castles (see SweepResult)
+#coordinator is a cluster.Coordinator; the chunks go to its workers instead of local processes
+#exporter is an export.CsvExporter or XlsxExporter; every chunk is written to it as soon as it is
+# added to the result, and the per-shape summaries once the sweep is done (the caller closes it)
+#returns a SweepResult with the same castles, counts, means and spreads for any number of jobs, with
+# or without resuming and on a coordinator; only the stats' quantiles depend on the chunk size
+def run_parallel_sweep(shape_names = None, jobs: int = None, engine: str = "scalar",
+                       chunk_size: int = None, settings: dict = None, checkpoint: str = None,
+                       resume: bool = False, cache = None, keep_castles: bool = True,
+                       coordinator = None, exporter = None) -> SweepResult:
+    if shape_names is None:
+        shape_names = ct.shape_list
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine: " + str(engine))
+    for shape_name in shape_names:
+        if shape_name not in ct.shape_list:
+            raise ValueError("Unknown shape: " + str(shape_name))
+    if resume and checkpoint is None:
+        raise ValueError("Can only resume a sweep with a checkpoint directory")
+    old_settings = ct.configure(**(settings or dict()))
+    try:
+        saved = None
+        if checkpoint is not None:
+            import checkpoint as checkpoints
+            saved = checkpoints.Checkpoint(checkpoint)
+            if chunk_size is None and resume and saved.saved_manifest() is not None:
+                #the chunks have to be numbered the same as last time, whatever jobs is now
+                chunk_size = saved.saved_manifest().get("chunk_size")
+        if chunk_size is None:
+            total = sum(grid_size(shape_name) for shape_name in shape_names)
+            chunk_size = max(1, total // (jobs * CHUNKS_PER_JOB))
+            if saved is not None:
+                chunk_size = min(chunk_size, checkpoints.CHUNK_SIZE)
+            if coordinator is not None:
+                import cluster
+                chunk_size = min(chunk_size, cluster.CHUNK_SIZE)
+        chunks = make_chunks(shape_names, chunk_size)
+        result = SweepResult(keep_castles)
+        result.settings = ct.sweep_settings()
+        finished = dict() #chunk number -> ChunkResult still waiting for the chunks before it
+        saved_numbers = set() #chunks already in the checkpoint
+        if cache is not None:
+            #the constants might have changed since the cache was opened (a scenario, for one)
+            cache.refresh_constants()
+        if saved is not None:
+            import scenario
+            saved.start({"scenario": scenario.current("checkpoint").to_dict(), "engine": engine,
+                         "shapes": list(shape_names), "chunk_size": chunk_size}, resume)
+            saved_numbers = set(saved.finished_numbers())
+        todo = [number for number in range(len(chunks)) if number not in saved_numbers]
+        added = [0] #next chunk to add to the result
+        #adds every chunk that is ready, in chunk order, so finished chunks don't pile up
+        def add_ready():
+            while added[0] < len(chunks):
+                number = added[0]
+                if number in saved_numbers:
+                    chunk_result = saved.load_chunk(number)
+                elif number in finished:
+                    chunk_result = finished.pop(number)
+                else:
+                    return
+                result.add_chunk(chunk_result)
+                if exporter is not None:
+                    exporter.add_chunk(chunk_result)
+                added[0] += 1
+        lookups = dict() #chunk number -> (known, keys) from the cache
+        #returns run_chunk's known list for a chunk, looking it up in the cache if there is one
+        def known_for(number: int):
+            if cache is None:
+                return None
+            lookups[number] = lookup_chunk(cache, chunks[number])
+            return lookups[number][0]
+        #saves a finished chunk to the checkpoint and the cache
+        def keep(number: int, chunk_result: ChunkResult):
+            finished[number] = chunk_result
+            if cache is not None:
+                (known, keys) = lookups.pop(number)
+                store_chunk(cache, chunk_result, known, keys)
+            if saved is not None:
+                saved.save(number, chunk_result)
+            add_ready()
+        if coordinator is not None:
+            for (number, chunk_result) in coordinator.run(chunks, todo, engine, known_for):
+                keep(number, chunk_result)
+        elif jobs == 1 or len(todo) <= 1:
+            for number in todo:
+                keep(number, run_chunk(chunks[number], engine, None, known_for(number)))
+        else:
+            #only pay for importing the pool when there is more than one worker
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            import scenario
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(scenario.current().to_dict(),)) as pool:
+                futures = {pool.submit(run_chunk, chunks[number], engine, None, known_for(number)): number
+                           for number in todo}
+                #save chunks as they finish, whichever worker gets there first
+                for future in as_completed(futures):
+                    number = futures[future]
+                    keep(number, future.result())
+        #chunks that were all in the checkpoint
+        add_ready()
+        if exporter is not None:
+            exporter.add_summary(result)
+        return result
+    finally:
+        ct.configure(**old_settings)
+
+#Library entry point for running a sweep without going through castle_test.py
+#Any knob left as None keeps the value at the top of castle_test.py
+#returns a SweepResult with per-castle wave_hits, failure causes and the outcome counts
+def run_sweep(shape_names = None, R: int = None, INC: int = None, VOL: float = None,
+              max_wave_hits: int = None, jobs: int = 1, engine: str = "scalar",
+              chunk_size: int = None, checkpoint: str = None, resume: bool = False, cache = None,
+              keep_castles: bool = True, coordinator = None, exporter = None) -> SweepResult:
+    if isinstance(shape_names, str):
+        shape_names = [shape_names]
+    settings = dict()
+    for (name, value) in (("R", R), ("INC", INC), ("VOL", VOL), ("MAX_WAVE_HITS", max_wave_hits)):
+        if value is not None:
+            settings[name] = value
+    return run_parallel_sweep(shape_names, jobs, engine, chunk_size, settings, checkpoint, resume, cache, keep_castles,
+                              coordinator, exporter)
@@ -0,0 +1,33 @@
+import numpy as np
+import castle_test as ct
+import sweep
+import batch
+
+#Checks that the batch engine gives the same castles as the scalar loop in castle_test.py
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+
+def test_batch_engine_matches_scalar():
+    scalar = castles_of(sweep.run_sweep(engine="scalar", **TINY))
+    assert castles_of(sweep.run_sweep(engine="batch", **TINY)) == scalar
+
+def test_batch_from_dims_matches_simulate_castle():
+    dims = [(0.3, 0.4), (0.25, 0.5), (0.2, 0.7)]
+    wave_values = [(0.05, 0.065, 4.0), (0.045, 0.06, 12.0), (0.055, 0.07, 19.0)]
+    castle_batch = batch.CastleBatch("cone", dims, *zip(*wave_values))
+    wave_hits = batch.run_batch(castle_batch)
+    for (k, (dim, values)) in enumerate(zip(dims, wave_values)):
+        (hits, cause) = ct.simulate_castle(ct.shapes.Cone(*dim), ct.waves.Wave(*values), ct.outcomes.OutcomeCounts())
+        assert (int(wave_hits[k]), castle_batch.cause_names()[k]) == (hits, cause)
+    assert np.all(castle_batch.cause != batch.STANDING)
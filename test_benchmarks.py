@@ -0,0 +1,55 @@
+import benchmarks
+
+#Checks the benchmark results, saving them and comparing them against a baseline
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+BASELINE = {"micro": {"cone.get_top_vol": {"ns_per_call": 100.0}, "cone.erode_shape": {"ns_per_call": 1000.0}},
+            "macro": {"sweep.scalar.cone.R6.INC4": {"castles_per_sec": 500.0, "ns_per_hit": 2000.0,
+                                                    "peak_bytes": 4096}}}
+
+
+#returns a copy of BASELINE with one metric changed
+def changed(section: str, name: str, metric: str, value: float) -> dict:
+    results = {s: {n: dict(m) for (n, m) in b.items()} for (s, b) in BASELINE.items()}
+    results[section][name][metric] = value
+    return results
+
+
+def test_compare_flags_only_worse_past_the_threshold():
+    assert benchmarks.compare(BASELINE, BASELINE) == []
+    #slower calls and fewer castles per second are worse, faster ones never are
+    assert benchmarks.compare(changed("micro", "cone.get_top_vol", "ns_per_call", 120.0), BASELINE) == []
+    assert benchmarks.compare(changed("micro", "cone.get_top_vol", "ns_per_call", 10.0), BASELINE) == []
+    assert benchmarks.compare(changed("macro", "sweep.scalar.cone.R6.INC4", "castles_per_sec", 5000.0),
+                              BASELINE) == []
+    assert benchmarks.compare(changed("micro", "cone.get_top_vol", "ns_per_call", 150.0), BASELINE) == \
+        [("cone.get_top_vol", "ns_per_call", 100.0, 150.0, 1.5)]
+    assert benchmarks.compare(changed("macro", "sweep.scalar.cone.R6.INC4", "castles_per_sec", 250.0),
+                              BASELINE) == [("sweep.scalar.cone.R6.INC4", "castles_per_sec", 500.0, 250.0, 2.0)]
+    #a tighter threshold catches the smaller change, new benchmarks have nothing to compare against
+    assert len(benchmarks.compare(changed("micro", "cone.get_top_vol", "ns_per_call", 120.0), BASELINE, 0.1)) == 1
+    assert benchmarks.compare({"micro": {"cube.get_top_vol": {"ns_per_call": 1e9}}}, BASELINE) == []
+
+def test_saved_results_load_and_report_the_same(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    benchmarks.save(BASELINE, path)
+    assert benchmarks.load(path) == BASELINE
+    assert benchmarks.report(benchmarks.load(path)) == [
+        "cone.erode_shape: 1000.0 ns/call", "cone.get_top_vol: 100.0 ns/call",
+        "sweep.scalar.cone.R6.INC4: 500.0 castles/sec | 2000.0 ns/hit | peak 4.0 KiB"]
+
+def test_micro_benchmarks_time_every_check(monkeypatch):
+    #one short timing each, the numbers don't matter here
+    monkeypatch.setattr(benchmarks, "REPEATS", 1)
+    monkeypatch.setattr(benchmarks, "MIN_TIME", 0.001)
+    results = benchmarks.micro_benchmarks(["cone", "cube"])
+    for shape_name in ("cone", "cube"):
+        for method_name in benchmarks.GEOMETRY_METHODS:
+            assert shape_name + "." + method_name in results
+            assert shape_name + "." + method_name + ".cold" in results
+        for check in ("erode_shape", "survives_wave_hit", "survives_erosion", "simulate_castle_hit"):
+            assert shape_name + "." + check in results
+    assert all(metrics["ns_per_call"] > 0 for metrics in results.values())
@@ -0,0 +1,63 @@
+import numpy as np
+import buoy_data
+
+#Checks the buoy parser and its sidecars on a small made-up buoy file
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+HEADER = "#YY  MM DD hh mm WDIR WSPD GST  WVHT   DPD   APD MWD   PRES  ATMP  WTMP  DEWP  VIS  TIDE"
+BUOY_ROW = "2019 01 01 00 00 999 99.0 99.0 1.20 12.00 7.50 999 9999.0 999.0 18.0 999.0 99.0 99.00"
+
+
+#returns the path of a buoy file in tmp_path with a row every half hour, wave heights 0.5, 0.6, ...
+def buoy_file(tmp_path, rows: int) -> str:
+    path = tmp_path / "test_station.txt"
+    lines = [HEADER]
+    for k in range(rows):
+        (hour, minute) = (str(k // 2).zfill(2), str(30 * (k % 2)).zfill(2))
+        lines.append(BUOY_ROW.replace("00 00", hour + " " + minute, 1).replace("1.20", format(0.5 + k / 10, ".2f")))
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+#returns the columns of a BuoyData as plain arrays
+def columns_of(data) -> dict:
+    return {name: np.asarray(data[name]) for name in buoy_data.COLUMNS}
+
+
+def test_parse_rows_skips_bad_tokens():
+    lines = [HEADER,
+             BUOY_ROW,
+             BUOY_ROW.replace("1.20", "MM"), #missing reading
+             BUOY_ROW.replace("12.00", "12.0x"), #garbled
+             BUOY_ROW.replace("2019", "MM"), #no timestamp
+             "2019 01 01 00", #cut short
+             ""]
+    (columns, skipped) = buoy_data.parse_rows(lines)
+    assert skipped == 3
+    assert len(columns["time"]) == 2
+    assert columns["WVHT"][0] == 1.2 and np.isnan(columns["WVHT"][1])
+
+def test_chunks_parse_the_same_as_the_whole_file(tmp_path):
+    path = buoy_file(tmp_path, 9)
+    whole = columns_of(buoy_data.parse_file(path, chunk_rows=1000))
+    assert list(whole["WVHT"]) == [round(0.5 + k / 10, 2) for k in range(9)]
+    assert np.all(np.diff(whole["time"]) == 1800)
+    chunked = columns_of(buoy_data.parse_file(path, chunk_rows=2))
+    for name in buoy_data.COLUMNS:
+        np.testing.assert_array_equal(chunked[name], whole[name])
+
+def test_sidecar_matches_the_text_and_follows_appends(tmp_path):
+    path = buoy_file(tmp_path, 6)
+    parsed = columns_of(buoy_data.load(path, use_sidecar=False))
+    first = buoy_data.load(path)
+    assert buoy_data.sidecar_is_valid(path)
+    for name in buoy_data.COLUMNS:
+        np.testing.assert_array_equal(np.asarray(first[name]), parsed[name])
+    #a file that grew is parsed again instead of read from the old sidecar
+    with open(path, "a") as f:
+        f.write(BUOY_ROW.replace("01 01 00", "01 01 05") + "\n")
+    assert not buoy_data.sidecar_is_valid(path)
+    grown = buoy_data.load(path)
+    assert len(grown) == 7 and grown["WVHT"][-1] == 1.2
@@ -0,0 +1,113 @@
+import os
+import random
+import numpy as np
+import pytest
+import buoy_data
+import buoy_index
+
+#Checks that the buoy index's bucketed summaries match summing up the rows of the range
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+STATIONS = {"scripps_east_florida": 1, "scripps_north_east_florida": 2, "scripps_south_california": 3} #name -> seed
+FIRST_TIME = 1544572800 #2018-12-12, so the readings cross a year and a few months
+READINGS = 3600 #one every STEP
+STEP = 3 * 60 * 60 #seconds
+QUERIES = 40 #random ranges per check
+BUOY_ROW = "{} 999 99.0 99.0 {} {} {} 999 9999.0 999.0 18.0 999.0 99.0 99.00"
+
+
+#writes a made-up buoy file for every station into directory, with a few missing readings
+def write_stations(directory: str):
+    for (station, seed) in STATIONS.items():
+        rng = random.Random(seed)
+        lines = ["#YY  MM DD hh mm WDIR WSPD GST  WVHT   DPD   APD MWD   PRES  ATMP  WTMP  DEWP  VIS  TIDE"]
+        for k in range(READINGS):
+            when = np.datetime64(FIRST_TIME + k * STEP, "s").item()
+            wvht = "MM" if rng.random() < 0.05 else format(rng.uniform(0.2, 3.5), ".2f")
+            lines.append(BUOY_ROW.format(when.strftime("%Y %m %d %H %M"), wvht, format(rng.uniform(4, 20), ".2f"),
+                                         format(rng.uniform(3, 12), ".2f")))
+        with open(os.path.join(directory, station + ".txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+#returns {station: BuoyData} straight from the text files, without the sidecars
+def parsed(directory: str) -> dict:
+    return {station: buoy_data.parse_file(os.path.join(directory, station + ".txt")) for station in STATIONS}
+
+#returns the readings of a field at stations in [start, end)
+def readings(rows: dict, stations: list, field: str, start: float, end: float) -> np.ndarray:
+    values = list()
+    for station in stations:
+        times = np.asarray(rows[station]["time"])
+        values.append(np.asarray(rows[station][field])[(times >= start) & (times < end)])
+    return np.concatenate(values)
+
+#returns the Summary of the readings of stations in [start, end), added up in one go
+def from_rows(rows: dict, stations: list, field: str, start: float, end: float):
+    summary = buoy_index.Summary(field)
+    summary.add_values(readings(rows, stations, field, start, end))
+    return summary
+
+#asserts two summaries are the same, up to float rounding in the sums
+def assert_same(got, expected):
+    assert (got.count, got.minimum, got.maximum) == (expected.count, expected.minimum, expected.maximum)
+    assert got.histogram.tolist() == expected.histogram.tolist()
+    assert got.total == pytest.approx(expected.total, rel=1e-9)
+    assert got.squares == pytest.approx(expected.squares, rel=1e-9)
+
+
+def test_range_summaries_match_the_rows(tmp_path):
+    directory = str(tmp_path)
+    write_stations(directory)
+    index = buoy_index.BuoyIndex(directory)
+    assert sorted(index.rebuilt) == sorted(STATIONS)
+    rows = parsed(directory)
+    rng = random.Random(5)
+    last_time = FIRST_TIME + READINGS * STEP
+    for k in range(QUERIES):
+        (start, end) = sorted(rng.uniform(FIRST_TIME - STEP, last_time + STEP) for j in range(2))
+        #whole days too, so the ranges line up with the stored buckets
+        if k % 2 == 0:
+            (start, end) = (buoy_index.bucket_start("day", int(start // 86400)),
+                            buoy_index.bucket_start("day", int(end // 86400)))
+        field = buoy_index.FIELDS[k % len(buoy_index.FIELDS)]
+        stations = ["scripps_south_california"] if k % 3 == 0 else list(STATIONS)
+        assert_same(index.summary(stations, field, start, end), from_rows(rows, stations, field, start, end))
+    #no range is the whole file, and "florida" is both Florida stations
+    assert_same(index.summary("florida", "WVHT"),
+                from_rows(rows, ["scripps_east_florida", "scripps_north_east_florida"], "WVHT", 0, 2 * last_time))
+
+def test_breakdown_adds_up_to_the_range(tmp_path):
+    directory = str(tmp_path)
+    write_stations(directory)
+    index = buoy_index.BuoyIndex(directory)
+    (start, end) = (FIRST_TIME + 5000, FIRST_TIME + 90 * 86400)
+    whole = index.summary("california", "DPD", start, end)
+    months = index.breakdown("california", "DPD", "month", start, end)
+    assert len(months) == 4 #December to March
+    added = buoy_index.Summary("DPD")
+    for (first, summary) in months:
+        added.merge(summary)
+    assert_same(added, whole)
+    #quantiles come from the histogram, so they are good to a bin width
+    values = readings(parsed(directory), ["scripps_south_california"], "DPD", start, end)
+    (low, high, bins) = buoy_index.BINS["DPD"]
+    for q in [0.1, 0.5, 0.9]:
+        assert whole.quantile(q) == pytest.approx(float(np.quantile(values, q)), abs=(high - low) / bins)
+
+def test_changed_station_is_rebuilt(tmp_path):
+    directory = str(tmp_path)
+    write_stations(directory)
+    buoy_index.BuoyIndex(directory)
+    assert buoy_index.BuoyIndex(directory).rebuilt == []
+    path = os.path.join(directory, "scripps_east_florida.txt")
+    with open(path, "r") as f:
+        lines = f.read().split("\n")
+    with open(path, "w") as f:
+        f.write("\n".join(lines[:1000]) + "\n")
+    index = buoy_index.BuoyIndex(directory)
+    assert index.rebuilt == ["scripps_east_florida"]
+    assert_same(index.summary("scripps_east_florida", "WVHT"),
+                from_rows(parsed(directory), ["scripps_east_florida"], "WVHT", 0, 2 * FIRST_TIME))
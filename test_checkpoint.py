@@ -0,0 +1,45 @@
+import os
+import pytest
+import sweep
+
+#Checks that a resumed checkpoint gives the same sweep as an uninterrupted one
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+#runs the tiny sweep with the given sweep.run_sweep options
+def tiny_sweep(**options):
+    return sweep.run_sweep(R=TINY["R"], INC=TINY["INC"], **options)
+
+
+def test_resumed_checkpoint_matches(tmp_path):
+    whole = castles_of(tiny_sweep(engine="fast", chunk_size=20))
+    directory = str(tmp_path / "sweep.ckpt")
+    first = tiny_sweep(engine="fast", chunk_size=20, checkpoint=directory)
+    assert castles_of(first) == whole
+    #lose every other chunk, as if the sweep had been stopped part way through
+    chunks = sorted(name for name in os.listdir(directory) if name.startswith("chunk-"))
+    for name in chunks[::2]:
+        os.remove(os.path.join(directory, name))
+    resumed = tiny_sweep(engine="fast", checkpoint=directory, resume=True)
+    assert castles_of(resumed) == whole
+    assert str(resumed.counts) == str(first.counts)
+
+def test_checkpoint_of_another_sweep_is_refused(tmp_path):
+    directory = str(tmp_path / "sweep.ckpt")
+    tiny_sweep(shape_names="cone", engine="fast", chunk_size=20, checkpoint=directory)
+    with pytest.raises(ValueError, match="already exists"):
+        tiny_sweep(shape_names="cone", engine="fast", chunk_size=20, checkpoint=directory)
+    with pytest.raises(ValueError, match="different sweep"):
+        tiny_sweep(shape_names="cone", engine="scalar", chunk_size=20, checkpoint=directory, resume=True)
+    with pytest.raises(ValueError, match="checkpoint directory"):
+        tiny_sweep(shape_names="cone", resume=True)
@@ -0,0 +1,82 @@
+import socket
+import threading
+import pytest
+import sweep
+import cluster
+
+#Checks that a sweep run on cluster workers matches a local one, even when a worker dies mid-chunk
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+TOKEN = "sand"
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+#Connects to the coordinator like a worker, takes a chunk and drops the connection without
+# sending it back, as if the worker had been killed; sets leased once it has
+def doomed_worker(address: tuple, leased: threading.Event):
+    sock = cluster.connect(*address)
+    try:
+        cluster.send_message(sock, {"type": "hello", "name": "doomed", "token": TOKEN})
+        assert cluster.recv_message(sock)[0]["type"] == "welcome"
+        while True:
+            cluster.send_message(sock, {"type": "lease"})
+            if cluster.recv_message(sock)[0]["type"] == "chunk":
+                break
+    finally:
+        sock.close()
+        leased.set()
+
+#runs a worker once the doomed one has taken its chunk
+def late_worker(address: tuple, leased: threading.Event, ran: list):
+    leased.wait()
+    ran.append(cluster.run_worker(address[0], address[1], TOKEN, "late"))
+
+
+def test_cluster_sweep_with_a_killed_worker_matches_a_local_one():
+    local = sweep.run_sweep(engine="fast", chunk_size=20, **TINY)
+    coordinator = cluster.Coordinator(port=0, token=TOKEN)
+    leased = threading.Event()
+    ran = list()
+    threads = [threading.Thread(target=doomed_worker, args=(coordinator.address, leased)),
+               threading.Thread(target=late_worker, args=(coordinator.address, leased, ran))]
+    for thread in threads:
+        thread.start()
+    try:
+        clustered = sweep.run_sweep(engine="fast", chunk_size=20, coordinator=coordinator, **TINY)
+    finally:
+        coordinator.close()
+        for thread in threads:
+            thread.join()
+    assert castles_of(clustered) == castles_of(local)
+    assert str(clustered.counts) == str(local.counts)
+    for shape_name in local.shape_names():
+        assert clustered.average_wave_hits(shape_name) == pytest.approx(local.average_wave_hits(shape_name))
+    #the dropped chunk went back in the queue and the other worker ran every chunk
+    assert coordinator.released == 1
+    assert ran == [sum((castles + 19) // 20 for castles in local.castles.values())]
+
+def test_worker_with_the_wrong_token_is_refused():
+    coordinator = cluster.Coordinator(port=0, token=TOKEN)
+    try:
+        with pytest.raises(ValueError, match="bad token"):
+            cluster.run_worker(coordinator.address[0], coordinator.address[1], "beach", "stranger")
+    finally:
+        coordinator.close()
+
+def test_chunk_results_survive_the_wire():
+    chunk_result = sweep.run_chunk(("cone", 10, 30), "fast", None, None)
+    (header, payload) = cluster.encode_result(chunk_result)
+    decoded = cluster.decode_result(header, payload)
+    assert (decoded.shape_name, decoded.start, list(decoded.wave_hits), decoded.causes) == \
+        (chunk_result.shape_name, chunk_result.start, list(chunk_result.wave_hits), chunk_result.causes)
+    assert str(decoded.counts) == str(chunk_result.counts)
+    with pytest.raises(ValueError):
+        cluster.decode_result(header, payload[:-1])
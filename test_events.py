@@ -0,0 +1,103 @@
+import copy
+import random
+import castle_test as ct
+import wave as waves
+import events
+
+#Checks the event simulation against stepping through every wave one at a time
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+SEEDS = range(12) #one castle, wave train, tide and rain per seed
+RUNS = 8 #runs of identical waves per train
+START = 1000000.0 #seconds | time of the first wave
+TIDE_AMPLITUDE = 0.4 #meters | enough to keep the short waves off the castle at low tide
+TIDE_STEP = 30 #seconds | the tides are minutes long, so the castles see a few before they fall
+STORMS_PER_DAY = 24.0
+STORM_RAIN = 400.0 #extra rain of a burst, so some castles fall to the rain
+
+
+#returns (castle, runs, tides, rain bursts) of a seed; runs follow on from each other like buoy_runs
+def beach(seed: int) -> tuple:
+    rng = random.Random(seed)
+    shape_name = rng.choice(ct.shape_list)
+    castle = ct.build_shape(shape_name, rng.choice(ct.shape_steps(shape_name)))
+    runs = list()
+    t = START
+    for k in range(RUNS):
+        count = rng.randint(20, 400)
+        w = waves.Wave(ct.AVG_WAVE_HEIGHT * rng.uniform(0.6, 1.4), ct.AVG_BREAK_DEPTH, rng.uniform(1.0, 8.0))
+        runs.append((t, w, count))
+        t = t + count * ct.TIME_PER_WAVE
+    #half a tide early, so the castle starts at falling water
+    period = rng.uniform(5, 20) * 60
+    tides = list(events.synthetic_tides(START - period / 2, t, TIDE_AMPLITUDE, period, TIDE_STEP))
+    bursts = events.random_bursts(START, t, STORMS_PER_DAY, STORM_RAIN, seed)
+    return (castle, runs, tides, bursts)
+
+#Steps the castle through every wave, applying the tide and rain events due at or before it
+#returns (wave_hits, cause, timestamp) like EventSimulation.run
+def brute_force(shape, runs: list, tides: list, bursts: list) -> tuple:
+    changes = sorted([(t, 0, level) for (t, level) in tides] + [(t, 1, extra) for (t, extra) in events.rain_bursts(bursts)])
+    (saturation, wave_hits, shift, extra_rain) = (ct.INITIAL_SATURATION, 0, 0.0, list())
+    last_time = None
+    for (start, w, count) in runs:
+        for k in range(count):
+            t = start + k * ct.TIME_PER_WAVE
+            while changes and changes[0][0] <= t:
+                (when, kind, value) = changes.pop(0)
+                if kind == 0:
+                    shift = value / events.BEACH_SLOPE
+                elif value > 0:
+                    extra_rain.append(value)
+                else:
+                    extra_rain.remove(-value)
+            shape.set_base_height(w.wave_height)
+            rain = ct.rain_on_shape(shape) * (1.0 + sum(extra_rain))
+            distance = w.wave_distance_past_castle + shift
+            if distance <= 0:
+                #the wave doesn't get to the castle, only its rain does
+                if saturation > ct.OVERSATURATED:
+                    return (wave_hits, "rain", t)
+                saturation = saturation + rain
+            else:
+                hit = waves.Wave(w.wave_height, w.break_depth, distance)
+                if shape.base_radius <= 0:
+                    return (wave_hits, "erosion", t)
+                if not ct.survives_wave_hit(shape, hit):
+                    return (wave_hits, "knockout", t)
+                if not ct.survives_erosion(shape):
+                    return (wave_hits, "erosion", t)
+                if saturation > ct.OVERSATURATED:
+                    return (wave_hits, "rain", t)
+                saturation = saturation + rain
+                wave_hits += 1
+                ct.erode_shape(shape, hit)
+            last_time = t + ct.TIME_PER_WAVE
+    if wave_hits > 0 and shape.base_radius <= 0:
+        return (wave_hits, "erosion", last_time)
+    return (wave_hits, "did_not_fall", None)
+
+
+def test_events_match_stepping_every_wave():
+    causes = set()
+    skipped = 0
+    for seed in SEEDS:
+        (castle, runs, tides, bursts) = beach(seed)
+        expected = brute_force(copy.copy(castle), runs, tides, bursts)
+        simulation = events.EventSimulation(castle, iter(runs), iter(tides), events.rain_bursts(bursts))
+        assert simulation.run(ct.outcomes.OutcomeCounts()) == expected, "seed " + str(seed)
+        causes.add(expected[1])
+        skipped = skipped + simulation.waves_skipped
+    assert causes == {"knockout", "erosion", "rain"}
+    assert skipped > 0 #some waves were kept off the castle by the tide
+
+def test_without_tides_or_rain_every_wave_reaches_the_castle():
+    (castle, runs, tides, bursts) = beach(0)
+    expected = brute_force(copy.copy(castle), runs, [], [])
+    simulation = events.EventSimulation(castle, iter(runs))
+    assert simulation.run(ct.outcomes.OutcomeCounts()) == expected
+    assert simulation.waves_skipped == 0
+    assert simulation.scheduler.processed["tide"] == simulation.scheduler.processed["rain"] == 0
@@ -0,0 +1,77 @@
+import csv
+import numpy as np
+import pytest
+import outcomes
+import sweep
+import results_store
+import export
+
+#Checks that the exported castles read back as the same rows as the results store's
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 4, "INC": 5} #sweep settings small enough to export in a moment
+
+
+#runs the tiny sweep exporting to path and returns its SweepResult
+def exported_sweep(path: str, **options):
+    exporter = export.open_exporter(path)
+    try:
+        return sweep.run_sweep(engine="fast", chunk_size=7, exporter=exporter, **TINY, **options)
+    finally:
+        exporter.close()
+
+#returns the rows of a CSV file, the header first
+def read_csv(path: str) -> list:
+    with open(path, "r", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_round_trips_against_the_results_store(tmp_path):
+    path = str(tmp_path / "castles.csv")
+    result = exported_sweep(path)
+    rows = read_csv(path)
+    assert rows[0] == export.CASTLE_COLUMNS
+    runs = [results_store.columns_from_records(run) for run in results_store.records_from_sweep(result)]
+    columns = {name: np.concatenate([run[name] for run in runs]) for name in results_store.COLUMNS}
+    assert len(rows) - 1 == len(columns["wave_hits"])
+    read = dict(zip(export.CASTLE_COLUMNS, zip(*rows[1:])))
+    assert [outcomes.SHAPES.index(name) for name in read["shape"]] == columns["shape"].tolist()
+    assert [outcomes.CAUSES.index(name) for name in read["cause"]] == columns["cause"].tolist()
+    assert [int(value) for value in read["wave_hits"]] == columns["wave_hits"].tolist()
+    #every float comes back exactly
+    for name in ["dim_a", "dim_b", "height", "wave_height", "break_depth", "wave_distance"]:
+        assert [float(value) for value in read[name]] == columns[name].tolist()
+
+def test_csv_text_is_what_csv_writer_writes(tmp_path):
+    chunk = sweep.run_chunk(("pyramid", 3, 40), "fast")
+    path = str(tmp_path / "writer.csv")
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(export.castle_rows(chunk))
+    with open(path, "r", newline="") as f:
+        assert export.castle_text(chunk) == f.read()
+    assert export.castle_text(sweep.ChunkResult("cone", 0)) == ""
+
+def test_summary_and_stats_only_export(tmp_path):
+    result = exported_sweep(str(tmp_path / "castles.csv"))
+    stats_only = exported_sweep(str(tmp_path / "stats.csv"), keep_castles=False)
+    assert read_csv(str(tmp_path / "stats.csv")) == read_csv(str(tmp_path / "castles.csv"))
+    summary = read_csv(str(tmp_path / "castles_summary.csv"))
+    assert summary[0] == export.SUMMARY_COLUMNS
+    #without the castles the average is the running mean, good to rounding
+    stats_summary = read_csv(str(tmp_path / "stats_summary.csv"))
+    assert len(stats_summary) == len(summary) == len(result.shape_names()) + 1
+    for (row, stats_row) in zip(summary[1:], stats_summary[1:]):
+        assert row[:2] + row[3:] == stats_row[:2] + stats_row[3:]
+        assert float(stats_row[2]) == pytest.approx(float(row[2]), rel=1e-12)
+    for row in summary[1:]:
+        shape_name = row[0]
+        assert int(row[1]) == result.castles[shape_name] == stats_only.castles[shape_name]
+        assert float(row[2]) == result.average_wave_hits(shape_name)
+        causes = dict(zip(outcomes.CAUSES, row[-len(outcomes.CAUSES):]))
+        assert {cause: int(n) for (cause, n) in causes.items()} == \
+            {cause: result.counts.counts[cause][shape_name] for cause in outcomes.CAUSES}
+    with pytest.raises(ValueError):
+        export.open_exporter(str(tmp_path / "castles.json"))
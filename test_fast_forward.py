@@ -0,0 +1,43 @@
+import castle_test as ct
+import sweep
+import fast_forward
+
+#Checks that fast-forwarding gives the same castles as stepping every hit
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+
+def test_repeat_add_matches_a_loop():
+    for (x, step, n) in [(0.06, 1.3e-7, 5000), (0.5, -3.7e-5, 20000), (1.0 - 2**-40, 2**-45, 300), (0.0, 1e-9, 10)]:
+        expected = x
+        for _ in range(n):
+            expected = expected + step
+        assert fast_forward.repeat_add(x, step, n) == expected
+
+def test_first_crossing_is_the_first_hit_above():
+    (x, step, threshold) = (0.06, 1.7e-5, 0.15)
+    j = fast_forward.first_crossing(x, step, threshold, 100000)
+    assert fast_forward.repeat_add(x, step, j) > threshold >= fast_forward.repeat_add(x, step, j - 1)
+    assert fast_forward.first_crossing(x, step, threshold, j - 1) is None
+
+def test_fast_forward_is_exact():
+    old_settings = ct.configure(**TINY)
+    try:
+        for shape_name in ct.shape_list:
+            assert fast_forward.verify(shape_name) == []
+    finally:
+        ct.configure(**old_settings)
+
+def test_fast_engine_matches_scalar():
+    scalar = castles_of(sweep.run_sweep(engine="scalar", **TINY))
+    assert castles_of(sweep.run_sweep(engine="fast", **TINY)) == scalar
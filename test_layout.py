@@ -0,0 +1,55 @@
+import random
+import castle_test as ct
+import wave as waves
+import layout
+
+#Checks that every castle of a layout ends up like simulate_wave_train with the waves that reach it
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+SEED = 3
+CASTLES = 40
+WAVES = 150
+HEIGHTS = [0.8, 1.0, 1.3] #wave heights, as multiples of AVG_WAVE_HEIGHT
+
+
+#returns a train of waves of a few heights with run-ups over the sweep's distances
+def wave_list(seed: int) -> list:
+    rng = random.Random(seed)
+    return [waves.Wave(ct.AVG_WAVE_HEIGHT * rng.choice(HEIGHTS), ct.AVG_BREAK_DEPTH,
+                       rng.uniform(ct.START_DISTANCE, ct.END_DISTANCE)) for k in range(WAVES)]
+
+#returns simulate_wave_train's (wave hits, cause) for a castle at y hit by the given waves, each
+# one's run-up past y becoming its distance
+def reference(shape, y: float, train: list) -> tuple:
+    reaching = [(k, waves.Wave(w.wave_height, w.break_depth, w.wave_distance_past_castle - y))
+                for (k, w) in enumerate(train) if w.wave_distance_past_castle > y]
+    (wave_hits, cause, timestamp) = ct.simulate_wave_train(shape, reaching, ct.outcomes.OutcomeCounts())
+    return (wave_hits, cause)
+
+
+def test_layout_without_shelter_matches_simulate_wave_train():
+    train = wave_list(SEED)
+    beach = layout.random_layout(CASTLES, seed=SEED, shelter=False)
+    beach.run(train)
+    again = layout.random_layout(CASTLES, seed=SEED, shelter=False) #untouched castles for the reference
+    expected = [reference(again.castles[k], again.y[k], train) for k in range(CASTLES)]
+    assert list(zip(beach.wave_hits().tolist(), beach.cause_names())) == expected
+    assert len({cause for (wave_hits, cause) in expected}) > 1
+    assert not beach.standing.any()
+
+def test_sheltered_castle_only_sees_the_waves_after_its_shelter_falls():
+    castles = [ct.build_shape("cube", ct.shape_steps("cube")[0]), ct.shape_with_height("cone", 0.45)]
+    (x, y) = ([5.0, 5.0], [ct.START_DISTANCE, ct.START_DISTANCE + layout.SHELTER_DISTANCE / 2])
+    beach = layout.Layout(castles, x, y)
+    assert (beach.shelter_front.tolist(), beach.shelter_behind.tolist()) == ([0], [1])
+    train = wave_list(SEED + 1)
+    beach.run(train)
+    fell_at = int(beach.fell_at[0])
+    assert fell_at >= 0
+    #the wave that knocks the front castle over still breaks on it
+    behind = reference(ct.shape_with_height("cone", 0.45), y[1], train[fell_at + 1:])
+    assert (int(beach.wave_hits()[1]), beach.cause_names()[1]) == behind
+    assert behind[0] > 0
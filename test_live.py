@@ -0,0 +1,76 @@
+import os
+import math
+import castle_test as ct
+import buoy_data
+import wave_train
+import live
+
+#Checks that following a growing buoy file predicts the same as evaluating the file read so far
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+HEADER = "#YY  MM DD hh mm WDIR WSPD GST  WVHT   DPD   APD MWD   PRES  ATMP  WTMP  DEWP  VIS  TIDE"
+BUOY_ROW = "2019 01 01 00 00 999 99.0 99.0 1.20 12.00 7.50 999 9999.0 999.0 18.0 999.0 99.0 99.00"
+ROWS = 40 #half-hourly readings
+MISSING_ROWS = [7, 8, 39] #rows with no wave height
+SCALE = 0.02 #small waves, so castles last through many readings and fall every way
+HEIGHTS = [0.35, 0.5, 0.7] #castle heights
+
+
+#returns the text of buoy row k: a reading every half hour with wave heights going up and down
+def buoy_row(k: int) -> str:
+    (day, hour, minute) = (str(1 + k // 48).zfill(2), str(k % 48 // 2).zfill(2), str(30 * (k % 2)).zfill(2))
+    height = "MM" if k in MISSING_ROWS else format(1.0 + math.sin(k / 3), ".2f")
+    return BUOY_ROW.replace("01 00 00", day + " " + hour + " " + minute, 1).replace("1.20", height)
+
+#returns the castles to follow
+def castles() -> list:
+    return [ct.shape_with_height(shape_name, height) for shape_name in ct.shape_list for height in HEIGHTS]
+
+#returns what evaluating the complete rows of a file from scratch predicts for every castle
+def evaluated(path: str) -> list:
+    with open(path, "r") as f:
+        lines = f.read().split("\n")[:-1] #the text after the last newline isn't a row yet
+    (columns, skipped) = buoy_data.parse_rows(lines)
+    data = buoy_data.BuoyData(path, columns)
+    return wave_train.evaluate_designs(castles(), data, ct.outcomes.OutcomeCounts(), scale=SCALE,
+                                       start=float(data["time"][0]))
+
+
+def test_tail_only_hands_back_complete_lines(tmp_path):
+    path = str(tmp_path / "test_station.txt")
+    with open(path, "w") as f:
+        f.write(HEADER + "\n" + buoy_row(0) + "\n" + buoy_row(1)[:20])
+    tail = live.Tail(path)
+    assert tail.poll() == ([HEADER, buoy_row(0)], False)
+    assert tail.poll() == ([], False)
+    with open(path, "a") as f:
+        f.write(buoy_row(1)[20:] + "\n")
+    assert tail.poll() == ([buoy_row(1)], False)
+    #a file that got shorter is read again from the start
+    with open(path, "w") as f:
+        f.write(HEADER + "\n")
+    assert tail.poll() == ([HEADER], True)
+
+def test_follower_matches_evaluating_the_file_so_far(tmp_path):
+    path = str(tmp_path / "test_station.txt")
+    with open(path, "w") as f:
+        f.write(HEADER + "\n")
+    follower = live.Follower(path, castles(), scale=SCALE, from_start=True)
+    text = "".join(buoy_row(k) + "\n" for k in range(ROWS))
+    #rows come in a few at a time, often cut off part way through a line
+    cuts = [0, 150, 300, 301, 900, 1500, 1530, 2200, len(text) - 10, len(text)]
+    outcomes_seen = set()
+    for (start, stop) in zip(cuts, cuts[1:]):
+        with open(path, "a") as f:
+            f.write(text[start:stop])
+        follower.poll()
+        expected = evaluated(path)
+        assert [castle.outcome for castle in follower.castles] == expected, "after " + str(stop) + " bytes"
+        outcomes_seen.update(cause for (wave_hits, cause, timestamp) in expected)
+    assert outcomes_seen == {"did_not_fall", "erosion", "knockout", "rain"}
+    #castles that fell before the latest reading weren't looked at again
+    assert follower.reevaluated < len(follower.castles) * follower.updates
+    assert follower.rows == ROWS and os.path.getsize(path) == follower.tail.offset
@@ -0,0 +1,54 @@
+import castle_test as ct
+import optimize
+
+#Checks the height bounds and the two searches of the shape optimizer
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+PEAK = 0.37 #height with the best made-up score
+
+
+#Made-up evaluator whose expected wave hits peak at PEAK, counting how often it is asked
+class PeakEvaluator:
+    calls: int
+
+    #Constructor
+    def __init__(self):
+        self.calls = 0
+
+    def expected_wave_hits(self, height: float, distribution) -> float:
+        self.calls += 1
+        return 100 - (height - PEAK)**2
+
+
+def test_height_bounds_keep_the_radius_in_bounds():
+    for shape_name in ("cylinder", "pyramid", "cone"):
+        (low, high) = optimize.height_bounds(shape_name)
+        assert ct.MIN_CASTLE_HEIGHT <= low < high <= ct.MAX_CASTLE_HEIGHT
+        for height in (low, high):
+            radius = optimize.radius_for_height(shape_name, height)
+            assert ct.MIN_CASTLE_RADIUS - 1e-12 <= radius <= ct.MAX_CASTLE_RADIUS + 1e-12
+            assert abs(optimize.height_for_radius(shape_name, radius) - height) < 1e-9
+
+def test_searches_find_the_peak():
+    distribution = optimize.sampled_waves(8, seed=1)
+    (height, score) = optimize.golden_section(PeakEvaluator(), distribution, 0.1, 1.0)
+    assert abs(height - PEAK) <= optimize.HEIGHT_TOLERANCE
+    evaluator = PeakEvaluator()
+    (height, score) = optimize.successive_halving(evaluator, distribution, 0.1, 1.0, candidates=32)
+    spacing = 0.9 / 31
+    assert abs(height - PEAK) <= spacing / 2 + 1e-12
+    assert evaluator.calls == 32 + 16 + 8 + 4 + 2 + 1
+
+def test_design_scores_match_a_fresh_evaluator():
+    distribution = optimize.sampled_waves(12, seed=2)
+    for method in optimize.METHODS:
+        design = optimize.optimize_shape("cone", method, distribution)
+        (low, high) = optimize.height_bounds("cone")
+        assert low <= design.height <= high
+        assert design.evaluations > 0
+        assert optimize.Evaluator("cone").expected_wave_hits(design.height, distribution) == design.expected_wave_hits
+        #the scalar engine scores the same
+        assert optimize.Evaluator("cone", "scalar").expected_wave_hits(design.height, distribution) == design.expected_wave_hits
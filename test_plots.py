@@ -0,0 +1,28 @@
+import numpy as np
+import sweep
+import results_store
+import plots
+
+#Checks the binning of results stores for the heatmaps
+
+
+#returns a results store in tmp_path holding one cube sweep per INC, in that order
+def cube_store(tmp_path, incs: list):
+    store = results_store.ResultsStore(str(tmp_path / "store"))
+    for inc in incs:
+        store.append_sweep(sweep.run_sweep(["cube"], R=2, INC=inc, engine="fast"))
+    return store
+
+def test_sweep_gets_one_bin_per_value(tmp_path):
+    grid = plots.bin_store(cube_store(tmp_path, [9]), bands=8)["cube"]
+    assert grid.hits.shape == (1, 8, 8)
+    assert np.all(grid.counts() == 8) #the 8 break depths of every (height, wave height, distance)
+
+def test_mixed_grids_use_every_shard(tmp_path):
+    #a one-castle sweep first used to set the bins for the whole store
+    grid = plots.bin_store(cube_store(tmp_path, [2, 12]))["cube"]
+    assert grid.rows == 1 + 11**3
+    assert grid.hits.shape[1] >= 11 and grid.hits.shape[2] == plots.DISTANCE_BANDS
+    counts = grid.counts()
+    assert counts.sum() == grid.rows
+    assert np.count_nonzero(counts) >= 11 * plots.DISTANCE_BANDS
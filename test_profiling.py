@@ -0,0 +1,64 @@
+import castle_test as ct
+import fast_forward
+import sweep
+import profiling
+
+#Checks that profiling counts the castle loop without changing it, and takes its wrappers back off
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+SHAPES = ["cone", "cube"] #two shapes are enough to keep their histograms apart
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+#returns every function profiling wraps, as it is right now
+def profiled_functions() -> list:
+    functions = [getattr(owner, attribute) for targets in profiling.PHASES.values() for (owner, attribute) in targets]
+    return functions + [ct.simulate_castle, fast_forward.fast_forward]
+
+
+def test_disable_puts_the_originals_back():
+    originals = profiled_functions()
+    profiler = profiling.enable()
+    try:
+        assert all(wrapped is not original for (wrapped, original) in zip(profiled_functions(), originals))
+        assert [function.__wrapped__ for function in profiled_functions()] == originals
+    finally:
+        profiler.disable()
+    assert all(function is original for (function, original) in zip(profiled_functions(), originals))
+    profiler.disable() #a second disable does nothing
+
+def test_profiled_sweep_matches_and_counts_every_castle():
+    for engine in ("scalar", "fast"):
+        plain = sweep.run_sweep(SHAPES, engine=engine, **TINY)
+        profiler = profiling.enable()
+        try:
+            profiled = sweep.run_sweep(SHAPES, engine=engine, **TINY)
+        finally:
+            profiler.disable()
+        assert castles_of(profiled) == castles_of(plain)
+        assert str(profiled.counts) == str(plain.counts)
+        #every castle went through the castle timer and landed in its shape's histogram
+        assert profiler.timers[profiling.CASTLE_TIMER][0] == sum(plain.castles.values())
+        for shape_name in plain.shape_names():
+            assert sum(profiler.bucketed(shape_name).values()) == plain.castles[shape_name]
+            assert profiler.histograms[shape_name] == {hits: list(plain.wave_hits[shape_name]).count(hits)
+                                                       for hits in set(plain.wave_hits[shape_name])}
+        #self times never count a second twice
+        breakdown = profiler.phase_breakdown()
+        assert 0 < sum(breakdown.values()) <= profiler.wall_time()
+        assert set(breakdown) <= set(profiling.PHASES) | {"loop"}
+
+def test_wave_hits_land_in_their_buckets():
+    profiler = profiling.Profiler()
+    profiler.histograms["cone"] = {0: 3, 1: 1, 4: 2, 5: 7, 199: 1, 200: 4, 1000: 1}
+    assert profiler.bucketed("cone") == {"0": 3, "1": 1, "2-4": 2, "5-9": 7, "10-24": 0, "25-49": 0, "50-99": 0,
+                                         "100-199": 1, "200+": 5}
+    assert profiler.bucketed("cube") == dict.fromkeys(profiler.bucketed("cone"), 0)
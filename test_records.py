@@ -0,0 +1,37 @@
+import pytest
+import castle_test as ct
+import outcomes
+import records
+
+#Checks that the packed run records hold the same castles as the old (wave_hits, shape, wave) rows
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 4, "INC": 4} #sweep settings small enough to run shape_loop in a moment
+
+
+def test_rows_build_the_same_castles_again():
+    old_settings = ct.configure(**TINY)
+    try:
+        for shape_name in ct.shape_list:
+            results = ct.shape_loop(shape_name, outcomes.OutcomeCounts())
+            points = list(ct.sweep_points(shape_name))
+            assert len(results) == len(points)
+            for (k, (i, h, d, dist)) in enumerate(points):
+                (wave_hits, shape, w) = results[k]
+                built = ct.build_shape(shape_name, i)
+                assert (shape.height, shape.base_radius) == (built.height, built.base_radius)
+                assert str(w) == str(ct.build_wave(h, d, dist))
+                assert ct.simulate_castle(shape, w, outcomes.OutcomeCounts()) == (wave_hits, results.cause(k))
+    finally:
+        ct.configure(**old_settings)
+
+def test_shapes_and_waves_are_slotted():
+    for shape in [ct.shape_with_height(shape_name, 0.4) for shape_name in ct.shape_list] + [ct.build_wave(1, 1, 1)]:
+        with pytest.raises(AttributeError):
+            shape.__dict__
+
+def test_packed_rows_take_less_memory():
+    assert records.bytes_per_castle("cone", True, 200) < records.bytes_per_castle("cone", False, 200) / 4
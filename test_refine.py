@@ -0,0 +1,42 @@
+import castle_test as ct
+import scenario
+import refine
+
+#Checks that the refined survive/fail map only prunes corners the simulation agrees with
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+BIG_WAVES = {"WAVE_MULTIPLIER": 1.8} #waves big enough to knock some castles over on the first hit
+DIMENSIONS = ["shape_height", "wave_height", "break_depth"]
+MAX_DEPTH = 3
+
+
+def test_pruned_corners_match_the_simulation():
+    old = scenario.Scenario("big waves", **BIG_WAVES).apply()
+    try:
+        for shape_name in ("pyramid", "cone"):
+            pruned = refine.refine(shape_name, DIMENSIONS, MAX_DEPTH, engine="fast")
+            assert len(pruned.implied) > 0 and len(pruned.boundary_cells()) > 0
+            assert refine.check_pruning(pruned, "fast") == []
+            everything = refine.refine(shape_name, DIMENSIONS, MAX_DEPTH, engine="fast", prune=False)
+            assert everything.points == pruned.points and everything.leaves == pruned.leaves
+            assert pruned.simulated() + len(pruned.implied) == everything.simulated()
+    finally:
+        old.apply()
+
+def test_only_boundary_cells_are_split():
+    refined = refine.refine("cone", DIMENSIONS, MAX_DEPTH, engine="fast")
+    assert 0 < refined.simulated() <= refined.full_grid_size()
+    for (low, size) in refined.leaves:
+        if size > 1:
+            assert refine.corners_agree(refined, low, size)
+    for (low, size) in refined.boundary_cells():
+        assert size == 1 and not refine.corners_agree(refined, low, size)
+    #the corners are the castles simulate_castle gives at those values
+    for coordinate in list(refined.points)[:40]:
+        values = refined.values(coordinate)
+        shape = ct.shape_with_height("cone", values["shape_height"])
+        w = ct.waves.Wave(values["wave_height"], values["break_depth"], values["distance"])
+        assert ct.simulate_castle(shape, w, ct.outcomes.OutcomeCounts()) == refined.points[coordinate]
@@ -0,0 +1,59 @@
+import sweep
+import result_cache
+import scenario
+
+#Checks that castles handed back by the result cache are the ones a fresh sweep simulates
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+#runs the tiny sweep with the given sweep.run_sweep options
+def tiny_sweep(**options):
+    return sweep.run_sweep(R=TINY["R"], INC=TINY["INC"], **options)
+
+
+def test_repeated_sweep_comes_from_the_cache(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "outcomes.sqlite"))
+    try:
+        first = tiny_sweep(shape_names="cone", engine="fast", cache=cache)
+        castles = first.castles["cone"]
+        assert (cache.hits, cache.misses) == (0, castles)
+        again = tiny_sweep(shape_names="cone", engine="fast", cache=cache)
+        assert (cache.hits, cache.misses) == (castles, castles)
+        assert castles_of(again) == castles_of(first)
+    finally:
+        totals = cache.close()
+    assert totals == {"hits": castles, "misses": castles, "evicted": 0}
+
+def test_cache_matches_after_rain_change(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "outcomes.sqlite"))
+    try:
+        tiny_sweep(engine="fast", cache=cache)
+        old = scenario.Scenario("storm", RAIN_MULTIPLIER=40.0).apply()
+        try:
+            fresh = castles_of(tiny_sweep(engine="fast"))
+            cached = castles_of(tiny_sweep(engine="fast", cache=cache))
+        finally:
+            old.apply()
+        assert cache.rain_hits > 0 #castles that fell to the rain were worked out again, not simulated
+        assert cached == fresh
+    finally:
+        cache.close()
+
+def test_least_recently_used_outcomes_are_evicted(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "outcomes.sqlite"), max_entries=40)
+    try:
+        result = tiny_sweep(shape_names="cone", engine="fast", chunk_size=20, cache=cache)
+        assert len(cache) <= 40
+        assert cache.evicted == result.castles["cone"] - len(cache)
+    finally:
+        cache.close()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import outcomes
+import sweep
+import results_store
+
+#Checks that results store queries give the same rows as filtering the sweep by hand
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 4, "INC": 5} #sweep settings small enough to store in a moment
+
+
+#returns (store, columns of every castle of the sweep it holds) for a tiny sweep in tmp_path
+def stored_sweep(tmp_path) -> tuple:
+    result = sweep.run_sweep(engine="fast", **TINY)
+    store = results_store.ResultsStore(str(tmp_path / "store"))
+    store.append_sweep(result)
+    runs = [results_store.columns_from_records(run) for run in results_store.records_from_sweep(result)]
+    columns = {name: np.concatenate([run[name] for run in runs]) for name in results_store.COLUMNS}
+    return (store, columns)
+
+
+def test_query_matches_filtering_by_hand(tmp_path):
+    (store, columns) = stored_sweep(tmp_path)
+    assert len(store) == len(columns["wave_hits"]) and len(store.shards()) == 4
+    everything = store.query()
+    for name in results_store.COLUMNS:
+        np.testing.assert_array_equal(everything[name], columns[name])
+    low = float(np.median(columns["height"]))
+    mask = (columns["shape"] == outcomes.SHAPES.index("cone")) & \
+           (columns["cause"] == outcomes.CAUSES.index("erosion")) & (columns["height"] >= low)
+    rows = store.query(shape="cone", cause="erosion", columns=["wave_hits", "height"], height=(low, None))
+    np.testing.assert_array_equal(rows["wave_hits"], columns["wave_hits"][mask])
+    cubes_and_cones = np.isin(columns["shape"], [outcomes.SHAPES.index("cube"), outcomes.SHAPES.index("cone")])
+    assert store.count(shape=["cube", "cone"]) == np.count_nonzero(cubes_and_cones)
+
+def test_shards_out_of_range_are_skipped(tmp_path):
+    (store, columns) = stored_sweep(tmp_path)
+    metas = store.metas()
+    tallest = max(meta["max"]["height"] for meta in metas)
+    assert not any(results_store.shard_might_match(meta, {"height": (tallest + 1, None)}) for meta in metas)
+    assert store.count(height=(tallest + 1, None)) == 0
+    assert sum(results_store.shard_might_match(meta, {"shape": [0]}) for meta in metas) == 1
+
+def test_bad_columns_are_refused(tmp_path):
+    store = results_store.ResultsStore(str(tmp_path / "store"))
+    with pytest.raises(ValueError):
+        store.query(colour=(1, 2))
+    with pytest.raises(ValueError):
+        store.append_columns({"wave_hits": [1, 2]})
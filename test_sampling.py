@@ -0,0 +1,40 @@
+import random
+import pytest
+import sampling
+
+#Checks the sampling designs and when a sampled shape stops
+#run with `python -m pytest -q` from this directory
+
+
+def test_latin_hypercube_has_one_point_per_stratum():
+    n = 16
+    points = sampling.latin_hypercube(n, 4, random.Random(1))
+    for dim in range(4):
+        assert sorted(int(point[dim] * n) for point in points) == list(range(n))
+
+def test_halton_points_are_the_radical_inverses():
+    assert [sampling.radical_inverse(k, 2) for k in range(1, 5)] == [0.5, 0.25, 0.75, 0.125]
+    assert [sampling.radical_inverse(k, 3) for k in range(1, 4)] == [1/3, 2/3, 1/9]
+    for point in sampling.shifted_halton(32, 4, random.Random(2)):
+        assert all(0 <= u < 1 for u in point)
+
+def test_sampling_stops_at_max_samples_or_tolerance():
+    #a tolerance nothing reaches runs every castle it is allowed to, in whole batches
+    stuck = sampling.sample_shape("cone", "lhs", tolerance=1e-9, batch_size=16, max_samples=70, seed=3)
+    assert stuck.samples() == 64 and not stuck.converged
+    loose = sampling.sample_shape("cone", "halton", tolerance=1000.0, batch_size=16, seed=3)
+    assert loose.converged and loose.samples() == 16 * sampling.MIN_BATCHES
+    assert loose.half_width <= 1000.0
+
+def test_engines_and_seeds_repeat():
+    options = {"method": "random", "tolerance": 1e-9, "batch_size": 8, "max_samples": 32, "seed": 5}
+    scalar = sampling.sample_shape("pyramid", engine="scalar", **options)
+    fast = sampling.sample_shape("pyramid", engine="fast", **options)
+    assert list(fast.wave_hits) == list(scalar.wave_hits)
+    assert fast.counts == scalar.counts
+
+def test_bad_options_are_refused():
+    with pytest.raises(ValueError):
+        sampling.sample_shape("cone", "sobol")
+    with pytest.raises(ValueError):
+        sampling.sample_shape("cone", batch_size=64, max_samples=10)
@@ -0,0 +1,61 @@
+import copy
+import castle_test as ct
+import sand_castle_shapes as shapes
+
+#Checks that the cached geometry of the shapes is always what working it out again would give
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+GEOMETRY_METHODS = ["get_eroding_surface_area", "get_cross_sectional_area", "get_top_vol", "get_eroded_vol",
+                    "get_normal_sand", "get_base_grains"]
+HITS = 40 #wave hits to erode each shape through
+
+
+#returns {method name: value} of the shape's derived geometry
+def geometry_of(shape) -> dict:
+    return {name: getattr(shape, name)() for name in GEOMETRY_METHODS}
+
+#returns the geometry of the shape worked out from scratch, leaving its cache empty
+def cold_geometry_of(shape) -> dict:
+    shape.clear_cache()
+    values = geometry_of(shape)
+    shape.clear_cache()
+    return values
+
+
+def test_cached_geometry_follows_erosion():
+    w = ct.waves.Wave(0.05, 0.065, 12.0)
+    for shape_name in ct.shape_list:
+        shape = ct.shape_with_height(shape_name, 0.45)
+        shape.set_base_height(w.wave_height)
+        for hit in range(HITS):
+            if shape.base_radius <= 0:
+                break
+            warm = geometry_of(shape)
+            assert geometry_of(shape) == warm #straight out of the cache
+            assert cold_geometry_of(shape) == warm
+            ct.erode_shape(shape, w)
+
+def test_same_base_height_keeps_the_cache():
+    shape = shapes.Cylinder(0.2, 0.5)
+    shape.set_base_height(0.05)
+    shape.get_top_vol()
+    shapes.reset_cache_stats()
+    shape.set_base_height(0.05)
+    shape.get_top_vol()
+    assert shapes.cache_stats == {"hits": 1, "misses": 0}
+    shape.set_base_height(0.06)
+    shape.get_top_vol()
+    assert shapes.cache_stats["misses"] == 2 #the top volume and the top area it is worked out from
+
+def test_copies_keep_their_own_cache():
+    shape = shapes.Pyramid(0.5, 0.45)
+    shape.set_base_height(0.05)
+    before = geometry_of(shape)
+    probe = copy.copy(shape)
+    probe.update_base_radius(shape.base_radius / 2)
+    probe.base_side_length = shape.base_side_length / 2
+    assert geometry_of(probe) != before
+    assert geometry_of(shape) == before
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+import castle_test as ct
+import sweep
+import sandcastle
+
+#Checks the sandcastle.py command line
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+def test_sweep_imports_stay_light():
+    code = "import sys, sandcastle, sweep; print('numpy' in sys.modules, 'matplotlib' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert output.split() == ["False", "False"]
+
+def test_sweep_command_prints_run_sweep(capsys):
+    old_settings = ct.sweep_settings()
+    result = sweep.run_sweep("cone", **TINY)
+    assert ct.sweep_settings() == old_settings #the knobs are only changed for the sweep
+    assert sandcastle.main(["sweep", "--shape", "cone", "--R", str(TINY["R"]), "--INC", str(TINY["INC"])]) == 0
+    output = capsys.readouterr().out
+    assert "Size of cone_array: " + str(result.castles["cone"]) in output
+    assert "Cone average: " + str(result.average_wave_hits("cone")) in output
+    assert str(result.counts) in output
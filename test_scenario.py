@@ -0,0 +1,61 @@
+import castle_test as ct
+import fast_forward
+import batch
+import scenario
+
+#Checks that a scenario's constants give the same castles as applying the scenario
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+#two scenarios that change the physics but not the sweep grid
+STORM = {"RAIN_MULTIPLIER": 40.0, "OVERSATURATED": 0.12}
+HEAVY = {"GRAVITY": 9.0, "SAND_DENSITY": 2300.0, "MU": 0.5, "WATER_DENSITY": 1100.0}
+WAVES = [(0.05, 0.065, 4.0), (0.055, 0.07, 12.0), (0.045, 0.06, 19.0)] #(height, depth, distance)
+HEIGHTS = [0.39, 0.45, 0.5] #castle heights
+
+
+#returns the castles of every shape, height and wave as (shape name, height, wave values)
+def castle_points() -> list:
+    return [(shape_name, height, values) for shape_name in ct.shape_list for height in HEIGHTS for values in WAVES]
+
+#returns the scalar, fast-forward and batch answers for every castle with the scenario applied
+def applied_answers(knobs: dict) -> list:
+    old = scenario.Scenario("applied", **knobs).apply()
+    try:
+        answers = list()
+        for (shape_name, height, values) in castle_points():
+            scalar = ct.simulate_castle(ct.shape_with_height(shape_name, height), ct.waves.Wave(*values),
+                                        ct.outcomes.OutcomeCounts())
+            fast = fast_forward.fast_forward(ct.shape_with_height(shape_name, height), ct.waves.Wave(*values))
+            castle_batch = batch.CastleBatch.from_castles([ct.shape_with_height(shape_name, height)],
+                                                          [ct.waves.Wave(*values)])
+            batch.run_batch(castle_batch)
+            answers.append((scalar, fast, (int(castle_batch.wave_hits[0]), castle_batch.cause_names()[0])))
+        return answers
+    finally:
+        old.apply()
+
+
+def test_default_constants_match_the_modules():
+    assert scenario.current().constants() == ct.current_constants()
+
+def test_interleaved_scenarios_match_applied():
+    expected = {"storm": applied_answers(STORM), "heavy": applied_answers(HEAVY)}
+    constants = {"storm": scenario.Scenario("storm", **STORM).constants(),
+                 "heavy": scenario.Scenario("heavy", **HEAVY).constants()}
+    assert expected["storm"] != expected["heavy"]
+    got = {"storm": list(), "heavy": list()}
+    #one castle of each scenario at a time, without applying either
+    for (shape_name, height, values) in castle_points():
+        for name in ("storm", "heavy"):
+            c = constants[name]
+            scalar = ct.simulate_castle(ct.shape_with_height(shape_name, height), c.wave(*values),
+                                        ct.outcomes.OutcomeCounts(), constants=c)
+            fast = fast_forward.fast_forward(ct.shape_with_height(shape_name, height), c.wave(*values), constants=c)
+            castle_batch = batch.CastleBatch.from_castles([ct.shape_with_height(shape_name, height)],
+                                                          [c.wave(*values)], c)
+            batch.run_batch(castle_batch)
+            got[name].append((scalar, fast, (int(castle_batch.wave_hits[0]), castle_batch.cause_names()[0])))
+    assert got == expected
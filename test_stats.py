@@ -0,0 +1,92 @@
+import math
+import random
+import pytest
+import stats
+import sweep
+
+#Checks that merged streaming stats match the stats of the whole stream
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+SEED = 7
+POINTS = 5000
+CHUNK = 700 #points per merged part; not a multiple of DIGEST_BUFFER, so some parts are still buffered
+QUANTILE_TOLERANCE = 0.02 #of the range of the points
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+#returns skewed, mostly small numbers like the wave hits of a sweep
+def points() -> list:
+    generator = random.Random(SEED)
+    return [generator.expovariate(0.05) for k in range(POINTS)]
+
+#returns the exact q quantile of sorted numbers, interpolating like numpy
+def exact_quantile(ordered: list, q: float) -> float:
+    position = q * (len(ordered) - 1)
+    k = int(position)
+    if k + 1 == len(ordered):
+        return ordered[k]
+    return ordered[k] + (ordered[k + 1] - ordered[k]) * (position - k)
+
+#returns (the stats of the whole stream, the stats of CHUNK-sized parts merged together)
+def whole_and_merged(make) -> tuple:
+    numbers = points()
+    whole = make()
+    for x in numbers:
+        whole.add(x)
+    merged = make()
+    for start in range(0, len(numbers), CHUNK):
+        part = make()
+        for x in numbers[start:start + CHUNK]:
+            part.add(x)
+        merged.merge(part)
+    return (whole, merged)
+
+
+def test_merged_running_stats_match():
+    (whole, merged) = whole_and_merged(stats.RunningStats)
+    numbers = points()
+    mean = sum(numbers) / len(numbers)
+    assert (merged.count, merged.minimum, merged.maximum) == (whole.count, whole.minimum, whole.maximum) == \
+        (len(numbers), min(numbers), max(numbers))
+    assert merged.mean == pytest.approx(whole.mean, rel=1e-12)
+    assert merged.mean == pytest.approx(mean, rel=1e-12)
+    variance = sum((x - mean) ** 2 for x in numbers) / (len(numbers) - 1)
+    assert merged.variance() == pytest.approx(whole.variance(), rel=1e-9)
+    assert merged.variance() == pytest.approx(variance, rel=1e-9)
+    #merging into or from an empty one changes nothing
+    assert stats.RunningStats().merge(whole).mean == whole.mean
+    assert whole.merge(stats.RunningStats()).count == len(numbers)
+
+def test_merged_digest_quantiles_match():
+    (whole, merged) = whole_and_merged(stats.TDigest)
+    ordered = sorted(points())
+    spread = ordered[-1] - ordered[0]
+    assert merged.weight == whole.weight == len(ordered)
+    assert len(merged) < len(ordered) / 10 #a bounded number of centroids, not every point
+    for q in [0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1]:
+        assert abs(merged.quantile(q) - whole.quantile(q)) <= QUANTILE_TOLERANCE * spread
+        assert abs(merged.quantile(q) - exact_quantile(ordered, q)) <= QUANTILE_TOLERANCE * spread
+    assert (merged.quantile(0), merged.quantile(1)) == (ordered[0], ordered[-1])
+    with pytest.raises(ValueError):
+        merged.quantile(1.5)
+    assert stats.TDigest().quantile(0.5) is None
+
+def test_merged_histograms_match():
+    (whole, merged) = whole_and_merged(lambda: stats.Histogram(0, 200))
+    assert merged.counts == whole.counts
+    assert sum(merged.counts) == POINTS
+    with pytest.raises(ValueError):
+        merged.merge(stats.Histogram(0, 100))
+
+def test_chunked_sweep_stats_match_its_castles():
+    result = sweep.run_sweep(engine="fast", chunk_size=7, **TINY)
+    for shape_name in result.shape_names():
+        hits = list(result.wave_hits[shape_name])
+        running = result.stats.shapes[shape_name].running
+        assert running.count == len(hits)
+        assert math.isclose(running.mean, sum(hits) / len(hits), rel_tol=1e-12)
+        assert (running.minimum, running.maximum) == (min(hits), max(hits))
+        assert result.stats.average_wave_hits(shape_name) == running.mean
@@ -0,0 +1,53 @@
+import castle_test as ct
+import outcomes
+import sweep
+
+#Checks that a sweep gives the same castles however its grid is cut up and run
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+TINY = {"R": 5, "INC": 5} #sweep settings small enough to run every engine in a few seconds
+
+
+#returns {shape name: (wave hits, causes)} of a SweepResult, for comparing sweeps
+def castles_of(result) -> dict:
+    return {shape_name: (list(result.wave_hits[shape_name]), bytes(result.causes[shape_name]))
+            for shape_name in result.shape_names()}
+
+
+def test_grid_points_follow_sweep_points():
+    old_settings = ct.configure(**TINY)
+    try:
+        for shape_name in ct.shape_list:
+            points = list(ct.sweep_points(shape_name))
+            assert sweep.grid_size(shape_name) == len(points)
+            assert [sweep.grid_point(shape_name, k) for k in range(len(points))] == points
+    finally:
+        ct.configure(**old_settings)
+
+def test_merged_counts_add_up():
+    (first, second) = (outcomes.OutcomeCounts(), outcomes.OutcomeCounts())
+    first.add("cone", "rain", 3)
+    second.add("cone", "rain", 2)
+    second.add("cube", "knockout")
+    merged = outcomes.merge_all([first, second])
+    assert merged.counts["rain"]["cone"] == 5 and merged.total("cube") == 1
+    assert merged == outcomes.merge_all([second, first])
+
+def test_parallel_sweep_matches_one_job():
+    one = sweep.run_sweep(engine="fast", jobs=1, **TINY)
+    parallel = sweep.run_sweep(engine="fast", jobs=2, chunk_size=7, **TINY)
+    assert castles_of(parallel) == castles_of(one)
+    assert parallel.counts == one.counts
+    #the same castles as counting them one by one with simulate_castle
+    counts = outcomes.OutcomeCounts()
+    old_settings = ct.configure(**TINY)
+    try:
+        for shape_name in ct.shape_list:
+            for (i, h, d, dist) in ct.sweep_points(shape_name):
+                ct.simulate_castle(ct.build_shape(shape_name, i), ct.build_wave(h, d, dist), counts)
+    finally:
+        ct.configure(**old_settings)
+    assert parallel.counts == counts
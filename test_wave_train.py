@@ -0,0 +1,52 @@
+import numpy as np
+import castle_test as ct
+import outcomes
+import buoy_data
+import wave_train
+
+#Checks that wave trains fast-forwarded a run at a time match stepping every wave
+#run with `python -m pytest -q` from this directory
+
+'''
+CONSTANTS for use in the file
+'''
+READINGS = 240 #four hours of buoy readings
+INTERVAL = 60 #seconds between readings, so a castle lasts through many of them
+HEIGHTS = [0.35, 0.5, 0.7] #castle heights
+
+
+#returns made-up BuoyData with a reading every INTERVAL and a few missing wave heights
+def buoy_series(seed: int = 4):
+    rng = np.random.default_rng(seed)
+    heights = rng.uniform(0.5, 2.0, READINGS)
+    heights[[5, 6, 40]] = np.nan
+    columns = buoy_data.empty_columns()
+    columns["time"] = 1546300800 + INTERVAL * np.arange(READINGS, dtype=np.int64)
+    columns["WVHT"] = heights
+    return buoy_data.BuoyData("made_up_station.txt", columns)
+
+
+def test_runs_cover_the_train():
+    data = buoy_series()
+    runs = list(wave_train.buoy_runs(data))
+    assert sum(count for (t, w, count) in runs) == READINGS * INTERVAL / ct.TIME_PER_WAVE
+    #a missing reading keeps the height before it
+    assert runs[5][1].wave_height == runs[4][1].wave_height
+    steps = [t for (t, w) in wave_train.iter_waves(runs[:2])]
+    assert steps[1] - steps[0] == ct.TIME_PER_WAVE and len(steps) == runs[0][2] + runs[1][2]
+
+def test_simulate_runs_matches_stepping_every_wave():
+    data = buoy_series()
+    causes = set()
+    #full size waves, and small ones that some castles outlast
+    for scale in (wave_train.beach_scale(data), wave_train.beach_scale(data) / 4):
+        for shape_name in ct.shape_list:
+            for height in HEIGHTS:
+                stepped = ct.simulate_wave_train(ct.shape_with_height(shape_name, height),
+                                                 wave_train.iter_waves(wave_train.buoy_runs(data, scale)),
+                                                 outcomes.OutcomeCounts())
+                fast = wave_train.simulate_runs(ct.shape_with_height(shape_name, height),
+                                                wave_train.buoy_runs(data, scale), outcomes.OutcomeCounts())
+                assert fast == stepped
+                causes.add(fast[1])
+    assert len(causes) > 2
@@ -0,0 +1,159 @@
+import os
+import math
+import castle_test as ct
+import wave as waves
+import fast_forward
+import buoy_data
+
+#Time-varying wave trains built from the NDBC buoy files
+#Instead of hitting a castle with one constant Wave, every buoy reading turns into a run of
+# identical waves (one every TIME_PER_WAVE seconds until the next reading), with the buoy's
+# WVHT scaled down to the beach.
+#Trains are generators, so a year of 5-second waves is never held in memory, and each run of
+# identical waves is pushed through fast_forward.advance instead of being stepped hit by hit.
+#The castle_test constants (TIME_PER_WAVE, INITIAL_SATURATION, START/END_DISTANCE) are read when
+# a train runs, not when this is imported, so an applied scenario.Scenario reaches the trains too.
+
+'''
+CONSTANTS for use in the file
+'''
+BREAK_DEPTH_RATIO = 1.3 #break depth / wave height, same as AVG_BREAK_DEPTH in castle_test.py
+MAX_GAP = 3 * 60 * 60 #seconds | a reading is never stretched over more than this when the buoy goes quiet
+BLOCK_ROWS = 4096 #buoy rows pulled out of the (memory-mapped) columns at a time
+
+
+#returns the meters the waves run past the castle when no distance is given: halfway between
+# castle_test.START_DISTANCE and END_DISTANCE
+def default_distance() -> float:
+    return (ct.START_DISTANCE + ct.END_DISTANCE) / 2
+
+#returns the continue_runs state of a new castle: (saturation, wave hits, end time, eroded away)
+def start_state() -> tuple:
+    return (ct.INITIAL_SATURATION, 0, None, False)
+
+#returns the height scale that turns the station's average WVHT into castle_test.AVG_WAVE_HEIGHT
+def beach_scale(data) -> float:
+    return ct.AVG_WAVE_HEIGHT / data.average("WVHT")
+
+#Turns buoy readings into runs of identical waves
+#yields (timestamp, Wave, count): count waves, the first at timestamp and then one every time_per_wave
+#Missing WVHT readings keep the last good height; start and end (epoch seconds) trim the train
+#last_interval is how long the very last reading lasts (default: the average reading interval)
+#distance defaults to default_distance() and time_per_wave to castle_test.TIME_PER_WAVE
+def buoy_runs(data, scale: float = None, distance: float = None, time_per_wave: float = None,
+              start: float = None, end: float = None, last_interval: float = None):
+    if scale is None:
+        scale = beach_scale(data)
+    if distance is None:
+        distance = default_distance()
+    if time_per_wave is None:
+        time_per_wave = ct.TIME_PER_WAVE
+    times = data["time"]
+    heights = data["WVHT"]
+    rows = len(times)
+    last_height = None
+    for block in range(0, rows, BLOCK_ROWS):
+        #one extra row so the last reading in the block knows when the next one comes
+        block_times = times[block:block + BLOCK_ROWS + 1].tolist()
+        block_heights = heights[block:block + BLOCK_ROWS].tolist()
+        for (k, height) in enumerate(block_heights):
+            t = block_times[k]
+            if not math.isnan(height):
+                last_height = height
+            if last_height is None:
+                continue
+            if k + 1 < len(block_times):
+                interval = block_times[k + 1] - t
+            elif last_interval is not None:
+                interval = last_interval
+            else:
+                interval = MAX_GAP if rows < 2 else (times[-1] - times[0]) / (rows - 1)
+            interval = min(interval, MAX_GAP)
+            #trim to [start, end)
+            if end is not None and t >= end:
+                return
+            first = t
+            last = t + interval
+            if start is not None:
+                first = max(first, start)
+            if end is not None:
+                last = min(last, end)
+            count = int(math.ceil((last - first) / time_per_wave)) if last > first else 0
+            if count <= 0:
+                continue
+            wave_height = last_height * scale
+            w = waves.Wave(wave_height, wave_height * BREAK_DEPTH_RATIO, distance)
+            yield (first, w, count)
+
+#Expands runs into one (timestamp, Wave) per wave, lazily
+def iter_waves(runs, time_per_wave: float = None):
+    if time_per_wave is None:
+        time_per_wave = ct.TIME_PER_WAVE
+    for (t, w, count) in runs:
+        for k in range(count):
+            yield (t + k * time_per_wave, w)
+
+#Hits the shape with a train of wave runs until it falls or the train runs out
+#gives the same answer as castle_test.simulate_wave_train(shape, iter_waves(runs)), but each run
+# of identical waves is fast-forwarded instead of stepped
+#returns (wave_hits, cause, timestamp) with the time the castle fell, or None if it never did
+def simulate_runs(shape, runs, counts = None, time_per_wave: float = None) -> tuple:
+    if counts is None:
+        counts = ct.outcome_counts
+    (state, outcome) = continue_runs(shape, runs, start_state(), time_per_wave)
+    if outcome is None:
+        outcome = end_outcome(state)
+    counts.add(shape.string_name(), outcome[1])
+    return outcome
+
+#Hits the shape with more wave runs, picking up from state (start_state() for a new castle)
+#returns (state, outcome): outcome is (wave_hits, cause, timestamp) if the castle fell during
+# the runs and None if it is still standing, in which case more runs can follow from state
+def continue_runs(shape, runs, state: tuple, time_per_wave: float = None) -> tuple:
+    if time_per_wave is None:
+        time_per_wave = ct.TIME_PER_WAVE
+    (saturation, wave_hits, end_time, eroded_away) = state
+    for (t, w, count) in runs:
+        if eroded_away:
+            #it falls when the next wave shows up
+            return ((saturation, wave_hits, end_time, eroded_away), (wave_hits, "erosion", t))
+        shape.set_base_height(w.wave_height)
+        (taken, cause, saturation) = fast_forward.advance(shape, w, count, saturation)
+        wave_hits = wave_hits + taken
+        end_time = t + count * time_per_wave
+        if cause is None:
+            continue
+        if cause == "erosion" and taken == count and count > 0:
+            eroded_away = True
+            continue
+        return ((saturation, wave_hits, end_time, eroded_away), (wave_hits, cause, t + taken * time_per_wave))
+    return ((saturation, wave_hits, end_time, eroded_away), None)
+
+#returns the outcome of a castle still standing when its runs ran out
+def end_outcome(state: tuple) -> tuple:
+    (saturation, wave_hits, end_time, eroded_away) = state
+    if eroded_away:
+        return (wave_hits, "erosion", end_time)
+    return (wave_hits, "did_not_fall", None)
+
+#Runs every castle against the same buoy wave train; each castle streams its own pass over
+# the buoy data, so memory stays the same however long the train is
+#train_options are passed on to buoy_runs
+#returns a list of (wave_hits, cause, timestamp), one per castle
+def evaluate_designs(castles, data, counts = None, **train_options) -> list:
+    if "scale" not in train_options or train_options["scale"] is None:
+        train_options["scale"] = beach_scale(data)
+    results = list()
+    for castle in castles:
+        results.append(simulate_runs(castle, buoy_runs(data, **train_options), counts))
+    return results
+
+#returns the file path for a station name (e.g. scripps_south_california) or a file path
+def station_path(station: str) -> str:
+    if station.endswith(".txt"):
+        return station
+    return os.path.join(buoy_data.OCEAN_DATA, station + ".txt")
+
+#returns the BuoyData for a station name (e.g. scripps_south_california) or a file path
+def load_station(station: str):
+    return buoy_data.load(station_path(station))